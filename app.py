@@ -1,208 +1,196 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file
-import io, openpyxl
+from flask import Flask, jsonify, render_template, request, redirect, send_file, url_for
+import click
+import hashlib
 import os
-import psycopg2
 import time
 
-app = Flask(__name__)
+from cache import cache_key, commit_and_invalidate, fresh_reads, query_cache, start_invalidation_listener
+from changelog import (ChangeLogPurged, change_log_compactor, change_log_head, compact_change_log, feed_limit,
+                       fetch_changes)
+from db import (DatabaseUnavailable, breaker, close_pool, config_watcher, db_connection, get_database_config,
+                get_pool, replicas, wrote_to_primary)
+from exports import (ITEM_EXPORT_HEADERS, ITEM_FEED_FIELDS, ROOM_EXPORT_HEADERS, ROOM_FEED_FIELDS,
+                     STREAM_MIMETYPES, items_export_query, items_feed_query, rooms_export_query,
+                     rooms_feed_query, send_xlsx, stream_response, stream_rows, write_xlsx)
+from imports import ImportFormatError, import_inventory, read_table
+from jobs import EXPORT_KINDS, JOB_FORMATS, ExportQueueFull, export_jobs, job_mimetype
+from queries import (AUTOCOMPLETE_LIMIT, ITEMS_PAGE_SELECT, ITEMS_SELECT, ROOMS_PAGE_SELECT,
+                     ROOMS_SELECT, ROOM_ITEMS_SELECT, Item, ItemRow, Room, RoomItem, RoomRow, approximate_count,
+                     autocomplete_inventory_numbers, build_item_filters, build_room_filters, bulk_item_scope,
+                     bulk_item_statement, fetch_dashboard, fetch_page, fetch_room_detail, fetch_table_versions,
+                     item_filter_values, page_size, room_filter_values, search_inventory, search_limit)
+import compression
+import fragments
+from fragments import fragment_cache
+import metrics
+from metrics import counter, gauge, phase, render_metrics
+from migrations import LATEST_VERSION, current_version, migrate, readiness
+from schema import rebuild_inventory_summary
 
-# Функция для получения DATABASE_URL
-def get_database_url():
-    # Сначала пробуем собрать URL из отдельных переменных (самый надежный способ)
-    pg_user = os.environ.get('PGUSER') or os.environ.get('POSTGRES_USER')
-    pg_password = os.environ.get('PGPASSWORD') or os.environ.get('POSTGRES_PASSWORD')
-    pg_host = os.environ.get('PGHOST')
-    pg_port = os.environ.get('PGPORT')
-    pg_database = os.environ.get('PGDATABASE') or os.environ.get('POSTGRES_DB')
-    
-    # Если все отдельные переменные есть, собираем URL вручную
-    if all([pg_user, pg_password, pg_host, pg_port, pg_database]):
-        database_url = f"postgresql://{pg_user}:{pg_password}@{pg_host}:{pg_port}/{pg_database}"
-        print(f"Using database URL from individual variables: postgresql://{pg_user}:***@{pg_host}:{pg_port}/{pg_database}")
-        return database_url
-    
-    # Если нет, пробуем DATABASE_PUBLIC_URL
-    database_url = os.environ.get('DATABASE_PUBLIC_URL')
-    
-    # Если нет PUBLIC_URL, пробуем обычный DATABASE_URL
-    if not database_url:
-        database_url = os.environ.get('DATABASE_URL')
-    
-    # Если все еще нет, пробуем другие возможные имена
-    if not database_url:
-        database_url = os.environ.get('POSTGRESQL_URL') or os.environ.get('POSTGRES_URL')
-    
-    if not database_url:
-        # Для отладки выведем все переменные среды связанные с БД
-        db_vars = {}
-        for key in os.environ.keys():
-            if any(db_word in key.upper() for db_word in ['DATABASE', 'POSTGRES', 'PG']):
-                value = os.environ[key]
-                if 'PASSWORD' in key.upper():
-                    value = '***HIDDEN***'
-                db_vars[key] = value
-        print("Available database environment variables:", db_vars)
-        raise Exception("No database connection string found in environment variables")
-    
-    # Исправляем URL для psycopg2
-    if database_url.startswith("postgres://"):
-        database_url = database_url.replace("postgres://", "postgresql://", 1)
-    
-    # Логируем без пароля для безопасности
-    safe_url = database_url
-    if '@' in database_url:
-        user_part = database_url.split('@')[0]
-        host_part = database_url.split('@')[1].split('/')[0]
-        safe_url = user_part.split(':')[0] + ':***@' + host_part
-    
-    print(f"Using database URL: {safe_url}")
-    return database_url
-
-# Функция для подключения к БД
-def get_db_connection():
-    database_url = get_database_url()
-    conn = psycopg2.connect(database_url)
-    return conn
-
-# --- Инициализация базы ---
-def init_db():
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        print("Creating tables...")
-        # Создаем таблицы
-        cur.execute('''CREATE TABLE IF NOT EXISTS rooms
-                     (id SERIAL PRIMARY KEY,
-                      name TEXT,
-                      number TEXT,
-                      floor TEXT,
-                      teacher TEXT,
-                      capacity INTEGER)''')
-        
-        cur.execute('''CREATE TABLE IF NOT EXISTS items
-                     (id SERIAL PRIMARY KEY,
-                      room_id INTEGER REFERENCES rooms(id),
-                      name TEXT,
-                      inventory_number TEXT,
-                      status TEXT)''')
-
-        conn.commit()
-        cur.close()
-        conn.close()
-        print("Database initialized successfully!")
-        return True
-        
-    except Exception as e:
-        print(f"Database initialization failed: {e}")
-        return False
-
-# Попытаемся инициализировать БД при старте
-print("Starting application...")
-print("Available environment variables:", [k for k in os.environ.keys() if any(db in k.upper() for db in ['DATABASE', 'POSTGRES', 'URL'])])
-
-# Пытаемся инициализировать БД с повторными попытками
-db_initialized = False
-for i in range(5):
-    print(f"Database initialization attempt {i+1}/5")
-    if init_db():
-        db_initialized = True
-        break
-    time.sleep(3)
-else:
-    print("Failed to initialize database after 5 attempts")
-
-# Декоратор для проверки доступности БД
+app = Flask(__name__)
+metrics.install(app)
+compression.install(app)
+fragments.install(app)
+
+
+# --- Запуск ---
+# Схема создается миграциями (`flask migrate`), а не при импорте модуля:
+# процесс сразу начинает принимать запросы, а готовность базы проверяется
+# в фоне (см. migrations.ReadinessProbe).
+# При импорте не открываются соединения и не запускаются потоки: с
+# preload_app модуль загружается в мастер-процессе gunicorn до fork, и все это
+# досталось бы рабочим процессам. Фоновые задачи запускает start_worker()
+# уже в рабочем процессе (см. gunicorn.conf.py). Приложение - сам модуль
+# (app выше), фабрики нет; log_startup() только пишет в журнал, с какими
+# переменными окружения процесс запущен.
+def log_startup():
+    print("Starting application...")
+    print("Available environment variables:", [k for k in os.environ.keys() if any(db in k.upper() for db in ['DATABASE', 'POSTGRES', 'URL'])])
+
+def start_worker():
+    readiness.start()
+    start_invalidation_listener()
+    change_log_compactor.start()
+    config_watcher.start()
+
+def stop_worker():
+    config_watcher.stop()
+    change_log_compactor.stop()
+    export_jobs.shutdown()
+    close_pool()
+
+# Декоратор для проверки доступности БД: пока схема не готова или выключатель
+# разомкнут, запрос сразу получает 503 без обращения к базе
 def check_db(f):
     def decorated_function(*args, **kwargs):
-        global db_initialized  # Переместили global в начало функции
-        if not db_initialized:
-            try:
-                # Пробуем переинициализировать
-                if init_db():
-                    db_initialized = True
-                else:
-                    return "База данных временно недоступна. Пожалуйста, попробуйте позже.", 503
-            except Exception as e:
-                return f"Ошибка подключения к базе данных: {str(e)}", 503
+        if not readiness.ready:
+            # Если процесс запущен без start_worker(), проверка стартует здесь
+            readiness.start()
+            return "База данных временно недоступна. Пожалуйста, попробуйте позже.", 503
+        try:
+            breaker.before_call()
+        except DatabaseUnavailable:
+            retry_after = max(1, round(breaker.retry_after()))
+            return ("База данных временно недоступна. Пожалуйста, попробуйте позже.", 503,
+                    {"Retry-After": str(retry_after)})
         return f(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+# Подписка на сброс кэша из других процессов (если включена QUERY_CACHE_NOTIFY)
+@app.before_request
+def ensure_cache_listener():
+    start_invalidation_listener()
+
+# --- Чтение своих записей ---
+# Реплика может еще не получить только что записанное, а кэш запросов другого
+# рабочего процесса - еще не получить NOTIFY о сбросе. После записи клиент
+# получает cookie на REPLICA_PIN_SECONDS, и его чтения (в том числе страница
+# после redirect) идут на основную базу мимо кэша.
+PRIMARY_PIN_COOKIE = "read_primary"
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 10))
+
+def read_from_replica():
+    return bool(replicas.replicas) and PRIMARY_PIN_COOKIE not in request.cookies
+
+@app.before_request
+def reset_write_marker():
+    wrote_to_primary.set(False)
+    fresh_reads.set(PRIMARY_PIN_COOKIE in request.cookies)
+
+@app.after_request
+def pin_primary_after_write(response):
+    if wrote_to_primary.get():
+        response.set_cookie(PRIMARY_PIN_COOKIE, "1", max_age=REPLICA_PIN_SECONDS, httponly=True, samesite="Lax")
+    return response
+
+@app.cli.command("migrate")
+@click.option("--target", type=int, default=LATEST_VERSION, show_default=True,
+              help="применить миграции до этой версии")
+def migrate_command(target):
+    """Применение недостающих миграций схемы."""
+    with db_connection() as conn:
+        applied = migrate(conn, target)
+        cur = conn.cursor()
+        version = current_version(cur)
+        cur.close()
+    if applied:
+        print(f"Applied migrations: {', '.join(map(str, applied))}; schema version {version}")
+    else:
+        print(f"Schema is up to date (version {version})")
+
+@app.cli.command("compress-static")
+def compress_static_command():
+    """Сжатые копии (.gz, .br, .zst) файлов static/ для отдачи без сжатия на лету."""
+    written = compression.compress_static(app.static_folder)
+    print(f"Precompressed {len(written)} file(s) with {', '.join(compression.ENCODINGS)}")
+
 # --- Главная страница ---
 @app.route("/")
 @check_db
 def home():
-    return render_template("home.html")
+    def load():
+        with db_connection() as conn:
+            cur = conn.cursor()
+            dashboard = fetch_dashboard(cur)
+            cur.close()
+        return dashboard
+
+    try:
+        dashboard = query_cache.get_or_load(("dashboard",), ("rooms", "items"), load)
+        return render_template("home.html", dashboard=dashboard)
+    except Exception as e:
+        return f"Ошибка базы данных: {str(e)}", 500
+
+# --- Поиск по кабинетам и инвентарю ---
+@app.route("/search")
+@check_db
+def search():
+    q = request.args.get("q", "").strip()
+    limit = search_limit(request.args)
+
+    def load():
+        with db_connection(replica=read_from_replica()) as conn:
+            cur = conn.cursor()
+            results = search_inventory(cur, q, limit)
+            cur.close()
+        return results
+
+    try:
+        results = query_cache.get_or_load(cache_key("search", {"q": q, "limit": limit}), ("rooms", "items"), load)
+        return render_template("search.html", q=q, results=results)
+    except Exception as e:
+        return f"Ошибка базы данных: {str(e)}", 500
 
 # --- Список кабинетов ---
 @app.route("/rooms")
 @check_db
 def rooms():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        values = room_filter_values(request.args)
+        filters, params = build_room_filters(values)
+
+        def load():
+            with db_connection(replica=read_from_replica()) as conn:
+                cur = conn.cursor()
+                page = fetch_page(cur, ROOMS_PAGE_SELECT, filters, params,
+                                  sort_sql="COALESCE(rooms.number, '')", id_sql="rooms.id",
+                                  row_key=lambda room: (room.number or "", room.id),
+                                  per_page=page_size(request.args),
+                                  after=request.args.get("after"),
+                                  before=request.args.get("before"),
+                                  record=RoomRow)
+                total = None
+                if request.args.get("count"):
+                    total = approximate_count(cur, ROOMS_SELECT, filters, params)
+                cur.close()
+            return page.rows, page, total
+
+        rooms, page, total = query_cache.get_or_load(cache_key("rooms", request.args), ("rooms",), load)
+
+        return render_template("rooms.html", rooms=rooms, page=page, total=total,
+                               filter_values=values, **values)
 
-        filters = []
-        params = []
-
-        name = request.args.get("name")
-        number = request.args.get("number")
-        floor = request.args.get("floor")
-        teacher = request.args.get("teacher")
-        capacity_min = request.args.get("capacity_min")
-        capacity_max = request.args.get("capacity_max")
-
-        if name:
-            filters.append("name ILIKE %s")
-            params.append(f"%{name}%")
-        if number:
-            filters.append("number ILIKE %s")
-            params.append(f"%{number}%")
-        if floor:
-            filters.append("floor ILIKE %s")
-            params.append(f"%{floor}%")
-        if teacher:
-            filters.append("teacher ILIKE %s")
-            params.append(f"%{teacher}%")
-        if capacity_min:
-            filters.append("capacity >= %s")
-            params.append(capacity_min)
-        if capacity_max:
-            filters.append("capacity <= %s")
-            params.append(capacity_max)
-
-        query = "SELECT * FROM rooms"
-        if filters:
-            query += " WHERE " + " AND ".join(filters)
-        query += " ORDER BY number"
-
-        cur.execute(query, params)
-        rooms_data = cur.fetchall()
-
-        # Преобразуем в список словарей для удобства
-        rooms = []
-        for room in rooms_data:
-            rooms.append({
-                'id': room[0],
-                'name': room[1],
-                'number': room[2],
-                'floor': room[3],
-                'teacher': room[4],
-                'capacity': room[5]
-            })
-
-        cur.close()
-        conn.close()
-        
-        return render_template("rooms.html", rooms=rooms,
-                               name=name or "",
-                               number=number or "",
-                               floor=floor or "",
-                               teacher=teacher or "",
-                               capacity_min=capacity_min or "",
-                               capacity_max=capacity_max or "")
-                               
     except Exception as e:
         return f"Ошибка базы данных: {str(e)}", 500
 
@@ -218,15 +206,14 @@ def add_room():
             teacher = request.form["teacher"]
             capacity = request.form["capacity"]
 
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO rooms (name, number, floor, teacher, capacity) VALUES (%s, %s, %s, %s, %s)",
-                (name, number, floor, teacher, capacity)
-            )
-            conn.commit()
-            cur.close()
-            conn.close()
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute(
+                    "INSERT INTO rooms (name, number, floor, teacher, capacity) VALUES (%s, %s, %s, %s, %s)",
+                    (name, number, floor, teacher, capacity)
+                )
+                commit_and_invalidate(conn, cur, "rooms")
+                cur.close()
             return redirect(url_for("rooms"))
         except Exception as e:
             return f"Ошибка при добавлении кабинета: {str(e)}", 500
@@ -236,41 +223,24 @@ def add_room():
 @app.route("/rooms/<int:room_id>")
 @check_db
 def room_detail(room_id):
+    def load():
+        with db_connection(replica=read_from_replica()) as conn:
+            cur = conn.cursor()
+            detail = fetch_room_detail(cur, room_id, per_page=page_size(request.args),
+                                       after=request.args.get("after"),
+                                       before=request.args.get("before"))
+            cur.close()
+        return detail
+
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("SELECT * FROM rooms WHERE id=%s", (room_id,))
-        room_data = cur.fetchone()
-        cur.execute("SELECT * FROM items WHERE room_id=%s", (room_id,))
-        items_data = cur.fetchall()
-        
-        cur.close()
-        conn.close()
-        
-        if room_data:
-            room = {
-                'id': room_data[0],
-                'name': room_data[1],
-                'number': room_data[2],
-                'floor': room_data[3],
-                'teacher': room_data[4],
-                'capacity': room_data[5]
-            }
-            
-            items = []
-            for item in items_data:
-                items.append({
-                    'id': item[0],
-                    'room_id': item[1],
-                    'name': item[2],
-                    'inventory_number': item[3],
-                    'status': item[4]
-                })
-            
-            return render_template("room_detail.html", room=room, items=items)
-        else:
+        detail = query_cache.get_or_load(cache_key("room", request.args, extra=(room_id,)),
+                                         (f"room:{room_id}", "room"), load)
+        if detail is None:
             return "Кабинет не найден", 404
+
+        room, page, status_counts, room_version = detail
+        return render_template("room_detail.html", room=room, items=page.rows, page=page,
+                               status_counts=status_counts, room_version=room_version)
     except Exception as e:
         return f"Ошибка базы данных: {str(e)}", 500
 
@@ -279,13 +249,16 @@ def room_detail(room_id):
 @check_db
 def delete_room(room_id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM items WHERE room_id=%s", (room_id,))
-        cur.execute("DELETE FROM rooms WHERE id=%s", (room_id,))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            # Строка кабинета блокируется первой, как при его изменении:
+            # иначе удаление и правка кабинета ждали бы друг друга по кругу
+            # (предметы и счетчик кабинета против строки кабинета)
+            cur.execute("SELECT 1 FROM rooms WHERE id=%s FOR UPDATE", (room_id,))
+            cur.execute("DELETE FROM items WHERE room_id=%s", (room_id,))
+            cur.execute("DELETE FROM rooms WHERE id=%s", (room_id,))
+            commit_and_invalidate(conn, cur, "rooms", "items", f"room:{room_id}")
+            cur.close()
         return redirect(url_for("rooms"))
     except Exception as e:
         return f"Ошибка при удалении: {str(e)}", 500
@@ -300,13 +273,12 @@ def add_item(room_id):
             inventory_number = request.form["inventory_number"]
             status = request.form["status"]
 
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("INSERT INTO items (room_id, name, inventory_number, status) VALUES (%s, %s, %s, %s)",
-                      (room_id, name, inventory_number, status))
-            conn.commit()
-            cur.close()
-            conn.close()
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute("INSERT INTO items (room_id, name, inventory_number, status) VALUES (%s, %s, %s, %s)",
+                          (room_id, name, inventory_number, status))
+                commit_and_invalidate(conn, cur, "items", f"room:{room_id}")
+                cur.close()
             return redirect(url_for("room_detail", room_id=room_id))
         except Exception as e:
             return f"Ошибка при добавлении: {str(e)}", 500
@@ -316,12 +288,14 @@ def add_item(room_id):
 @check_db
 def delete_item(item_id, room_id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM items WHERE id=%s", (item_id,))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            # Кэш сбрасывается для фактического кабинета предмета, а не из URL
+            cur.execute("DELETE FROM items WHERE id=%s RETURNING room_id", (item_id,))
+            deleted = cur.fetchone()
+            tags = ("items", f"room:{deleted[0]}") if deleted else ()
+            commit_and_invalidate(conn, cur, *tags)
+            cur.close()
         return redirect(url_for("room_detail", room_id=room_id))
     except Exception as e:
         return f"Ошибка при удалении: {str(e)}", 500
@@ -330,39 +304,29 @@ def delete_item(item_id, room_id):
 @check_db
 def edit_room(room_id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        if request.method == "POST":
-            name = request.form["name"]
-            number = request.form["number"]
-            floor = request.form["floor"]
-            teacher = request.form["teacher"]
-            capacity = request.form["capacity"]
+        with db_connection() as conn:
+            cur = conn.cursor()
 
-            cur.execute("""UPDATE rooms 
-                         SET name=%s, number=%s, floor=%s, teacher=%s, capacity=%s 
-                         WHERE id=%s""",
-                      (name, number, floor, teacher, capacity, room_id))
-            conn.commit()
+            if request.method == "POST":
+                name = request.form["name"]
+                number = request.form["number"]
+                floor = request.form["floor"]
+                teacher = request.form["teacher"]
+                capacity = request.form["capacity"]
+
+                cur.execute("""UPDATE rooms
+                             SET name=%s, number=%s, floor=%s, teacher=%s, capacity=%s
+                             WHERE id=%s""",
+                          (name, number, floor, teacher, capacity, room_id))
+                # Название и номер кабинета видны и в общем списке инвентаря
+                commit_and_invalidate(conn, cur, "rooms", "items", f"room:{room_id}")
+                cur.close()
+                return redirect(url_for("rooms"))
+
+            room = cur.run(ROOMS_SELECT + " WHERE rooms.id = %s", (room_id,), record=Room).fetchone()
             cur.close()
-            conn.close()
-            return redirect(url_for("rooms"))
 
-        cur.execute("SELECT * FROM rooms WHERE id=%s", (room_id,))
-        room_data = cur.fetchone()
-        cur.close()
-        conn.close()
-        
-        if room_data:
-            room = {
-                'id': room_data[0],
-                'name': room_data[1],
-                'number': room_data[2],
-                'floor': room_data[3],
-                'teacher': room_data[4],
-                'capacity': room_data[5]
-            }
+        if room:
             return render_template("edit_room.html", room=room)
         else:
             return "Кабинет не найден", 404
@@ -373,67 +337,312 @@ def edit_room(room_id):
 @check_db
 def all_items():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        values = item_filter_values(request.args)
+        filters, params = build_item_filters(values)
+
+        def load():
+            with db_connection(replica=read_from_replica()) as conn:
+                cur = conn.cursor()
+                page = fetch_page(cur, ITEMS_PAGE_SELECT, filters, params,
+                                  sort_sql="COALESCE(rooms.number, '')", id_sql="items.id",
+                                  row_key=lambda item: (item.room_number or "", item.id),
+                                  per_page=page_size(request.args),
+                                  after=request.args.get("after"),
+                                  before=request.args.get("before"),
+                                  record=ItemRow)
+                total = None
+                if request.args.get("count"):
+                    total = approximate_count(cur, ITEMS_SELECT, filters, params)
+                cur.close()
+            return page.rows, page, total
+
+        items, page, total = query_cache.get_or_load(cache_key("items", request.args), ("items",), load)
+
+        return render_template("all_items.html", items=items, page=page, total=total,
+                               filter_values=values, **values)
+    except Exception as e:
+        return f"Ошибка базы данных: {str(e)}", 500
+
+# --- Массовые операции над инвентарем ---
+# Форма со страниц /items и кабинета или JSON:
+# {"action": "status"|"move"|"delete", "ids": [...] | "filters": {...} | "source_room_id": N,
+#  "status": "...", "room_id": N}
+@app.route("/items/bulk", methods=["POST"])
+@check_db
+def bulk_items():
+    data = request.get_json(silent=True) if request.is_json else None
+    try:
+        if data is not None:
+            action = data.get("action")
+            ids = data.get("ids")
+            values = item_filter_values(data.get("filters") or {})
+            source_room_id = data.get("source_room_id")
+            status = data.get("status")
+            target_room_id = data.get("room_id")
+        else:
+            action = request.form.get("action")
+            scope = request.form.get("scope", "ids")
+            ids = request.form.getlist("ids") if scope == "ids" else None
+            values = item_filter_values({field[len("filter_"):]: value for field, value in request.form.items()
+                                         if field.startswith("filter_")})
+            source_room_id = request.form.get("source_room_id") if scope == "room" else None
+            status = request.form.get("status")
+            target_room_id = request.form.get("room_id")
+
+        if ids is not None:
+            ids = [int(item_id) for item_id in ids]
+        if source_room_id is not None:
+            source_room_id = int(source_room_id)
+        if action == "move":
+            target_room_id = int(target_room_id)
+
+        scope_sql, scope_params = bulk_item_scope(ids=ids, values=values, room_id=source_room_id)
+        query, params = bulk_item_statement(action, scope_sql, scope_params,
+                                            status=status, room_id=target_room_id)
+    except (TypeError, ValueError) as e:
+        if data is not None:
+            return {"error": str(e)}, 400
+        return f"Некорректный запрос: {str(e)}", 400
 
-        filters = []
-        params = []
-
-        name = request.args.get("name")
-        inventory_number = request.args.get("inventory_number")
-        status = request.args.get("status")
-        room_name = request.args.get("room_name")
-        room_number = request.args.get("room_number")
-
-        if name:
-            filters.append("items.name ILIKE %s")
-            params.append(f"%{name}%")
-        if inventory_number:
-            filters.append("items.inventory_number ILIKE %s")
-            params.append(f"%{inventory_number}%")
-        if status:
-            filters.append("items.status = %s")
-            params.append(status)
-        if room_name:
-            filters.append("rooms.name ILIKE %s")
-            params.append(f"%{room_name}%")
-        if room_number:
-            filters.append("rooms.number ILIKE %s")
-            params.append(f"%{room_number}%")
-
-        query = """SELECT items.id, items.name, items.inventory_number, items.status,
-                          rooms.name, rooms.number, items.room_id
-                   FROM items
-                   JOIN rooms ON items.room_id = rooms.id"""
-        if filters:
-            query += " WHERE " + " AND ".join(filters)
-        query += " ORDER BY rooms.number"
-
-        cur.execute(query, params)
-        items_data = cur.fetchall()
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            affected = cur.rowcount
+            # Набор затронутых кабинетов заранее неизвестен: сбрасываем все страницы кабинетов
+            commit_and_invalidate(conn, cur, "items", "room")
+            cur.close()
+    except Exception as e:
+        if data is not None:
+            return {"error": str(e)}, 500
+        return f"Ошибка при массовой операции: {str(e)}", 500
+
+    if data is not None:
+        return {"action": action, "affected": affected}
+    next_url = request.form.get("next") or url_for("all_items")
+    if not next_url.startswith("/") or next_url.startswith("//"):
+        next_url = url_for("all_items")
+    separator = "&" if "?" in next_url else "?"
+    return redirect(f"{next_url}{separator}bulk_action={action}&affected={affected}")
+
+# --- Массовый импорт инвентаря из XLSX/CSV ---
+@app.route("/items/import", methods=["GET", "POST"])
+@check_db
+def import_items():
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            return render_template("import_items.html", error="Выберите файл для загрузки"), 400
+        try:
+            with db_connection() as conn:
+                result = import_inventory(conn, read_table(upload.stream, upload.filename))
+                with conn.cursor() as cur:
+                    commit_and_invalidate(conn, cur, "rooms", "items", "room")
+            return render_template("import_items.html", result=result)
+        except ImportFormatError as e:
+            return render_template("import_items.html", error=str(e)), 400
+        except Exception as e:
+            return f"Ошибка при импорте: {str(e)}", 500
+    return render_template("import_items.html")
+
+@app.cli.command("import-inventory")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def import_inventory_command(path):
+    """Импорт кабинетов и инвентаря из XLSX/CSV в формате экспорта."""
+    started = time.monotonic()
+    try:
+        with open(path, "rb") as fileobj, db_connection() as conn:
+            result = import_inventory(conn, read_table(fileobj, path))
+            with conn.cursor() as cur:
+                commit_and_invalidate(conn, cur, "rooms", "items", "room")
+    except ImportFormatError as e:
+        raise click.ClickException(str(e))
+    print(f"Rows: {result['rows']}, rooms created: {result['rooms_created']}, "
+          f"items created: {result['items_created']}, items updated: {result['items_updated']}, "
+          f"errors: {result['error_count']} ({time.monotonic() - started:.1f}s)")
+    for line, error in result["errors"]:
+        print(f"  line {line}: {error}")
+
+@app.cli.command("compact-changes")
+def compact_changes_command():
+    """Сжатие журнала изменений и удаление записей старше CHANGE_LOG_RETENTION."""
+    with db_connection() as conn:
+        result = compact_change_log(conn)
+    if result is None:
+        print("Change log compaction is already running in another process")
+    else:
+        print(f"Change log: {result['purged']} expired, {result['compacted']} superseded entries removed, "
+              f"{result['merged']} merged")
+
+@app.cli.command("rebuild-summary")
+def rebuild_summary_command():
+    """Пересчет сводки по кабинетам и статусам с нуля."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        rebuild_inventory_summary(cur)
+        commit_and_invalidate(conn, cur, "items")
         cur.close()
-        conn.close()
-
-        items = []
-        for item in items_data:
-            items.append({
-                'id': item[0],
-                'name': item[1],
-                'inventory_number': item[2],
-                'status': item[3],
-                'room_name': item[4],
-                'room_number': item[5],
-                'room_id': item[6]
-            })
-
-        return render_template("all_items.html", items=items,
-                               name=name or "",
-                               inventory_number=inventory_number or "",
-                               status=status or "",
-                               room_name=room_name or "",
-                               room_number=room_number or "")
+    print("Inventory summary rebuilt")
+
+# --- JSON API для киосков и сканеров ---
+# Ответы помечаются ETag и Last-Modified по версиям таблиц; если клиент
+# прислал актуальный ETag, отвечаем 304, не выполняя запрос списка.
+def conditional_json(tables, build):
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            versions = fetch_table_versions(cur, tables)
+            etag = hashlib.sha1(
+                "|".join([request.path, request.query_string.decode("latin-1")]
+                         + [f"{table}:{version}" for table, (version, _) in sorted(versions.items())]
+                         ).encode("utf-8")).hexdigest()
+            last_modified = max(updated_at for _, updated_at in versions.values()).replace(microsecond=0)
+
+            # Сжатый ответ несет слабый ETag (см. compression.py): сравнение слабое
+            not_modified = (request.if_none_match.contains_weak(etag) if request.if_none_match
+                            else request.if_modified_since is not None and request.if_modified_since >= last_modified)
+            if not_modified:
+                cur.close()
+                response = app.response_class(status=304)
+            else:
+                payload, status = build(cur)
+                cur.close()
+                response = jsonify(payload)
+                response.status_code = status
     except Exception as e:
-        return f"Ошибка базы данных: {str(e)}", 500
+        return jsonify({"error": str(e)}), 500
+
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+@app.route("/api/rooms")
+@check_db
+def api_rooms():
+    values = room_filter_values(request.args)
+    try:
+        filters, params = build_room_filters(values)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    def build(cur):
+        page = fetch_page(cur, ROOMS_SELECT, filters, params,
+                          sort_sql="COALESCE(rooms.number, '')", id_sql="rooms.id",
+                          row_key=lambda room: (room.number or "", room.id),
+                          per_page=page_size(request.args),
+                          after=request.args.get("after"),
+                          before=request.args.get("before"),
+                          record=Room)
+        return {
+            "rooms": [room._asdict() for room in page.rows],
+            "next_cursor": page.next_cursor,
+            "prev_cursor": page.prev_cursor,
+        }, 200
+
+    return conditional_json(("rooms",), build)
+
+@app.route("/api/rooms/<int:room_id>")
+@check_db
+def api_room_detail(room_id):
+    def build(cur):
+        # Предметы кабинета - страницами, как на странице кабинета (keyset по названию)
+        detail = fetch_room_detail(cur, room_id, per_page=page_size(request.args),
+                                   after=request.args.get("after"),
+                                   before=request.args.get("before"))
+        if detail is None:
+            return {"error": "Кабинет не найден"}, 404
+        room, page, _, _ = detail
+        payload = room._asdict()
+        payload["items"] = [item._asdict() for item in page.rows]
+        payload["next_cursor"] = page.next_cursor
+        payload["prev_cursor"] = page.prev_cursor
+        return payload, 200
+
+    return conditional_json(("rooms", "items"), build)
+
+@app.route("/api/items")
+@check_db
+def api_items():
+    values = item_filter_values(request.args)
+    try:
+        filters, params = build_item_filters(values)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    def build(cur):
+        page = fetch_page(cur, ITEMS_SELECT, filters, params,
+                          sort_sql="COALESCE(rooms.number, '')", id_sql="items.id",
+                          row_key=lambda item: (item.room_number or "", item.id),
+                          per_page=page_size(request.args),
+                          after=request.args.get("after"),
+                          before=request.args.get("before"),
+                          record=Item)
+        return {
+            "items": [item._asdict() for item in page.rows],
+            "next_cursor": page.next_cursor,
+            "prev_cursor": page.prev_cursor,
+        }, 200
+
+    return conditional_json(("rooms", "items"), build)
+
+@app.route("/api/search")
+@check_db
+def api_search():
+    q = request.args.get("q", "").strip()
+    limit = search_limit(request.args)
+
+    def build(cur):
+        results = search_inventory(cur, q, limit)
+        return {
+            "rooms": [room._asdict() for room in results["rooms"]],
+            "items": [item._asdict() for item in results["items"]],
+            "truncated": results["truncated"],
+        }, 200
+
+    return conditional_json(("rooms", "items"), build)
+
+@app.route("/api/search/inventory-numbers")
+@check_db
+def api_inventory_number_suggestions():
+    # Подсказки для поля ввода: по началу инвентарного номера
+    prefix = request.args.get("prefix", "")
+    limit = search_limit(request.args, default=AUTOCOMPLETE_LIMIT)
+
+    def build(cur):
+        return {"suggestions": autocomplete_inventory_numbers(cur, prefix, limit)}, 200
+
+    return conditional_json(("items",), build)
+
+# --- Журнал изменений для синхронизации ---
+# GET /api/changes?since=<seq>&limit=<n> -> изменения после since по порядку и
+# next_since для следующего запроса (пока has_more, можно сразу продолжать).
+# Без since - только текущая позиция журнала: ее запоминают перед полной
+# выгрузкой и с нее начинают. 410 - записи после since уже удалены по сроку
+# хранения, нужна полная выгрузка. Подробнее - changelog.py.
+@app.route("/api/changes")
+@check_db
+def api_changes():
+    try:
+        since = int(request.args["since"]) if "since" in request.args else None
+    except ValueError:
+        return {"error": "since должен быть номером записи журнала"}, 400
+
+    try:
+        # Только основная база: граница журнала строится по ее блокировкам
+        with db_connection() as conn:
+            cur = conn.cursor()
+            if since is None:
+                head = change_log_head(cur)
+                payload = {"changes": [], "next_since": head, "has_more": False, "head": head}
+            else:
+                payload = fetch_changes(cur, since, feed_limit(request.args))
+            cur.close()
+    except ChangeLogPurged as e:
+        return {"error": str(e), "purged_through": e.purged_through}, 410
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return payload, 200, {"Cache-Control": "no-store"}
 
 # --- Страница статуса для отладки ---
 @app.route("/debug")
@@ -445,37 +654,91 @@ def debug():
                 env_vars[key] = '***HIDDEN***'
             else:
                 env_vars[key] = value
-    
+
+    try:
+        database_url_source = get_database_config().source
+    except Exception as e:
+        database_url_source = f"error: {e}"
+
     return {
-        "status": "running", 
+        "status": "running",
         "environment_variables": env_vars,
-        "database_initialized": db_initialized,
-        "database_url_exists": 'DATABASE_PUBLIC_URL' in os.environ or 'DATABASE_URL' in os.environ
+        "database_initialized": readiness.ready,
+        "readiness": readiness.stats(),
+        "schema_version": (readiness.result or {}).get("schema_version"),
+        "trigram_indexes": (readiness.result or {}).get("trigram_indexes", False),
+        "database_url_exists": 'DATABASE_PUBLIC_URL' in os.environ or 'DATABASE_URL' in os.environ,
+        "database_url_source": database_url_source,
+        "database_config": config_watcher.stats(),
+        "connection_pool": get_pool().stats(),
+        "circuit_breaker": breaker.stats(),
+        "query_cache": query_cache.stats(),
+        "fragment_cache": fragment_cache.stats(),
+        "export_jobs": export_jobs.stats(),
+        "change_log": change_log_compactor.stats(),
+        "replicas": replicas.stats()
     }
 
+# --- Метрики для Prometheus ---
+@app.route("/metrics")
+def metrics_endpoint():
+    pool = get_pool().stats()
+    cache = query_cache.stats()
+    fragments_stats = fragment_cache.stats()
+    jobs = export_jobs.stats()
+    extra = (
+        gauge("db_pool_size", "Открытых соединений в пуле", pool["size"])
+        + gauge("db_pool_in_use", "Занятых соединений пула", pool["in_use"])
+        + counter("db_pool_timeouts_total", "Ожиданий соединения, завершившихся таймаутом", pool["timeouts"])
+        + gauge("db_circuit_open", "1, если выключатель БД разомкнут", int(breaker.state != breaker.CLOSED))
+        + gauge("db_ready", "1, если схема проверена и база готова", int(readiness.ready))
+        + counter("db_replica_reads_total", "Чтений, выполненных на репликах",
+                  sum(replica.reads for replica in replicas.replicas))
+        + counter("db_replica_fallback_reads_total", "Чтений, ушедших на основную базу: нет подходящей реплики",
+                  replicas.primary_reads)
+        + counter("query_cache_hits_total", "Попаданий в кэш запросов", cache["hits"])
+        + counter("query_cache_misses_total", "Промахов кэша запросов", cache["misses"])
+        + counter("query_cache_evictions_total", "Вытеснений из кэша запросов", cache["evictions"])
+        + counter("fragment_cache_hits_total", "Строк таблиц, взятых из кэша фрагментов", fragments_stats["hits"])
+        + counter("fragment_cache_misses_total", "Фрагментов таблиц, отрисованных заново", fragments_stats["misses"])
+        + counter("fragment_cache_evictions_total", "Вытеснений из кэша фрагментов", fragments_stats["evictions"])
+        + gauge("fragment_cache_bytes", "Размер кэша фрагментов в байтах", fragments_stats["bytes"])
+        + gauge("export_jobs_queued", "Фоновых выгрузок в очереди процесса", jobs["queued"])
+        + gauge("export_jobs_running", "Фоновых выгрузок в работе", jobs["running"])
+        + counter("export_jobs_completed_total", "Завершенных фоновых выгрузок", jobs["completed"])
+        + counter("export_jobs_failed_total", "Неудачных фоновых выгрузок", jobs["failed"])
+        + counter("export_jobs_deduplicated_total", "Запросов, присоединенных к идущей выгрузке",
+                  jobs["deduplicated"])
+    )
+    return render_metrics(extra), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
 # --- Диагностика базы данных ---
 @app.route("/db-test")
 def db_test():
     try:
         # Пробуем подключиться к базе
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT version(), current_database(), current_user")
-        db_info = cur.fetchone()
-        cur.close()
-        conn.close()
-        
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT version(), current_database(), current_user")
+            db_info = cur.fetchone()
+            cur.close()
+
         return {
             "status": "SUCCESS",
             "postgres_version": db_info[0],
             "database_name": db_info[1],
             "current_user": db_info[2],
+            "connection_pool": get_pool().stats(),
+            "circuit_breaker": breaker.stats(),
+            "health": breaker.health(),
             "message": "База данных подключена успешно!"
         }
     except Exception as e:
         return {
             "status": "FAILED",
             "error": str(e),
+            "circuit_breaker": breaker.stats(),
+            "health": breaker.health(),
             "environment_variables": {
                 "PGHOST": os.environ.get('PGHOST'),
                 "PGPORT": os.environ.get('PGPORT'),
@@ -487,217 +750,141 @@ def db_test():
             }
         }
 
-# --- Экспорт кабинетов в Excel ---
+# --- Экспорт кабинетов в Excel (или потоком в CSV/NDJSON: ?format=csv|ndjson) ---
 @app.route("/export-rooms")
 @check_db
 def export_rooms():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # Фильтры те же, что и на странице списка
+        values = room_filter_values(request.args)
+        fmt = request.args.get("format", "xlsx")
+        if fmt in STREAM_MIMETYPES:
+            query, params = rooms_feed_query(values)
+            return stream_response(query, params, ROOM_FEED_FIELDS, fmt, "rooms_export",
+                                   replica=read_from_replica())
 
-        # Получаем параметры фильтрации из URL
-        name = request.args.get("name", "")
-        number = request.args.get("number", "")
-        floor = request.args.get("floor", "")
-        teacher = request.args.get("teacher", "")
-        capacity_min = request.args.get("capacity_min", "")
-        capacity_max = request.args.get("capacity_max", "")
-
-        # Строим запрос с фильтрами
-        filters = []
-        params = []
-
-        if name:
-            filters.append("name ILIKE %s")
-            params.append(f"%{name}%")
-        if number:
-            filters.append("number ILIKE %s")
-            params.append(f"%{number}%")
-        if floor:
-            filters.append("floor ILIKE %s")
-            params.append(f"%{floor}%")
-        if teacher:
-            filters.append("teacher ILIKE %s")
-            params.append(f"%{teacher}%")
-        if capacity_min:
-            filters.append("capacity >= %s")
-            params.append(int(capacity_min))
-        if capacity_max:
-            filters.append("capacity <= %s")
-            params.append(int(capacity_max))
-
-        query = "SELECT name, number, floor, teacher, capacity FROM rooms"
-        if filters:
-            query += " WHERE " + " AND ".join(filters)
-        query += " ORDER BY number"
-
-        cur.execute(query, params)
-        rooms_data = cur.fetchall()
-
-        # Создаем Excel файл
-        output = io.BytesIO()
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = "Кабинеты"
-
-        # Заголовки
-        headers = ['Название', 'Номер', 'Этаж', 'Преподаватель', 'Вместимость']
-        for col, header in enumerate(headers, 1):
-            sheet.cell(row=1, column=col, value=header)
-
-        # Данные
-        for row, room in enumerate(rooms_data, 2):
-            sheet.cell(row=row, column=1, value=room[0])  # name
-            sheet.cell(row=row, column=2, value=room[1])  # number
-            sheet.cell(row=row, column=3, value=room[2])  # floor
-            sheet.cell(row=row, column=4, value=room[3])  # teacher
-            sheet.cell(row=row, column=5, value=room[4])  # capacity
-
-        workbook.save(output)
-        output.seek(0)
+        query, params = rooms_export_query(values)
 
-        cur.close()
-        conn.close()
+        # Строки читаются пачками и сразу пишутся в файл
+        with db_connection(replica=read_from_replica()) as conn, phase("export"):
+            output = write_xlsx(stream_rows(conn, query, params), ROOM_EXPORT_HEADERS, "Кабинеты")
 
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name="rooms_export.xlsx",
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        return send_xlsx(output, "rooms_export.xlsx")
 
     except Exception as e:
         return f"Ошибка при экспорте кабинетов: {str(e)}", 500
 
-# --- Экспорт инвентаря в Excel ---
+# --- Экспорт инвентаря в Excel (или потоком в CSV/NDJSON: ?format=csv|ndjson) ---
 @app.route("/export-items")
 @check_db
 def export_items():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # Фильтры те же, что и на странице списка
+        values = item_filter_values(request.args)
+        fmt = request.args.get("format", "xlsx")
+        if fmt in STREAM_MIMETYPES:
+            query, params = items_feed_query(values)
+            return stream_response(query, params, ITEM_FEED_FIELDS, fmt, "inventory_export",
+                                   replica=read_from_replica())
 
-        # Получаем параметры фильтрации из URL
-        name = request.args.get("name", "")
-        inventory_number = request.args.get("inventory_number", "")
-        status = request.args.get("status", "")
-        room_name = request.args.get("room_name", "")
-        room_number = request.args.get("room_number", "")
-
-        # Строим запрос с фильтрами
-        filters = []
-        params = []
-
-        if name:
-            filters.append("items.name ILIKE %s")
-            params.append(f"%{name}%")
-        if inventory_number:
-            filters.append("items.inventory_number ILIKE %s")
-            params.append(f"%{inventory_number}%")
-        if status:
-            filters.append("items.status = %s")
-            params.append(status)
-        if room_name:
-            filters.append("rooms.name ILIKE %s")
-            params.append(f"%{room_name}%")
-        if room_number:
-            filters.append("rooms.number ILIKE %s")
-            params.append(f"%{room_number}%")
-
-        query = """
-            SELECT items.inventory_number, items.name, items.status, 
-                   rooms.name as room_name, rooms.number as room_number
-            FROM items
-            JOIN rooms ON items.room_id = rooms.id
-        """
-        if filters:
-            query += " WHERE " + " AND ".join(filters)
-        query += " ORDER BY rooms.number, items.name"
-
-        cur.execute(query, params)
-        items_data = cur.fetchall()
-
-        # Создаем Excel файл
-        output = io.BytesIO()
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = "Инвентарь"
-
-        # Заголовки
-        headers = ['Инвентарный номер', 'Наименование', 'Статус', 'Кабинет', 'Номер кабинета']
-        for col, header in enumerate(headers, 1):
-            sheet.cell(row=1, column=col, value=header)
-
-        # Данные
-        for row, item in enumerate(items_data, 2):
-            sheet.cell(row=row, column=1, value=item[0])  # inventory_number
-            sheet.cell(row=row, column=2, value=item[1])  # name
-            sheet.cell(row=row, column=3, value=item[2])  # status
-            sheet.cell(row=row, column=4, value=item[3])  # room_name
-            sheet.cell(row=row, column=5, value=item[4])  # room_number
-
-        workbook.save(output)
-        output.seek(0)
+        query, params = items_export_query(values)
 
-        cur.close()
-        conn.close()
+        # Строки читаются пачками и сразу пишутся в файл
+        with db_connection(replica=read_from_replica()) as conn, phase("export"):
+            output = write_xlsx(stream_rows(conn, query, params), ITEM_EXPORT_HEADERS, "Инвентарь")
 
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name="inventory_export.xlsx",
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        return send_xlsx(output, "inventory_export.xlsx")
 
     except Exception as e:
         return f"Ошибка при экспорте инвентаря: {str(e)}", 500
 
+# --- Фоновый экспорт: задача, статус, скачивание ---
+# POST /export-jobs?kind=items|rooms&format=xlsx|csv|ndjson и фильтры списка -> 202 с id задачи;
+# дальше GET /export-jobs/<id> до статуса done и GET /export-jobs/<id>/download
+def export_job_payload(job):
+    payload = {field: value for field, value in job.items() if field != "pid"}
+    payload["status_url"] = url_for("export_job_status", job_id=job["id"])
+    payload["download_url"] = url_for("download_export_job", job_id=job["id"]) if job["status"] == "done" else None
+    return payload
+
+@app.route("/export-jobs", methods=["POST"])
+@check_db
+def create_export_job():
+    kind = request.values.get("kind", "items")
+    fmt = request.values.get("format", "xlsx")
+    if kind not in EXPORT_KINDS or fmt not in JOB_FORMATS:
+        return {"error": "Неизвестный вид или формат выгрузки"}, 400
+    try:
+        job, existing = export_jobs.submit(kind, fmt, EXPORT_KINDS[kind].filter_values(request.values))
+    except ExportQueueFull as e:
+        return {"error": str(e)}, 503, {"Retry-After": "30"}
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+    payload = export_job_payload(job)
+    payload["deduplicated"] = existing
+    return payload, 202, {"Location": payload["status_url"]}
+
+@app.route("/export-jobs/<job_id>")
+def export_job_status(job_id):
+    job = export_jobs.get(job_id)
+    if job is None:
+        return {"error": "Выгрузка не найдена"}, 404
+    return export_job_payload(job), 200, {"Cache-Control": "no-store"}
+
+@app.route("/export-jobs/<job_id>/download")
+def download_export_job(job_id):
+    job = export_jobs.get(job_id)
+    if job is None:
+        return {"error": "Выгрузка не найдена"}, 404
+    if job["status"] != "done":
+        return export_job_payload(job), 409
+    try:
+        return send_file(export_jobs.file_path(job), as_attachment=True,
+                         download_name=job["download_name"], mimetype=job_mimetype(job["format"]))
+    except FileNotFoundError:
+        return {"error": "Выгрузка уже удалена"}, 404
+
 # --- Редактирование инвентаря ---
 @app.route("/items/<int:item_id>/edit", methods=["GET", "POST"])
 @check_db
 def edit_item(item_id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        if request.method == "POST":
-            name = request.form["name"]
-            inventory_number = request.form["inventory_number"]
-            status = request.form["status"]
+        with db_connection() as conn:
+            cur = conn.cursor()
 
-            cur.execute("""UPDATE items 
-                         SET name=%s, inventory_number=%s, status=%s 
-                         WHERE id=%s""",
-                      (name, inventory_number, status, item_id))
-            conn.commit()
-            cur.close()
-            conn.close()
-            return redirect(url_for("room_detail", room_id=request.form.get("room_id")))
-
-        # GET запрос - получаем данные предмета
-        cur.execute("SELECT * FROM items WHERE id=%s", (item_id,))
-        item_data = cur.fetchone()
-        
-        if item_data:
-            item = {
-                'id': item_data[0],
-                'room_id': item_data[1],
-                'name': item_data[2],
-                'inventory_number': item_data[3],
-                'status': item_data[4]
-            }
+            if request.method == "POST":
+                name = request.form["name"]
+                inventory_number = request.form["inventory_number"]
+                status = request.form["status"]
+
+                cur.execute("""UPDATE items
+                             SET name=%s, inventory_number=%s, status=%s
+                             WHERE id=%s
+                             RETURNING room_id""",
+                          (name, inventory_number, status, item_id))
+                updated = cur.fetchone()
+                tags = ("items", f"room:{updated[0]}") if updated else ()
+                commit_and_invalidate(conn, cur, *tags)
+                cur.close()
+                return redirect(url_for("room_detail", room_id=request.form.get("room_id")))
+
+            # GET запрос - получаем данные предмета
+            item = cur.run(ROOM_ITEMS_SELECT + " WHERE items.id = %s", (item_id,), record=RoomItem).fetchone()
             cur.close()
-            conn.close()
-            return render_template("edit_item.html", item=item, room_id=item['room_id'])
+
+        if item:
+            return render_template("edit_item.html", item=item, room_id=item.room_id)
         else:
-            cur.close()
-            conn.close()
             return "Предмет не найден", 404
-            
+
     except Exception as e:
         return f"Ошибка базы данных: {str(e)}", 500
 
+# Сервер разработки; в продакшене - gunicorn -c gunicorn.conf.py wsgi:app
 if __name__ == '__main__':
+    log_startup()
+    start_worker()
     port = int(os.environ.get('PORT', 5000))
     print(f"Starting server on port {port}")
     app.run(host='0.0.0.0', port=port, debug=False)
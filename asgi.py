@@ -0,0 +1,460 @@
+# Точка входа для ASGI-сервера: uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 4
+import asyncio
+import os
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qsl
+
+import psycopg
+from a2wsgi import WSGIMiddleware
+from flask import render_template
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_cookie
+
+import metrics
+from app import PRIMARY_PIN_COOKIE, app as flask_app, log_startup, start_worker, stop_worker
+from cache import cache_key, fresh_reads, query_cache
+from compression import (COMPRESS_ENABLED, Compressor, compress_async_chunks, compressed_headers, compressible,
+                         negotiate)
+from db import (DB_CONNECT_TIMEOUT, REPLICA_LAG_SQL, DatabaseUnavailable, breaker, get_database_url,
+                on_database_reload, replicas)
+from exports import EXPORT_BATCH_SIZE, STREAM_CHUNK_SIZE, STREAM_MIMETYPES, XLSX_MIMETYPE, ndjson_chunks, write_xlsx
+from jobs import EXPORT_KINDS
+from migrations import readiness
+from queries import (ITEMS_PAGE_SELECT, ROOMS_PAGE_SELECT, ItemRow, RoomRow, approximate_count_query,
+                     build_item_filters, build_room_filters, item_filter_values, keyset_page, keyset_page_query,
+                     page_size, plan_rows, room_detail_query, room_detail_result, room_filter_values)
+
+# --- Асинхронный путь для тяжелых маршрутов чтения ---
+# Списки кабинетов и инвентаря, страница кабинета и экспорт обслуживаются
+# корутинами: пока запрос ждет Postgres (psycopg 3, свой AsyncConnectionPool),
+# поток не занят, и один процесс держит сотни одновременных клиентов. SQL,
+# фильтры, keyset-пагинация, шаблоны и кэш запросов - те же, что у маршрутов
+# Flask. Остальные маршруты (формы, изменения, JSON API, /metrics) уходят во
+# Flask-приложение и выполняются в пуле из WSGI_THREADS потоков, как в gthread.
+
+ASYNC_DB_POOL_MIN = int(os.environ.get("ASYNC_DB_POOL_MIN", 1))
+ASYNC_DB_POOL_MAX = int(os.environ.get("ASYNC_DB_POOL_MAX", 20))
+ASYNC_DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+WSGI_THREADS = int(os.environ.get("WSGI_THREADS", 4))
+# Синхронному пулу хватает по соединению на поток (как в gunicorn.conf.py)
+os.environ.setdefault("DB_POOL_MAX", str(WSGI_THREADS))
+
+UNAVAILABLE = "База данных временно недоступна. Пожалуйста, попробуйте позже."
+HTML = "text/html; charset=utf-8"
+
+_pool = None
+_pool_errors_seen = 0   # connections_errors пула при последней удачной выдаче соединения
+_replica_pools = {}     # Replica -> AsyncConnectionPool; состояние реплик общее с db.replicas
+
+
+class Request:
+    __slots__ = ("path", "query_string", "args", "replica")
+
+    def __init__(self, scope):
+        self.path = scope["path"]
+        self.query_string = scope["query_string"]
+        self.args = MultiDict(parse_qsl(self.query_string.decode("latin-1"), keep_blank_values=True))
+        # Как app.read_from_replica: после своей записи клиент читает с основной базы
+        cookie = "; ".join(value.decode("latin-1") for name, value in scope["headers"] if name == b"cookie")
+        pinned = PRIMARY_PIN_COOKIE in parse_cookie(cookie)
+        self.replica = bool(_replica_pools) and not pinned
+        fresh_reads.set(pinned)
+
+
+class Response:
+    __slots__ = ("body", "status", "headers")
+
+    def __init__(self, body, status=200, content_type=HTML, headers=()):
+        # body - str/bytes или асинхронный генератор кусков
+        self.body = body
+        self.status = status
+        self.headers = [("content-type", content_type)] + list(headers)
+
+
+# --- Соединения ---
+async def _release(pool, conn):
+    # Маршруты только читают: транзакция закрывается до возврата в пул
+    if not conn.closed and conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+        await conn.rollback()
+    await pool.putconn(conn)
+
+
+async def _replica_connection():
+    # Как db._replica_connection. Недоступная реплика видна пулу как таймаут
+    # ожидания (он сам повторяет подключение), поэтому ждем не дольше
+    # таймаута подключения
+    for replica in replicas.candidates():
+        pool = _replica_pools[replica]
+        try:
+            conn = await pool.getconn(timeout=DB_CONNECT_TIMEOUT)
+        except psycopg.Error as e:
+            replicas.mark_down(replica, e)
+            continue
+        try:
+            if replicas.claim_check(replica):
+                cur = await conn.execute(REPLICA_LAG_SQL)
+                replicas.record_lag(replica, (await cur.fetchone())[0])
+        except psycopg.Error as e:
+            await _release(pool, conn)
+            replicas.mark_down(replica, e)
+            continue
+        if replicas.acceptable(replica):
+            return replica, pool, conn
+        await _release(pool, conn)
+    replicas.primary_reads += 1
+    return None
+
+
+@asynccontextmanager
+async def async_db_connection(replica=False):
+    # Как db.db_connection: ошибки подключения и обрывы считаются выключателем,
+    # ожидание свободного соединения пула - нет
+    global _pool_errors_seen
+    acquired = await _replica_connection() if replica and _replica_pools else None
+    if acquired is not None:
+        source, pool, conn = acquired
+        try:
+            yield conn
+        except (psycopg.OperationalError, psycopg.InterfaceError) as e:
+            if conn.closed:
+                replicas.mark_down(source, e)
+            raise
+        finally:
+            await _release(pool, conn)
+        return
+
+    if breaker.state != breaker.CLOSED:
+        await asyncio.to_thread(breaker.before_call)
+    # Пул подключается сам и повторяет неудачные попытки, поэтому недоступная
+    # база видна здесь только как PoolTimeout. Если с последней удачной выдачи
+    # пул не смог подключиться, ждем не дольше таймаута подключения, а таймаут
+    # считаем отказом базы; без ошибок подключения это просто занятый пул
+    errors = _pool.get_stats().get("connections_errors", 0)
+    failing = errors > _pool_errors_seen
+    try:
+        conn = await _pool.getconn(timeout=DB_CONNECT_TIMEOUT if failing else None)
+    except PoolTimeout as e:
+        if failing or _pool.get_stats().get("connections_errors", 0) > errors:
+            breaker.record_failure(e)
+        raise
+    except psycopg.Error as e:
+        breaker.record_failure(e)
+        raise
+    _pool_errors_seen = errors
+    try:
+        yield conn
+    except (psycopg.OperationalError, psycopg.InterfaceError) as e:
+        if conn.closed:
+            breaker.record_failure(e)
+        raise
+    else:
+        breaker.record_success()
+    finally:
+        await _release(_pool, conn)
+
+
+def unavailable():
+    retry_after = max(1, round(breaker.retry_after()))
+    return Response(UNAVAILABLE, 503, headers=[("retry-after", str(retry_after))])
+
+
+async def check_db():
+    # Как app.check_db; пробный запрос выключателя блокирующий - он идет в потоке
+    if not readiness.ready:
+        readiness.start()
+        return Response(UNAVAILABLE, 503)
+    if breaker.state != breaker.CLOSED:
+        try:
+            await asyncio.to_thread(breaker.before_call)
+        except DatabaseUnavailable:
+            return unavailable()
+    return None
+
+
+def render(request, template, **context):
+    # Шаблоны Flask-приложения; url_for и request в них берутся из контекста запроса
+    with flask_app.test_request_context(request.path, query_string=request.query_string.decode("latin-1")):
+        return render_template(template, **context)
+
+
+# --- Списки и страница кабинета ---
+async def fetch_list(request, select_sql, filters, params, sort_sql, id_sql, record, row_key):
+    args = request.args
+    per_page = page_size(args)
+    query, query_params, forward, backwards = keyset_page_query(select_sql, filters, params, sort_sql, id_sql,
+                                                                per_page, args.get("after"), args.get("before"))
+    async with async_db_connection(request.replica) as conn:
+        cur = await conn.execute(query, query_params)
+        rows = [record._make(row) for row in await cur.fetchall()]
+        total = None
+        if args.get("count"):
+            cur = await conn.execute(approximate_count_query(select_sql, filters), params)
+            total = plan_rows((await cur.fetchone())[0])
+    page = keyset_page(rows, per_page, row_key, forward, backwards)
+    return page.rows, page, total
+
+
+async def rooms(request):
+    try:
+        values = room_filter_values(request.args)
+        filters, params = build_room_filters(values)
+
+        async def load():
+            return await fetch_list(request, ROOMS_PAGE_SELECT, filters, params,
+                                    sort_sql="COALESCE(rooms.number, '')", id_sql="rooms.id", record=RoomRow,
+                                    row_key=lambda room: (room.number or "", room.id))
+
+        rooms, page, total = await query_cache.get_or_load_async(cache_key("rooms", request.args), ("rooms",), load)
+        return Response(render(request, "rooms.html", rooms=rooms, page=page, total=total,
+                               filter_values=values, **values))
+    except (DatabaseUnavailable, PoolTimeout):
+        return unavailable()
+    except Exception as e:
+        return Response(f"Ошибка базы данных: {str(e)}", 500)
+
+
+async def all_items(request):
+    try:
+        values = item_filter_values(request.args)
+        filters, params = build_item_filters(values)
+
+        async def load():
+            return await fetch_list(request, ITEMS_PAGE_SELECT, filters, params,
+                                    sort_sql="COALESCE(rooms.number, '')", id_sql="items.id", record=ItemRow,
+                                    row_key=lambda item: (item.room_number or "", item.id))
+
+        items, page, total = await query_cache.get_or_load_async(cache_key("items", request.args), ("items",), load)
+        return Response(render(request, "all_items.html", items=items, page=page, total=total,
+                               filter_values=values, **values))
+    except (DatabaseUnavailable, PoolTimeout):
+        return unavailable()
+    except Exception as e:
+        return Response(f"Ошибка базы данных: {str(e)}", 500)
+
+
+async def room_detail(request, room_id):
+    room_id = int(room_id)
+    per_page = page_size(request.args)
+
+    async def load():
+        query, params, forward, backwards = room_detail_query(room_id, per_page, request.args.get("after"),
+                                                              request.args.get("before"))
+        async with async_db_connection(request.replica) as conn:
+            cur = await conn.execute(query, params)
+            row = await cur.fetchone()
+        return room_detail_result(row, per_page, forward, backwards)
+
+    try:
+        detail = await query_cache.get_or_load_async(cache_key("room", request.args, extra=(room_id,)),
+                                                     (f"room:{room_id}", "room"), load)
+        if detail is None:
+            return Response("Кабинет не найден", 404)
+
+        room, page, status_counts, room_version = detail
+        return Response(render(request, "room_detail.html", room=room, items=page.rows, page=page,
+                               status_counts=status_counts, room_version=room_version))
+    except (DatabaseUnavailable, PoolTimeout):
+        return unavailable()
+    except Exception as e:
+        return Response(f"Ошибка базы данных: {str(e)}", 500)
+
+
+# --- Экспорт ---
+async def stream_export(query, params, fields, fmt, replica=False):
+    # Соединение держится, пока идет выгрузка; CSV - всегда через COPY
+    async with async_db_connection(replica) as conn:
+        if fmt == "csv":
+            buffer = bytearray()
+            async with conn.cursor() as cur:
+                async with cur.copy(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", params) as copy:
+                    async for data in copy:
+                        buffer += data
+                        if len(buffer) >= STREAM_CHUNK_SIZE:
+                            yield bytes(buffer)
+                            buffer.clear()
+            if buffer:
+                yield bytes(buffer)
+        else:
+            async with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+                await cur.execute(query, params)
+                while rows := await cur.fetchmany(EXPORT_BATCH_SIZE):
+                    for chunk in ndjson_chunks(rows, fields):
+                        yield chunk
+
+
+async def build_xlsx(conn, query, params, headers, title):
+    # openpyxl синхронный: книга пишется в отдельном потоке, а пачки строк
+    # из серверного курсора ему подает цикл событий
+    loop = asyncio.get_running_loop()
+    async with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+        await cur.execute(query, params)
+
+        def rows():
+            while batch := asyncio.run_coroutine_threadsafe(cur.fetchmany(EXPORT_BATCH_SIZE), loop).result():
+                yield from batch
+
+        return await asyncio.to_thread(write_xlsx, rows(), headers, title)
+
+
+async def file_chunks(output):
+    try:
+        while chunk := await asyncio.to_thread(output.read, STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        output.close()
+
+
+async def export(request, kind, error_prefix):
+    spec = EXPORT_KINDS[kind]
+    try:
+        # Фильтры те же, что и на странице списка
+        values = spec.filter_values(request.args)
+        fmt = request.args.get("format", "xlsx")
+        if fmt in STREAM_MIMETYPES:
+            query, params = spec.feed_query(values)
+            return Response(stream_export(query, params, spec.fields, fmt, request.replica),
+                            content_type=STREAM_MIMETYPES[fmt],
+                            headers=[("content-disposition", f"attachment; filename={spec.download_name}.{fmt}")])
+
+        query, params = spec.export_query(values)
+        async with async_db_connection(request.replica) as conn:
+            output = await build_xlsx(conn, query, params, spec.headers, spec.title)
+        size = output.seek(0, 2)
+        output.seek(0)
+        return Response(file_chunks(output), content_type=XLSX_MIMETYPE,
+                        headers=[("content-disposition", f"attachment; filename={spec.download_name}.xlsx"),
+                                 ("content-length", str(size))])
+    except (DatabaseUnavailable, PoolTimeout):
+        return unavailable()
+    except Exception as e:
+        return Response(f"{error_prefix}: {str(e)}", 500)
+
+
+async def export_rooms(request):
+    return await export(request, "rooms", "Ошибка при экспорте кабинетов")
+
+
+async def export_items(request):
+    return await export(request, "items", "Ошибка при экспорте инвентаря")
+
+
+# --- Маршрутизация ---
+# Метки маршрутов те же, что у Flask, чтобы метрики обоих путей совпадали
+ROUTES = [
+    ("/rooms", re.compile(r"/rooms"), rooms),
+    ("/items", re.compile(r"/items"), all_items),
+    ("/rooms/<int:room_id>", re.compile(r"/rooms/(\d+)"), room_detail),
+    ("/export-rooms", re.compile(r"/export-rooms"), export_rooms),
+    ("/export-items", re.compile(r"/export-items"), export_items),
+]
+
+flask_asgi = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def send_response(response, receive, send, encoding=None):
+    body = response.body
+    headers = response.headers
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if isinstance(body, bytes):
+        headers = headers + [("content-length", str(len(body)))]
+    # Сжатие как у Flask-приложения (compression.CompressionMiddleware)
+    if encoding is not None and compressible(response.status, headers):
+        if isinstance(body, bytes):
+            compressor = Compressor(encoding)
+            body = compressor.compress(body) + compressor.finish()
+            headers = compressed_headers(headers, encoding, len(body))
+        else:
+            body = compress_async_chunks(body, encoding)
+            headers = compressed_headers(headers, encoding)
+    await send({"type": "http.response.start", "status": response.status,
+                "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]})
+    if isinstance(body, bytes):
+        await send({"type": "http.response.body", "body": body})
+        return
+
+    # Клиент отключился посреди выгрузки - генератор закрывается, соединение
+    # возвращается в пул, а не дочитывает результат впустую
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        async for chunk in body:
+            if disconnected.done():
+                return
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+        await body.aclose()
+
+
+async def handle(rule, handler, args, scope, receive, send):
+    started = time.perf_counter()
+    response = await check_db() or await handler(Request(scope), *args)
+    encoding = None
+    if COMPRESS_ENABLED:
+        encoding = negotiate(", ".join(value.decode("latin-1") for name, value in scope["headers"]
+                                       if name == b"accept-encoding"))
+    try:
+        await send_response(response, receive, send, encoding)
+    finally:
+        if metrics.METRICS_ENABLED:
+            metrics.REQUEST_DURATION.observe(time.perf_counter() - started, rule, "GET", str(response.status))
+
+
+async def _drain_pools():
+    # После reload_database_config(): новые соединения откроются уже с новыми
+    # параметрами (conninfo пулов - функции), занятые закроются при возврате
+    await _pool.drain()
+    for pool in _replica_pools.values():
+        await pool.drain()
+
+
+async def lifespan(receive, send):
+    global _pool
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            log_startup()
+            start_worker()
+            _pool = AsyncConnectionPool(get_database_url, min_size=ASYNC_DB_POOL_MIN, max_size=ASYNC_DB_POOL_MAX,
+                                        timeout=ASYNC_DB_POOL_TIMEOUT, kwargs={"connect_timeout": DB_CONNECT_TIMEOUT},
+                                        open=False)
+            # Не ждем базу при старте: готовность проверяет readiness в фоне
+            await _pool.open(wait=False)
+            for replica in replicas.replicas:
+                _replica_pools[replica] = AsyncConnectionPool(
+                    replica.dsn, min_size=0, max_size=ASYNC_DB_POOL_MAX, timeout=ASYNC_DB_POOL_TIMEOUT,
+                    kwargs={"connect_timeout": DB_CONNECT_TIMEOUT}, open=False)
+                await _replica_pools[replica].open(wait=False)
+            # Конфигурацию перечитывает поток db.config_watcher - пулы
+            # сбрасываются в цикле событий
+            loop = asyncio.get_running_loop()
+            on_database_reload(lambda: asyncio.run_coroutine_threadsafe(_drain_pools(), loop))
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await _pool.close()
+            for pool in _replica_pools.values():
+                await pool.close()
+            stop_worker()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http" and scope["method"] == "GET":
+        for rule, pattern, handler in ROUTES:
+            match = pattern.fullmatch(scope["path"])
+            if match:
+                return await handle(rule, handler, match.groups(), scope, receive, send)
+    await flask_asgi(scope, receive, send)
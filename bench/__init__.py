@@ -0,0 +1,10 @@
+"""Замеры производительности.
+
+Пакет (запуск из корня репозитория через python -m):
+    bench.suite     - сценарии страниц и экспорта, отчет в JSON
+    bench.datagen   - детерминированный генератор кабинетов и инвентаря
+    bench.throwaway - временная база или временный кластер Postgres
+
+Отдельные скрипты (python bench/<имя>.py): ilike_indexes, export_memory,
+cold_start, load_test, metrics_overhead.
+"""
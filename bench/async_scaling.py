@@ -0,0 +1,145 @@
+"""Масштабирование по числу клиентов: синхронный путь (gunicorn) против асинхронного (uvicorn asgi:app).
+
+Оба сервера запускаются этим скриптом по очереди на одной временной базе
+(bench.throwaway, данные bench.datagen) с одинаковым числом рабочих процессов;
+нагрузку дает bench.load_test - по потоку с keep-alive соединением на клиента.
+Кэш запросов выключен, чтобы каждый запрос доходил до Postgres. В смеси путей
+есть выгрузка CSV: на синхронном пути она занимает поток gunicorn целиком.
+
+    python -m bench.async_scaling --clients 50 200 400 --seconds 20 --output scaling.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from bench.datagen import load
+from bench.load_test import run
+from bench.suite import URL_VARIABLES, git_commit
+from bench.throwaway import throwaway_database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_paths(cur):
+    cur.execute("""SELECT room_id FROM room_status_counts
+                   GROUP BY room_id ORDER BY sum(item_count) DESC, room_id LIMIT 1""")
+    storage_room = cur.fetchone()[0]
+    cur.execute("SELECT id FROM rooms ORDER BY id")
+    room_ids = [row[0] for row in cur.fetchall()]
+    typical_rooms = room_ids[::max(1, len(room_ids) // 5)][:5]
+    return (["/rooms", "/rooms?name=Лаборатория", "/items", "/items?status=Ремонт", "/items?name=Проектор",
+             f"/rooms/{storage_room}"]
+            + [f"/rooms/{room_id}" for room_id in typical_rooms]
+            + ["/items?room_name=информатики&count=1", "/export-items?format=csv&status=Ремонт"])
+
+
+def server_command(mode, port, workers):
+    if mode == "sync":
+        return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--workers", str(workers),
+                "--bind", f"127.0.0.1:{port}", "--access-logfile", "/dev/null", "wsgi:app"]
+    return [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--workers", str(workers),
+            "--no-access-log", "--log-level", "warning"]
+
+
+def wait_ready(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url + "/rooms", timeout=5) as response:
+                if response.status == 200:
+                    return
+        except (OSError, urllib.error.HTTPError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not become ready")
+
+
+def measure(mode, env, args, paths):
+    url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(server_command(mode, args.port, args.workers), cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(url)
+        run(url, paths, min(args.clients), args.warmup)
+        results = []
+        for clients in args.clients:
+            result = run(url, paths, clients, args.seconds)
+            print(f"{mode:5} {result['clients']:7} {result['requests_per_second']:8} {result['p50_ms']:8} "
+                  f"{result['p95_ms']:8} {result['p99_ms']:8} {result['errors']:7}", flush=True)
+            results.append(result)
+        return results
+    finally:
+        server.terminate()
+        server.wait(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"),
+                        help="сервер для временной базы; без него поднимается временный кластер")
+    parser.add_argument("--rooms", type=int, default=300)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 200, 400])
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--workers", type=int, default=2, help="рабочих процессов у обоих серверов")
+    parser.add_argument("--threads", type=int, default=4, help="потоков gunicorn (и соединений пула) на процесс")
+    parser.add_argument("--async-pool", type=int, default=20, help="соединений AsyncConnectionPool на процесс")
+    parser.add_argument("--port", type=int, default=5890)
+    parser.add_argument("--modes", nargs="+", default=["sync", "async"], choices=["sync", "async"])
+    parser.add_argument("--output", help="куда записать JSON-отчет")
+    args = parser.parse_args()
+
+    with throwaway_database(args.database_url) as dsn:
+        import psycopg2
+
+        from migrations import migrate
+
+        conn = psycopg2.connect(dsn)
+        migrate(conn)
+        load(conn, args.rooms, args.items, args.seed)
+        conn.autocommit = True
+        cur = conn.cursor()
+        paths = build_paths(cur)
+        cur.close()
+        conn.close()
+
+        env = {key: value for key, value in os.environ.items() if key not in URL_VARIABLES}
+        env.update(DATABASE_URL=dsn, QUERY_CACHE="0", SLOW_QUERY_MS="100000", AUTO_MIGRATE="0",
+                   GUNICORN_THREADS=str(args.threads), DB_POOL_MAX=str(args.threads),
+                   WSGI_THREADS=str(args.threads), ASYNC_DB_POOL_MAX=str(args.async_pool))
+
+        print(f"{'mode':5} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        results = {mode: measure(mode, env, args, paths) for mode in args.modes}
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "rooms": args.rooms,
+            "items": args.items,
+            "seed": args.seed,
+            "workers": args.workers,
+            "threads": args.threads,
+            "async_pool": args.async_pool,
+            "seconds": args.seconds,
+            "paths": paths,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Синхронизация по журналу изменений против полной выгрузки.
+
+Временная база (bench.throwaway) с данными bench.datagen. Сначала полная
+выгрузка /export-items?format=ndjson - так внешняя система синхронизируется
+без журнала. Затем для каждого числа изменений - столько случайных предметов
+меняют статус (по одному оператору на предмет, как при правке через форму) и
+потребитель забирает их через /api/changes?since=... страницами до has_more =
+false. Для каждого случая - байты, число запросов и время. Отдельно - цена
+журнала при записи: массовое изменение статуса с триггерами журнала и без них.
+
+    python -m bench.change_feed --items 100000 --changes 10 1000 10000 --output change_feed.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import time
+
+from bench.datagen import load
+from bench.suite import URL_VARIABLES, git_commit
+from bench.throwaway import throwaway_database
+
+STATUSES = ("Исправен", "Ремонт", "Списан")
+
+
+def full_export(client, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        body = client.get("/export-items?format=ndjson").get_data()
+        timings.append(time.perf_counter() - started)
+    return {"bytes": len(body), "requests": 1, "ms": round(statistics.median(timings) * 1000, 1)}
+
+
+def sync(client, since, limit):
+    requests = 0
+    size = 0
+    changes = 0
+    started = time.perf_counter()
+    while True:
+        response = client.get(f"/api/changes?since={since}&limit={limit}")
+        payload = response.get_json()
+        requests += 1
+        size += len(response.get_data())
+        changes += len(payload["changes"])
+        since = payload["next_since"]
+        if not payload["has_more"]:
+            break
+    return {"bytes": size, "requests": requests, "changes": changes,
+            "ms": round((time.perf_counter() - started) * 1000, 1)}, since
+
+
+def change_items(cur, item_ids, count, rng):
+    for item_id in rng.sample(item_ids, count):
+        cur.execute("UPDATE items SET status = %s WHERE id = %s", (rng.choice(STATUSES), item_id))
+
+
+def bulk_update_ms(conn, cur, with_log, iterations=5):
+    # Массовая смена статуса всех предметов; транзакция откатывается
+    timings = []
+    for _ in range(iterations):
+        if not with_log:
+            cur.execute("ALTER TABLE items DISABLE TRIGGER items_change_log_upd_trg")
+        started = time.perf_counter()
+        cur.execute("UPDATE items SET status = CASE status WHEN 'Ремонт' THEN 'Исправен' ELSE 'Ремонт' END")
+        timings.append(time.perf_counter() - started)
+        conn.rollback()
+    return round(statistics.median(timings) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"),
+                        help="сервер для временной базы; без него поднимается временный кластер")
+    parser.add_argument("--rooms", type=int, default=300)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--changes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--limit", type=int, default=1000, help="записей журнала на запрос")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--output", help="куда записать JSON-отчет")
+    args = parser.parse_args()
+
+    with throwaway_database(args.database_url) as dsn:
+        for key in URL_VARIABLES:
+            os.environ.pop(key, None)
+        os.environ.update(DATABASE_URL=dsn, QUERY_CACHE="0", SLOW_QUERY_MS="100000", COMPRESS="0",
+                          CHANGE_LOG_COMPACT_INTERVAL="0", CHANGE_FEED_MAX_LIMIT=str(args.limit))
+
+        import psycopg2
+
+        import app
+        from migrations import migrate
+
+        conn = psycopg2.connect(dsn)
+        migrate(conn)
+        load(conn, args.rooms, args.items, args.seed)
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM items")
+        item_ids = [row[0] for row in cur.fetchall()]
+        conn.rollback()
+
+        app.start_worker()
+        while not app.readiness.ready:
+            time.sleep(0.05)
+        client = app.app.test_client()
+        rng = random.Random(args.seed)
+
+        export = full_export(client, args.iterations)
+        print(f"{'changes':>8} {'mode':>6} {'bytes':>10} {'requests':>8} {'ms':>8}")
+        print(f"{'-':>8} {'export':>6} {export['bytes']:>10} {export['requests']:>8} {export['ms']:>8}")
+        since = client.get("/api/changes").get_json()["next_since"]
+        results = []
+        for count in args.changes:
+            conn.autocommit = True
+            change_items(cur, item_ids, min(count, len(item_ids)), rng)
+            conn.autocommit = False
+            result, since = sync(client, since, args.limit)
+            result["changed_items"] = count
+            results.append(result)
+            print(f"{count:>8} {'feed':>6} {result['bytes']:>10} {result['requests']:>8} {result['ms']:>8}",
+                  flush=True)
+
+        write_cost = {"with_log_ms": bulk_update_ms(conn, cur, True),
+                      "without_log_ms": bulk_update_ms(conn, cur, False)}
+        print(f"Bulk status update of {len(item_ids)} items: {write_cost['with_log_ms']} ms with change log, "
+              f"{write_cost['without_log_ms']} ms without")
+        cur.close()
+        conn.close()
+        app.stop_worker()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "rooms": args.rooms,
+            "items": args.items,
+            "seed": args.seed,
+            "limit": args.limit,
+        },
+        "full_export": export,
+        "feed": results,
+        "bulk_update": write_cost,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
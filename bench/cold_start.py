@@ -0,0 +1,82 @@
+"""Холодный старт веб-процесса: время до первого ответа и до готовности базы.
+
+Запускает `python app.py` на свободном порту и опрашивает /debug. Чтобы
+посмотреть поведение при недоступной базе, передайте --database-url на
+закрытый порт.
+
+    python bench/cold_start.py --runs 5
+    python bench/cold_start.py --database-url postgresql://u:p@127.0.0.1:1/db --timeout 20
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure(env, timeout):
+    port = free_port()
+    env = dict(env, PORT=str(port))
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "app.py")], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first_response = ready = None
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/debug", timeout=1) as response:
+                    status = json.load(response)
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.02)
+                continue
+            if first_response is None:
+                first_response = time.perf_counter() - started
+            if status.get("database_initialized"):
+                ready = time.perf_counter() - started
+                break
+            time.sleep(0.02)
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "first_response_s": round(first_response, 3) if first_response is not None else None,
+        "ready_s": round(ready, 3) if ready is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--database-url", help="подменить DATABASE_URL для запуска")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.database_url:
+        for key in ("DATABASE_PUBLIC_URL", "PGHOST", "PGPASSWORD"):
+            env.pop(key, None)
+        env["DATABASE_URL"] = args.database_url
+
+    results = [measure(env, args.timeout) for _ in range(args.runs)]
+    for key in ("first_response_s", "ready_s"):
+        values = [r[key] for r in results if r[key] is not None]
+        summary = f"median {statistics.median(values):.3f}s, max {max(values):.3f}s" if values else "n/a"
+        print(f"{key:17} {summary} ({len(values)}/{len(results)} runs)")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Сжатие ответов: байты на проводе и цена в CPU для каждой кодировки.
+
+Временная база (bench.throwaway) с данными bench.datagen, запросы через
+тестовый клиент Flask, то есть через CompressionMiddleware. Для каждого пути и
+кодировки (identity, gzip, а также br и zstd, если установлены brotli и
+zstandard) - размер ответа, степень сжатия, процессорное время на запрос и
+отдельно время самого сжатия тела (тем же способом, что в middleware: потоковые
+ответы - кусками с flush). Кэш запросов включен, чтобы разница в CPU между
+кодировками не тонула в работе Postgres.
+
+    python -m bench.compression --items 100000 --iterations 30 --output compression.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import time
+
+from bench.datagen import load
+from bench.suite import URL_VARIABLES, git_commit
+from bench.throwaway import throwaway_database
+
+
+def build_paths(cur):
+    cur.execute("""SELECT room_id FROM room_status_counts
+                   GROUP BY room_id ORDER BY sum(item_count) DESC, room_id LIMIT 1""")
+    storage_room = cur.fetchone()[0]
+    return ["/rooms", "/items", "/items?status=Ремонт", f"/rooms/{storage_room}", "/api/rooms",
+            "/export-items?format=csv", "/export-items?format=ndjson", "/export-items?status=Ремонт"]
+
+
+def compression_ms(body, encoding, streamed, repeat=5):
+    # Только сжатие тела, без приложения: медиана из repeat прогонов
+    from compression import Compressor, compress_chunks
+    from exports import STREAM_CHUNK_SIZE
+
+    timings = []
+    for _ in range(repeat):
+        started = time.process_time()
+        if streamed:
+            chunks = [body[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(body), STREAM_CHUNK_SIZE)]
+            b"".join(compress_chunks(chunks, encoding))
+        else:
+            compressor = Compressor(encoding)
+            compressor.compress(body) + compressor.finish()
+        timings.append(time.process_time() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def measure(client, path, encoding, iterations, warmup):
+    headers = {"Accept-Encoding": encoding}
+    for _ in range(warmup):
+        client.get(path, headers=headers).close()
+
+    cpu = []
+    wall = []
+    for _ in range(iterations):
+        cpu_started, wall_started = time.process_time(), time.perf_counter()
+        response = client.get(path, headers=headers)
+        body = response.get_data()
+        cpu.append(time.process_time() - cpu_started)
+        wall.append(time.perf_counter() - wall_started)
+        response.close()
+    return {
+        "content_encoding": response.headers.get("Content-Encoding", "identity"),
+        "bytes": len(body),
+        "cpu_ms": round(statistics.median(cpu) * 1000, 3),
+        "wall_ms": round(statistics.median(wall) * 1000, 3),
+        "streamed": response.headers.get("Content-Length") is None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"),
+                        help="сервер для временной базы; без него поднимается временный кластер")
+    parser.add_argument("--rooms", type=int, default=300)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--output", help="куда записать JSON-отчет")
+    args = parser.parse_args()
+
+    with throwaway_database(args.database_url) as dsn:
+        for key in URL_VARIABLES:
+            os.environ.pop(key, None)
+        os.environ.update(DATABASE_URL=dsn, QUERY_CACHE="1", SLOW_QUERY_MS="100000", COMPRESS="1")
+
+        import psycopg2
+
+        import app
+        from compression import BROTLI_QUALITY, ENCODINGS, GZIP_LEVEL, ZSTD_LEVEL
+        from migrations import migrate
+
+        conn = psycopg2.connect(dsn)
+        migrate(conn)
+        load(conn, args.rooms, args.items, args.seed)
+        conn.autocommit = True
+        cur = conn.cursor()
+        paths = build_paths(cur)
+        cur.close()
+        conn.close()
+
+        app.start_worker()
+        while not app.readiness.ready:
+            time.sleep(0.05)
+        client = app.app.test_client()
+
+        encodings = ("identity",) + tuple(reversed(ENCODINGS))
+        print(f"{'path':34} {'encoding':>8} {'bytes':>10} {'ratio':>6} {'cpu ms':>8} {'+cpu ms':>8} "
+              f"{'compress ms':>11}")
+        results = {}
+        for path in paths:
+            plain = client.get(path).get_data()
+            results[path] = {}
+            for encoding in encodings:
+                result = measure(client, path, encoding, args.iterations, args.warmup)
+                baseline = results[path].get("identity", result)
+                result["ratio"] = round(len(plain) / result["bytes"], 2) if result["bytes"] else None
+                result["extra_cpu_ms"] = round(result["cpu_ms"] - baseline["cpu_ms"], 3)
+                result["compress_ms"] = (compression_ms(plain, encoding, result["streamed"])
+                                         if result["content_encoding"] != "identity" else 0.0)
+                results[path][encoding] = result
+                print(f"{path:34} {encoding:>8} {result['bytes']:>10} {result['ratio']:>6} "
+                      f"{result['cpu_ms']:>8} {result['extra_cpu_ms']:>+8} {result['compress_ms']:>11}",
+                      flush=True)
+        app.stop_worker()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "rooms": args.rooms,
+            "items": args.items,
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "levels": {"gzip": GZIP_LEVEL, "br": BROTLI_QUALITY, "zstd": ZSTD_LEVEL},
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Детерминированный генератор тестовых данных: кабинеты и инвентарь школы.
+
+Одинаковые --seed, --rooms и --items дают одинаковые строки на любой машине
+(используется random.Random, а не random() в Postgres). Распределения похожи
+на настоящие: в основном учебные кабинеты с партами и стульями, классы
+информатики с компьютерами, несколько складов, где лежит заметная доля всего
+инвентаря и больше неисправного.
+
+    DATABASE_URL=postgresql://... python -m bench.datagen --rooms 300 --items 100000
+"""
+import argparse
+import csv
+import io
+import random
+
+# (вес, название, вместимость, каталог [(предмет, вес)], доля предметов, статусы)
+ROOM_KINDS = [
+    (60, "Кабинет {subject}", (24, 32),
+     [("Парта", 14), ("Стул", 28), ("Доска маркерная", 1), ("Компьютер учителя", 1),
+      ("Проектор", 1), ("Шкаф", 2), ("Колонки", 1)], 1, (0.88, 0.06, 0.06)),
+    (10, "Лаборатория {lab}", (16, 24),
+     [("Лабораторный стол", 8), ("Стул", 16), ("Микроскоп", 8), ("Вытяжной шкаф", 1),
+      ("Проектор", 1), ("Компьютер учителя", 1)], 1, (0.82, 0.08, 0.10)),
+    (8, "Кабинет информатики", (12, 16),
+     [("Компьютер", 15), ("Монитор", 15), ("Клавиатура", 15), ("Мышь", 15), ("Принтер", 1),
+      ("Проектор", 1), ("Коммутатор", 1)], 2, (0.80, 0.10, 0.10)),
+    (3, "Спортзал", (60, 120),
+     [("Мяч", 30), ("Мат", 10), ("Скамья", 6), ("Шведская стенка", 2), ("Табло", 1)], 2, (0.75, 0.15, 0.10)),
+    (3, "Библиотека", (30, 40),
+     [("Стеллаж", 20), ("Стол", 6), ("Стул", 20), ("Компьютер", 2)], 1, (0.90, 0.05, 0.05)),
+    (2, "Актовый зал", (150, 300),
+     [("Кресло", 50), ("Микрофон", 4), ("Колонки", 4), ("Микшерный пульт", 1), ("Проектор", 1)],
+     2, (0.85, 0.08, 0.07)),
+    (4, "Склад {n}", (0, 0),
+     [("Парта", 10), ("Стул", 20), ("Компьютер", 6), ("Монитор", 6), ("Проектор", 2), ("Принтер", 2),
+      ("Шкаф", 3), ("Коробка с кабелями", 4)], 25, (0.55, 0.30, 0.15)),
+]
+SUBJECTS = ["математики", "русского языка", "литературы", "истории", "географии", "английского языка",
+            "обществознания", "ИЗО", "музыки", "технологии", "начальных классов", "ОБЖ"]
+LABS = ["физики", "химии", "биологии"]
+MODELS = ["", "", " Samsung", " LG", " Acer", " HP", " Lenovo", " Epson", " Dell", " ИКЕА", " Smart"]
+SURNAMES = ["Иванов", "Петров", "Сидорова", "Кузнецова", "Смирнов", "Попова", "Васильев", "Соколова",
+            "Михайлов", "Новикова", "Федоров", "Морозова", "Волков", "Алексеева", "Лебедев", "Семенова"]
+STATUSES = ("Работает", "Не работает", "Ремонт")
+FLOORS = 4
+
+
+def generate_rooms(count, rng):
+    kinds = [kind for kind in ROOM_KINDS for _ in range(kind[0])]
+    per_floor = {}
+    rooms = []
+    for room_id in range(1, count + 1):
+        kind = rng.choice(kinds)
+        floor = rng.randint(1, FLOORS)
+        per_floor[floor] = per_floor.get(floor, 0) + 1
+        number = str(floor * 100 + per_floor[floor])
+        name = kind[1].format(subject=rng.choice(SUBJECTS), lab=rng.choice(LABS), n=number)
+        capacity = rng.randint(*kind[2]) if kind[2][1] else None
+        teacher = None
+        if capacity:
+            teacher = f"{rng.choice(SURNAMES)} {rng.choice('АБВГДЕИКЛМНОПРСТ')}.{rng.choice('АВГДЕИМНОПС')}."
+        rooms.append((room_id, name, number, str(floor), teacher, capacity, kind))
+    return rooms
+
+
+def generate_items(rooms, count, rng):
+    # Комнаты выбираются пропорционально доле своего типа (склады - в разы чаще)
+    room_choice = rng.choices(rooms, weights=[room[6][4] for room in rooms], k=count)
+    for item_id, room in enumerate(room_choice, 1):
+        catalog = room[6][3]
+        name = rng.choices([entry[0] for entry in catalog], weights=[entry[1] for entry in catalog])[0]
+        status = rng.choices(STATUSES, weights=room[6][5])[0]
+        yield (item_id, room[0], name + rng.choice(MODELS), f"INV-{item_id:07d}", status)
+
+
+def _copy(cur, table, columns, rows, batch=50000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    written = 0
+    for row in rows:
+        writer.writerow(row)
+        written += 1
+        if written % batch == 0:
+            buffer.seek(0)
+            cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        buffer.seek(0)
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    return written
+
+
+def load(conn, rooms=300, items=100000, seed=42):
+    # Таблицы должны быть пустыми и уже созданными миграциями
+    rng = random.Random(seed)
+    room_rows = generate_rooms(rooms, rng)
+    cur = conn.cursor()
+    _copy(cur, "rooms", ("id", "name", "number", "floor", "teacher", "capacity"),
+          (room[:6] for room in room_rows))
+    _copy(cur, "items", ("id", "room_id", "name", "inventory_number", "status"),
+          generate_items(room_rows, items, rng))
+    cur.execute("SELECT setval(pg_get_serial_sequence('rooms', 'id'), GREATEST(%s, 1))", (rooms,))
+    cur.execute("SELECT setval(pg_get_serial_sequence('items', 'id'), GREATEST(%s, 1))", (items,))
+    conn.commit()
+    cur.execute("ANALYZE rooms")
+    cur.execute("ANALYZE items")
+    conn.commit()
+    cur.close()
+
+
+def main():
+    import psycopg2
+
+    from db import get_database_url
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=300)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_database_url())
+    migrate(conn)
+    load(conn, args.rooms, args.items, args.seed)
+    conn.close()
+    print(f"Loaded {args.rooms} rooms and {args.items} items (seed {args.seed})")
+
+
+if __name__ == "__main__":
+    main()
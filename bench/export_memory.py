@@ -0,0 +1,90 @@
+"""Пиковая память (RSS) при сборке XLSX-экспорта на синтетических строках.
+
+База данных не нужна: строки генерируются на лету, как их отдавал бы
+серверный курсор. Каждый режим запускается в отдельном процессе. Граница
+роста памяти при экспорте из базы проверяется тестом
+tests/test_export_memory.py.
+
+    python bench/export_memory.py --rows 200000
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def synthetic_rows(count):
+    statuses = ('Работает', 'Не работает', 'Ремонт')
+    for i in range(count):
+        yield (f"INV-{i:07d}", f"Компьютер {i}", statuses[i % 3], f"Кабинет {i % 500}", str(100 + i % 500))
+
+
+def build_legacy(rows, headers):
+    # Прежний способ: обычная книга, ячейки по одной, результат в BytesIO
+    import openpyxl
+    output = io.BytesIO()
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for col, header in enumerate(headers, 1):
+        sheet.cell(row=1, column=col, value=header)
+    for row_number, row in enumerate(list(rows), 2):
+        for col, value in enumerate(row, 1):
+            sheet.cell(row=row_number, column=col, value=value)
+    workbook.save(output)
+    return output
+
+
+def measure(mode, count):
+    from exports import ITEM_EXPORT_HEADERS, write_xlsx
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    if mode == "streaming":
+        output = write_xlsx(synthetic_rows(count), ITEM_EXPORT_HEADERS, "Инвентарь")
+    else:
+        output = build_legacy(synthetic_rows(count), ITEM_EXPORT_HEADERS)
+    elapsed = time.perf_counter() - started
+    size = output.seek(0, 2)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "mode": mode,
+        "rows": count,
+        "seconds": round(elapsed, 2),
+        "file_bytes": size,
+        "peak_rss_mb": round(peak / 1024, 1),
+        "rss_growth_mb": round((peak - baseline) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[50000, 200000])
+    parser.add_argument("--modes", nargs="+", default=["streaming", "legacy"])
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child[0], int(args.child[1]))))
+        return
+
+    results = []
+    for count in args.rows:
+        for mode in args.modes:
+            out = subprocess.run([sys.executable, __file__, "--child", mode, str(count)],
+                                 check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{'mode':10} {'rows':>9} {'sec':>7} {'peak RSS, MB':>13} {'growth, MB':>11}")
+    for r in results:
+        print(f"{r['mode']:10} {r['rows']:9} {r['seconds']:7} {r['peak_rss_mb']:13} {r['rss_growth_mb']:11}")
+    print(json.dumps(results, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Сравнение времени фильтров списков без индексов и с индексами из schema.py.
+
+Данные генерируются в отдельной схеме (по умолчанию bench_ilike), рабочие
+таблицы не затрагиваются. Запуск:
+
+    DATABASE_URL=postgresql://... python bench/ilike_indexes.py --items 100000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+
+from db import get_database_url
+from queries import build_item_filters, build_room_filters
+from schema import create_indexes, create_tables, drop_indexes
+
+ITEMS_QUERY = """SELECT items.id, items.name, items.inventory_number, items.status,
+                        rooms.name, rooms.number, items.room_id
+                 FROM items
+                 JOIN rooms ON items.room_id = rooms.id"""
+ROOMS_QUERY = "SELECT * FROM rooms"
+
+CASES = [
+    ("items name", "items", {"name": "проектор"}),
+    ("items inventory_number", "items", {"inventory_number": "12345"}),
+    ("items status", "items", {"status": "Ремонт"}),
+    ("items room_name", "items", {"room_name": "физики"}),
+    ("items room_number", "items", {"room_number": "31"}),
+    ("rooms teacher", "rooms", {"teacher": "Петров"}),
+    ("room_detail items", "room_detail", {}),
+]
+
+
+def seed(cur, rooms, items):
+    cur.execute("SELECT setseed(0.42)")
+    cur.execute("""
+        INSERT INTO rooms (name, number, floor, teacher, capacity)
+        SELECT (ARRAY['Кабинет физики', 'Кабинет химии', 'Кабинет информатики',
+                      'Кабинет истории', 'Спортзал', 'Склад'])[1 + g %% 6] || ' ' || g,
+               (100 + g)::text, (1 + g %% 5)::text,
+               (ARRAY['Иванов', 'Петров', 'Сидорова', 'Кузнецова'])[1 + g %% 4] || ' ' || g,
+               20 + g %% 20
+        FROM generate_series(1, %s) g""", (rooms,))
+    cur.execute("""
+        INSERT INTO items (room_id, name, inventory_number, status)
+        SELECT 1 + floor(random() * %s)::int,
+               (ARRAY['Компьютер', 'Монитор', 'Проектор', 'Парта', 'Стул', 'Доска'])[1 + g %% 6] || ' ' || g,
+               'INV-' || lpad(g::text, 7, '0'),
+               CASE WHEN random() < 0.85 THEN 'Работает'
+                    WHEN random() < 0.5 THEN 'Не работает' ELSE 'Ремонт' END
+        FROM generate_series(1, %s) g""", (rooms, items))
+
+
+def run_case(cur, kind, values, repeat):
+    if kind == "items":
+        filters, params = build_item_filters(values)
+        query = ITEMS_QUERY + " WHERE " + " AND ".join(filters) + " ORDER BY COALESCE(rooms.number, ''), items.id"
+    elif kind == "rooms":
+        filters, params = build_room_filters(values)
+        query = ROOMS_QUERY + " WHERE " + " AND ".join(filters) + " ORDER BY number"
+    else:
+        query, params = "SELECT * FROM items WHERE room_id = %s", [7]
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cur.execute(query, params)
+        cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=500)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--schema", default="bench_ilike")
+    parser.add_argument("--keep", action="store_true", help="не удалять схему после замера")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_database_url())
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+    cur.execute(f"CREATE SCHEMA {args.schema}")
+    cur.execute(f"SET search_path TO {args.schema}, public")
+    create_tables(cur)
+    seed(cur, args.rooms, args.items)
+    conn.commit()
+
+    results = {}
+    for label in ("without_indexes", "with_indexes"):
+        if label == "with_indexes":
+            started = time.perf_counter()
+            trigram = create_indexes(cur)
+            results["index_build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            results["trigram"] = trigram
+        else:
+            drop_indexes(cur)
+        cur.execute("ANALYZE rooms")
+        cur.execute("ANALYZE items")
+        conn.commit()
+        results[label] = {name: round(run_case(cur, kind, values, args.repeat), 2)
+                          for name, kind, values in CASES}
+
+    if not args.keep:
+        cur.execute(f"DROP SCHEMA {args.schema} CASCADE")
+    conn.commit()
+    conn.close()
+
+    print(f"{'case':28} {'no index, ms':>14} {'indexed, ms':>14}")
+    for name, _, _ in CASES:
+        print(f"{name:28} {results['without_indexes'][name]:14.2f} {results['with_indexes'][name]:14.2f}")
+    print(json.dumps(results, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
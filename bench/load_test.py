@@ -0,0 +1,94 @@
+"""Нагрузочный тест: запросов в секунду и задержки на нескольких страницах.
+
+Сервер должен быть уже запущен. Каждый клиент - отдельный поток со своим
+keep-alive соединением, пути перебираются по кругу.
+
+    python app.py &                                  # сервер разработки
+    python bench/load_test.py --url http://127.0.0.1:5000 --clients 16 --seconds 20
+
+    gunicorn -c gunicorn.conf.py wsgi:app &
+    python bench/load_test.py --url http://127.0.0.1:5000 --clients 16 --seconds 20
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+
+DEFAULT_PATHS = ["/", "/rooms", "/items", "/items?status=Ремонт"]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def client(url, paths, deadline, latencies, errors, offset):
+    parsed = urllib.parse.urlsplit(url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            conn.request("GET", urllib.parse.quote(path, safe="/?=&"))
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors.append(response.status)
+            if response.getheader("Connection", "").lower() == "close":
+                conn.close()
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            conn.close()
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def run(url, paths, clients, seconds):
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(url, paths, deadline, latencies, errors, n))
+               for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "clients": clients,
+        "seconds": round(elapsed, 2),
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS)
+    args = parser.parse_args()
+
+    results = [run(args.url, args.paths, clients, args.seconds) for clients in args.clients]
+    print(f"{'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for r in results:
+        print(f"{r['clients']:7} {r['requests_per_second']:8} {r['p50_ms']:8} {r['p95_ms']:8} "
+              f"{r['p99_ms']:8} {r['errors']:7}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
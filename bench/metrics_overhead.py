@@ -0,0 +1,73 @@
+"""Накладные расходы метрик: запросов в секунду с METRICS=1 и METRICS=0.
+
+Запросы идут через тестовый клиент Flask к настоящей базе (DATABASE_URL),
+кэш запросов выключен, чтобы каждый запрос доходил до Postgres. Режимы
+чередуются в отдельных процессах, сравниваются медианы.
+
+    python bench/metrics_overhead.py --requests 2000 --rounds 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PATHS = ["/", "/rooms", "/items", "/items?status=Ремонт"]
+
+
+def measure(count):
+    import app
+
+    app.start_worker()
+    while not app.readiness.ready:
+        time.sleep(0.05)
+    client = app.app.test_client()
+    for path in PATHS * 20:
+        client.get(path)
+
+    started = time.perf_counter()
+    for i in range(count):
+        client.get(PATHS[i % len(PATHS)])
+    elapsed = time.perf_counter() - started
+    return {"requests_per_second": round(count / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--max-overhead", type=float, help="завершиться с ошибкой при большем проценте")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child)))
+        return
+
+    results = {"1": [], "0": []}
+    for _ in range(args.rounds):
+        for mode in results:
+            env = dict(os.environ, METRICS=mode, QUERY_CACHE="0", SLOW_QUERY_MS="100000")
+            out = subprocess.run([sys.executable, __file__, "--child", str(args.requests)], env=env,
+                                 check=True, capture_output=True, text=True).stdout
+            results[mode].append(json.loads(out.strip().splitlines()[-1])["requests_per_second"])
+
+    enabled = statistics.median(results["1"])
+    disabled = statistics.median(results["0"])
+    overhead = round((disabled - enabled) / disabled * 100, 2)
+    print(f"metrics on:  {enabled} req/s {results['1']}")
+    print(f"metrics off: {disabled} req/s {results['0']}")
+    print(f"overhead:    {overhead}%")
+    print(json.dumps({"enabled_rps": enabled, "disabled_rps": disabled, "overhead_percent": overhead}))
+
+    if args.max_overhead is not None and overhead > args.max_overhead:
+        sys.exit(f"Metrics overhead {overhead}% exceeds {args.max_overhead}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""Сценарные замеры страниц, экспорта и изменяющих маршрутов с отчетом в JSON.
+
+Каждый запуск создает временную базу (см. bench.throwaway), заполняет ее
+детерминированными данными (bench.datagen) и прогоняет сценарии через
+тестовый клиент Flask: задержки p50/p95/p99, пропускная способность и пик
+выделенной памяти Python на запрос. Отчет стабилен по структуре и порядку
+ключей, поэтому отчеты разных коммитов удобно сравнивать (--compare).
+
+    python -m bench.suite --database-url postgresql://postgres@localhost/postgres --output bench.json
+    python -m bench.suite --items 500000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from bench.datagen import load
+from bench.throwaway import throwaway_database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+URL_VARIABLES = ("DATABASE_PUBLIC_URL", "POSTGRESQL_URL", "POSTGRES_URL", "PGHOST", "PGPASSWORD")
+
+
+class Scenario:
+    __slots__ = ("name", "group", "requests", "iterations")
+
+    def __init__(self, name, group, requests, iterations):
+        # requests(i) -> (метод, путь, данные формы или JSON)
+        self.name = name
+        self.group = group
+        self.requests = requests
+        self.iterations = iterations
+
+
+def pick(cur, query, params=()):
+    cur.execute(query, params)
+    return cur.fetchone()
+
+
+def build_scenarios(cur, iterations, export_iterations):
+    storage_room = pick(cur, """SELECT room_id FROM room_status_counts
+                                GROUP BY room_id ORDER BY sum(item_count) DESC, room_id LIMIT 1""")[0]
+    cur.execute("SELECT id FROM rooms ORDER BY id")
+    room_ids = [row[0] for row in cur.fetchall()]
+    typical_rooms = room_ids[::max(1, len(room_ids) // 20)]
+    item_id, item_room = pick(cur, "SELECT id, room_id FROM items ORDER BY id LIMIT 1")
+
+    def get(path):
+        return lambda i: ("GET", path, None)
+
+    item_filters = {
+        "name": "Проектор",
+        "inventory_number": "INV-00012",
+        "status": "Ремонт",
+        "room_name": "информатики",
+        "room_number": "21",
+    }
+    room_filters = {"name": "Лаборатория", "teacher": "Иванов", "capacity_min": "30"}
+    searches = {
+        "word": "проектор",
+        "two_words": "samsung монитор",
+        "room_and_teacher": "кабинет иванов",
+        "inventory_number": "INV-00012",
+    }
+
+    scenarios = [
+        Scenario("home_dashboard", "read", get("/"), iterations),
+        Scenario("rooms", "read", get("/rooms"), iterations),
+        Scenario("rooms_count", "read", get("/rooms?count=1"), iterations),
+        Scenario("items", "read", get("/items"), iterations),
+        Scenario("items_count", "read", get("/items?count=1"), iterations),
+        Scenario("room_detail", "read",
+                 lambda i: ("GET", f"/rooms/{typical_rooms[i % len(typical_rooms)]}", None), iterations),
+        Scenario("room_detail_storage", "read", get(f"/rooms/{storage_room}"), iterations),
+    ]
+    for field, value in item_filters.items():
+        scenarios.append(Scenario(f"items_filter_{field}", "read", get(f"/items?{field}={value}"), iterations))
+    for field, value in room_filters.items():
+        scenarios.append(Scenario(f"rooms_filter_{field}", "read", get(f"/rooms?{field}={value}"), iterations))
+    for kind, value in searches.items():
+        scenarios.append(Scenario(f"search_{kind}", "read", get(f"/api/search?q={value}"), iterations))
+    scenarios.append(Scenario("autocomplete_inventory_number", "read",
+                              get("/api/search/inventory-numbers?prefix=INV-0001"), iterations))
+
+    scenarios += [
+        Scenario("export_items_xlsx", "export", get("/export-items"), export_iterations),
+        Scenario("export_items_csv", "export", get("/export-items?format=csv"), export_iterations),
+        Scenario("export_items_ndjson", "export", get("/export-items?format=ndjson"), export_iterations),
+        Scenario("export_items_filtered_xlsx", "export", get("/export-items?status=Ремонт"), export_iterations),
+        Scenario("export_rooms_xlsx", "export", get("/export-rooms"), export_iterations),
+        Scenario("export_rooms_csv", "export", get("/export-rooms?format=csv"), export_iterations),
+    ]
+
+    # Изменяющие сценарии идут последними: add_item создает предметы, которые
+    # затем редактируются и удаляются, исходные данные не трогаются
+    def add_item(i):
+        return ("POST", f"/rooms/{item_room}/add_item",
+                {"name": f"Бенчмарк {i}", "inventory_number": f"BENCH-{i:06d}", "status": "Работает"})
+
+    def created(i):
+        cur.execute("SELECT id FROM items WHERE inventory_number = %s", (f"BENCH-{i:06d}",))
+        row = cur.fetchone()
+        return row[0] if row else item_id
+
+    def edit_item(i):
+        return ("POST", f"/items/{created(i)}/edit",
+                {"name": f"Бенчмарк {i} изм.", "inventory_number": f"BENCH-{i:06d}", "status": "Ремонт",
+                 "room_id": str(item_room)})
+
+    def delete_item(i):
+        return ("GET", f"/items/{created(i)}/delete/{item_room}", None)
+
+    def add_room(i):
+        return ("POST", "/rooms/add", {"name": f"Бенчмарк {i}", "number": f"B{i}", "floor": "9",
+                                       "teacher": "", "capacity": "10"})
+
+    def edit_room(i):
+        room_id = typical_rooms[i % len(typical_rooms)]
+        return ("POST", f"/rooms/{room_id}/edit", {"name": f"Кабинет {room_id}", "number": str(room_id),
+                                                   "floor": "1", "teacher": "", "capacity": "30"})
+
+    def bulk_status(i):
+        return ("JSON", "/items/bulk", {"action": "status", "source_room_id": typical_rooms[i % len(typical_rooms)],
+                                        "status": ("Работает", "Ремонт")[i % 2]})
+
+    scenarios += [
+        Scenario("add_item", "write", add_item, iterations),
+        Scenario("edit_item", "write", edit_item, iterations),
+        Scenario("delete_item", "write", delete_item, iterations),
+        Scenario("add_room", "write", add_room, iterations),
+        Scenario("edit_room", "write", edit_room, iterations),
+        Scenario("bulk_status_room", "write", bulk_status, iterations),
+    ]
+    return scenarios
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def perform(client, request):
+    method, path, data = request
+    if method == "JSON":
+        response = client.post(path, json=data)
+    elif method == "POST":
+        response = client.post(path, data=data)
+    else:
+        response = client.get(path)
+    size = len(response.get_data())
+    response.close()
+    return response.status_code, size
+
+
+def run_scenario(client, scenario, warmup):
+    # Прогрев не для изменяющих сценариев: их запросы не повторяемы
+    if scenario.group != "write":
+        for i in range(warmup):
+            perform(client, scenario.requests(i))
+
+    timings = []
+    statuses = {}
+    size = 0
+    for i in range(scenario.iterations):
+        request = scenario.requests(i)
+        request_started = time.perf_counter()
+        status, size = perform(client, request)
+        timings.append(time.perf_counter() - request_started)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    # Пик памяти - отдельным запросом: tracemalloc заметно замедляет выполнение
+    peak_kb = None
+    if scenario.group != "write":
+        tracemalloc.start()
+        perform(client, scenario.requests(0))
+        peak_kb = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+
+    return {
+        "group": scenario.group,
+        "iterations": scenario.iterations,
+        "status_codes": statuses,
+        "response_bytes": size,
+        "p50_ms": round(percentile(timings, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(timings, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.mean(timings) * 1000, 3),
+        "throughput_rps": round(scenario.iterations / sum(timings), 1),
+        "peak_alloc_kb": peak_kb,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nChange vs {baseline_path} ({baseline['meta'].get('commit')}):")
+    print(f"{'scenario':28} {'p50 ms':>16} {'p95 ms':>16} {'req/s':>16}")
+    for name, result in report["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if old is None:
+            print(f"{name:28} {'new':>16}")
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "throughput_rps"):
+            delta = (result[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            cells.append(f"{result[key]:>8} {delta:+6.1f}%")
+        print(f"{name:28} {cells[0]:>16} {cells[1]:>16} {cells[2]:>16}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"),
+                        help="сервер для временной базы; без него поднимается временный кластер")
+    parser.add_argument("--rooms", type=int, default=300)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--export-iterations", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--only", nargs="+", help="запустить только сценарии с этими префиксами")
+    parser.add_argument("--cache", action="store_true", help="не отключать кэш запросов")
+    parser.add_argument("--keep", action="store_true", help="не удалять временную базу")
+    parser.add_argument("--output", help="куда записать JSON-отчет")
+    parser.add_argument("--compare", help="предыдущий JSON-отчет для сравнения")
+    args = parser.parse_args()
+
+    with throwaway_database(args.database_url, args.keep) as dsn:
+        # Приложение должно видеть только временную базу
+        for key in URL_VARIABLES:
+            os.environ.pop(key, None)
+        os.environ["DATABASE_URL"] = dsn
+        os.environ["QUERY_CACHE"] = "1" if args.cache else "0"
+        os.environ.setdefault("SLOW_QUERY_MS", "100000")
+
+        import psycopg2
+
+        import app
+        from migrations import migrate
+
+        conn = psycopg2.connect(dsn)
+        migrate(conn)
+        started = time.perf_counter()
+        load(conn, args.rooms, args.items, args.seed)
+        load_seconds = time.perf_counter() - started
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("SELECT md5(string_agg(concat_ws('|', id, room_id, name, inventory_number, status), ',' "
+                    "ORDER BY id)) FROM items")
+        checksum = cur.fetchone()[0]
+        cur.execute("SHOW server_version")
+        server_version = cur.fetchone()[0]
+
+        app.start_worker()
+        while not app.readiness.ready:
+            time.sleep(0.05)
+        client = app.app.test_client()
+
+        scenarios = build_scenarios(cur, args.iterations, args.export_iterations)
+        if args.only:
+            scenarios = [s for s in scenarios if s.name.startswith(tuple(args.only))]
+
+        results = {}
+        for scenario in scenarios:
+            results[scenario.name] = run_scenario(client, scenario, args.warmup)
+            r = results[scenario.name]
+            print(f"{scenario.name:28} p50 {r['p50_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  "
+                  f"p99 {r['p99_ms']:9.2f} ms  {r['throughput_rps']:8.1f} req/s  "
+                  f"peak {r['peak_alloc_kb'] if r['peak_alloc_kb'] is not None else '-'} KB", flush=True)
+        cur.close()
+        conn.close()
+        app.stop_worker()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "postgres": server_version,
+            "rooms": args.rooms,
+            "items": args.items,
+            "seed": args.seed,
+            "data_checksum": checksum,
+            "data_load_seconds": round(load_seconds, 2),
+            "iterations": args.iterations,
+            "export_iterations": args.export_iterations,
+            "query_cache": args.cache,
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Report written to {args.output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
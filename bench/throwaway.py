@@ -0,0 +1,69 @@
+"""Временная база Postgres для замеров: создается перед запуском и удаляется после.
+
+Два режима:
+  - на существующем сервере (URL с правом CREATE DATABASE) создается база
+    bench_<случайный суффикс>;
+  - без сервера поднимается временный кластер через initdb/pg_ctl из PATH
+    (или каталога PG_BIN) в temp-каталоге, соединение через unix-сокет.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.extensions import make_dsn, parse_dsn
+
+
+def _pg_binary(name):
+    directory = os.environ.get("PG_BIN")
+    path = os.path.join(directory, name) if directory else shutil.which(name)
+    if not path or not os.path.exists(path):
+        raise RuntimeError(f"{name} не найден: укажите --database-url или каталог PG_BIN")
+    return path
+
+
+@contextmanager
+def temporary_cluster():
+    directory = tempfile.mkdtemp(prefix="bench_pg_")
+    data = os.path.join(directory, "data")
+    try:
+        subprocess.run([_pg_binary("initdb"), "-D", data, "-U", "postgres", "--auth=trust",
+                        "--encoding=UTF8", "--locale=C.UTF-8"], check=True, capture_output=True)
+        subprocess.run([_pg_binary("pg_ctl"), "-D", data, "-l", os.path.join(directory, "log"), "-w",
+                        "-o", f"-k {directory} -h '' -c fsync=off", "start"], check=True, capture_output=True)
+        try:
+            yield make_dsn(dbname="postgres", user="postgres", host=directory)
+        finally:
+            subprocess.run([_pg_binary("pg_ctl"), "-D", data, "-m", "immediate", "stop"], capture_output=True)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextmanager
+def throwaway_database(server_url=None, keep=False):
+    if server_url is None:
+        with temporary_cluster() as cluster_url:
+            with throwaway_database(cluster_url, keep) as url:
+                yield url
+        return
+
+    name = f"bench_{uuid.uuid4().hex[:8]}"
+    admin = psycopg2.connect(server_url)
+    admin.autocommit = True
+    cur = admin.cursor()
+    cur.execute(f"CREATE DATABASE {name}")
+    params = parse_dsn(server_url)
+    params["dbname"] = name
+    try:
+        yield make_dsn(**params)
+    finally:
+        if keep:
+            print(f"Benchmark database kept: {name}")
+        else:
+            cur.execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = %s", (name,))
+            cur.execute(f"DROP DATABASE IF EXISTS {name}")
+        cur.close()
+        admin.close()
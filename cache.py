@@ -0,0 +1,222 @@
+import json
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+import psycopg2
+
+from db import REPLICA_CHECK_INTERVAL, REPLICA_MAX_LAG, get_database_url, replicas, wrote_to_primary
+
+# --- Кэш результатов запросов ---
+# LRU с TTL внутри процесса. Каждая запись помечена тегами ("rooms" - списки
+# кабинетов, "items" - списки инвентаря, "room:<id>" - страница кабинета,
+# "room" - все страницы кабинетов); изменяющие маршруты сбрасывают только
+# записи со своими тегами.
+
+QUERY_CACHE_ENABLED = os.environ.get("QUERY_CACHE", "1") != "0"
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 512))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", 30))
+# Сброс кэша в других процессах через LISTEN/NOTIFY. Без него запись сбросила
+# бы кэш только своего процесса, а остальные до QUERY_CACHE_TTL отдавали бы
+# старые страницы; gunicorn.conf.py выключает его при одном рабочем процессе
+QUERY_CACHE_NOTIFY = os.environ.get("QUERY_CACHE_NOTIFY", "1") == "1"
+NOTIFY_CHANNEL = "inventory_cache"
+# С репликами чтение сразу после записи может вернуть старые данные: пока
+# реплики могли не догнать сброс тега, его записи в кэш не кладутся
+QUERY_CACHE_SETTLE = REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL if replicas.replicas else 0.0
+
+# Запрос клиента, который только что записал (cookie после записи, см.
+# app.pin_primary_after_write): кэш не читается, результат кладется заново.
+# NOTIFY доходит до других процессов не мгновенно, а страница после redirect
+# может попасть в любой из них
+fresh_reads = ContextVar("fresh_reads", default=False)
+
+
+class QueryCache:
+    def __init__(self, max_entries=512, ttl=30.0, enabled=True, settle=0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.settle = settle
+        self._entries = OrderedDict()   # key -> (expires_at, tags, value)
+        self._tags = {}                 # tag -> set(key)
+        self._generations = {}          # tag -> счетчик сбросов
+        self._invalidated_at = {}       # tag -> время последнего сброса (при settle)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.unsettled = 0
+
+    def _remove(self, key):
+        _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, tags, generations=None):
+        with self._lock:
+            # Пока значение читалось из БД, его теги могли сбросить - тогда оно устарело
+            if generations is not None and generations != self._tag_generations(tags):
+                return
+            if self.settle and self._unsettled(tags):
+                self.unsettled += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, tuple(tags), value)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _tag_generations(self, tags):
+        return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def _unsettled(self, tags):
+        since = time.monotonic() - self.settle
+        return any(self._invalidated_at.get(tag, since) > since for tag in tags)
+
+    def get_or_load(self, key, tags, loader):
+        if not self.enabled:
+            return loader()
+        value = None if fresh_reads.get() else self.get(key)
+        if value is None:
+            with self._lock:
+                generations = self._tag_generations(tags)
+            value = loader()
+            self.set(key, value, tags, generations)
+        return value
+
+    async def get_or_load_async(self, key, tags, loader):
+        # То же для асинхронных маршрутов (asgi.py): loader - корутина.
+        # Кэш общий с синхронными маршрутами того же процесса
+        if not self.enabled:
+            return await loader()
+        value = None if fresh_reads.get() else self.get(key)
+        if value is None:
+            with self._lock:
+                generations = self._tag_generations(tags)
+            value = await loader()
+            self.set(key, value, tags, generations)
+        return value
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                if self.settle:
+                    self._invalidated_at[tag] = time.monotonic()
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for tag in self._tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "skipped_unsettled": self.unsettled,
+                "cross_worker_notify": QUERY_CACHE_NOTIFY,
+            }
+
+
+query_cache = QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL, QUERY_CACHE_ENABLED, QUERY_CACHE_SETTLE)
+
+
+def cache_key(namespace, args, extra=()):
+    # Нормализованный ключ: пустые параметры отбрасываются, порядок не важен
+    return (namespace, tuple(extra), tuple(sorted((k, v) for k, v in args.items() if v)))
+
+
+# --- Сброс после изменений ---
+def commit_and_invalidate(conn, cur, *tags):
+    # NOTIFY уходит в той же транзакции и доставляется только после COMMIT;
+    # локальный кэш сбрасывается после COMMIT, чтобы параллельный запрос не
+    # успел положить туда старые данные
+    if QUERY_CACHE_NOTIFY and tags:
+        cur.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, json.dumps(tags)))
+    conn.commit()
+    wrote_to_primary.set(True)
+    query_cache.invalidate(tags)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _listen_forever():
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(get_database_url())
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            # Пока не были подписаны, могли пропустить уведомления
+            query_cache.clear()
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    query_cache.invalidate(json.loads(notify.payload))
+        except Exception as e:
+            print(f"Cache invalidation listener error: {e}")
+            time.sleep(5)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def start_invalidation_listener():
+    # Поток запускается в каждом рабочем процессе (после fork) при первом запросе
+    global _listener
+    if not (QUERY_CACHE_ENABLED and QUERY_CACHE_NOTIFY) or _listener is not None:
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen_forever, name="cache-listener", daemon=True)
+            _listener.start()
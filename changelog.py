@@ -0,0 +1,268 @@
+import os
+import random
+import threading
+import time
+
+from db import db_connection
+from migrations import readiness
+
+# --- Инкрементальная синхронизация по журналу изменений ---
+# Внешняя система (бухгалтерия основных средств) один раз берет полную
+# выгрузку и текущую позицию журнала (head), а дальше забирает только
+# изменения: GET /api/changes?since=<seq>. Журнал ведут триггеры
+# (schema.create_change_log); записи отдаются только ниже границы, за которой
+# еще может зафиксироваться транзакция с меньшим seq, так что курсор since
+# ничего не пропускает. Каждая запись приходит вместе с
+# текущим состоянием строки (null - строка удалена), поэтому записи
+# применяются идемпотентно: insert/update - как upsert, delete - как удаление.
+# Изменение названия или номера кабинета приходит записью кабинета, а не
+# записями всех его предметов.
+#
+# Журнал сжимается: у строки остается только последняя запись, колонки
+# прежних записей добавляются в нее (update после insert становится insert).
+# Записи старше CHANGE_LOG_RETENTION удаляются; потребитель с курсором до
+# удаленной части получает 410 и начинает с полной выгрузки.
+
+CHANGE_FEED_LIMIT = int(os.environ.get("CHANGE_FEED_LIMIT", 1000))
+CHANGE_FEED_MAX_LIMIT = int(os.environ.get("CHANGE_FEED_MAX_LIMIT", 10000))
+CHANGE_LOG_RETENTION = float(os.environ.get("CHANGE_LOG_RETENTION", 30 * 24 * 3600))
+# Записи моложе этого не сжимаются: идущая синхронизация видит их как есть
+CHANGE_LOG_COMPACT_AFTER = float(os.environ.get("CHANGE_LOG_COMPACT_AFTER", 3600))
+# 0 - фоновое сжатие выключено (тогда `flask compact-changes` по расписанию)
+CHANGE_LOG_COMPACT_INTERVAL = float(os.environ.get("CHANGE_LOG_COMPACT_INTERVAL", 3600))
+# Записей на транзакцию при удалении и сжатии: блокировки держатся недолго
+CHANGE_LOG_BATCH = int(os.environ.get("CHANGE_LOG_BATCH", 10000))
+# Сжатие выполняет один процесс за раз (advisory-блокировка уровня сессии)
+CHANGE_LOG_COMPACT_LOCK_KEY = 0x1D0_C4A7
+
+
+class ChangeLogPurged(Exception):
+    def __init__(self, purged_through):
+        super().__init__(f"Журнал изменений до {purged_through} удален, нужна полная выгрузка")
+        self.purged_through = purged_through
+
+
+def feed_limit(args):
+    try:
+        value = int(args.get("limit", CHANGE_FEED_LIMIT))
+    except (TypeError, ValueError):
+        value = CHANGE_FEED_LIMIT
+    return max(1, min(value, CHANGE_FEED_MAX_LIMIT))
+
+
+# --- Чтение журнала ---
+# Записи отдаются только ниже границы change_log_watermark() (schema.py): выше
+# нее еще может зафиксироваться транзакция с меньшим seq. Граница берется
+# отдельным оператором до чтения записей - снимок записей (READ COMMITTED)
+# тогда не старше границы. Поэтому журнал читается с основной базы: на
+# реплике не видно блокировок пишущих транзакций.
+# Граница удаленной части, head и страница записей со строками читаются одним
+# запросом, то есть в одном снимке: сжатие между ними ничего не спрячет
+CHANGE_LOG_WATERMARK_SQL = "SELECT change_log_watermark()"
+CHANGE_LOG_HEAD_SQL = "SELECT GREATEST(%s::bigint - 1, purged_through) FROM change_log_state"
+CHANGE_FEED_SQL = f"""
+    WITH page AS (
+        SELECT seq, table_name, op, row_id, changed_columns, changed_at
+        FROM change_log
+        WHERE seq > %s AND seq < %s
+        ORDER BY seq
+        LIMIT %s
+    )
+    SELECT (SELECT purged_through FROM change_log_state),
+           ({CHANGE_LOG_HEAD_SQL}),
+           (SELECT json_agg(json_build_object(
+                       'seq', page.seq, 'table', page.table_name, 'op', page.op, 'id', page.row_id,
+                       'changed_columns', page.changed_columns, 'changed_at', page.changed_at,
+                       'row', CASE page.table_name
+                           WHEN 'items' THEN (
+                               SELECT json_build_object('id', items.id, 'inventory_number', items.inventory_number,
+                                                        'name', items.name, 'status', items.status,
+                                                        'room_id', items.room_id, 'room_name', rooms.name,
+                                                        'room_number', rooms.number)
+                               FROM items LEFT JOIN rooms ON rooms.id = items.room_id
+                               WHERE items.id = page.row_id)
+                           WHEN 'rooms' THEN (
+                               SELECT json_build_object('id', rooms.id, 'name', rooms.name, 'number', rooms.number,
+                                                        'floor', rooms.floor, 'teacher', rooms.teacher,
+                                                        'capacity', rooms.capacity)
+                               FROM rooms
+                               WHERE rooms.id = page.row_id)
+                       END) ORDER BY page.seq)
+            FROM page)"""
+
+
+def change_log_watermark(cur):
+    cur.execute(CHANGE_LOG_WATERMARK_SQL)
+    return cur.fetchone()[0]
+
+
+def change_log_head(cur):
+    cur.run(CHANGE_LOG_HEAD_SQL, (change_log_watermark(cur),))
+    return cur.fetchone()[0]
+
+
+def fetch_changes(cur, since, limit=CHANGE_FEED_LIMIT):
+    watermark = change_log_watermark(cur)
+    cur.run(CHANGE_FEED_SQL, (since, watermark, limit + 1, watermark))
+    purged_through, head, changes = cur.fetchone()
+    if since < purged_through:
+        raise ChangeLogPurged(purged_through)
+    changes = changes or []
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    return {
+        "changes": changes,
+        "next_since": changes[-1]["seq"] if changes else since,
+        "has_more": has_more,
+        "head": head,
+    }
+
+
+# --- Сжатие и срок хранения ---
+# Последняя запись каждой строки из диапазона остается, прежние (в том числе
+# из уже сжатой части) удаляются, а их колонки переносятся в нее
+COMPACT_SQL = """
+    WITH touched AS (
+        SELECT table_name, row_id, max(seq) AS latest
+        FROM change_log
+        WHERE seq > %(after)s AND seq <= %(upto)s AND row_id IS NOT NULL
+        GROUP BY table_name, row_id
+    ), superseded AS (
+        DELETE FROM change_log c
+        USING touched t
+        WHERE c.table_name = t.table_name AND c.row_id = t.row_id AND c.seq < t.latest
+        RETURNING t.latest, c.op, c.changed_columns
+    ), merged AS (
+        SELECT latest, bool_or(op = 'insert') AS inserted, array_agg(col) FILTER (WHERE col IS NOT NULL) AS columns
+        FROM superseded LEFT JOIN LATERAL unnest(changed_columns) AS col ON true
+        GROUP BY latest
+    ), updated AS (
+        UPDATE change_log l
+        SET op = CASE WHEN l.op = 'update' AND m.inserted THEN 'insert' ELSE l.op END,
+            changed_columns = CASE WHEN l.op = 'delete' THEN NULL
+                                   ELSE ARRAY(SELECT DISTINCT unnest(l.changed_columns || m.columns) ORDER BY 1)
+                              END
+        FROM merged m
+        WHERE l.seq = m.latest
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM superseded), (SELECT count(*) FROM updated)"""
+
+
+def _boundary(cur, after, age, watermark):
+    # Последний seq после after, старше age секунд. Ниже границы журнала
+    # записи уже не появятся, поэтому поиск идет до первой записи моложе age
+    # и не дальше границы
+    cur.execute("""SELECT seq FROM change_log
+                   WHERE seq > %s AND changed_at >= now() - make_interval(secs => %s)
+                   ORDER BY seq LIMIT 1""", (after, age))
+    row = cur.fetchone()
+    if row is not None:
+        return min(row[0], watermark) - 1
+    cur.execute("SELECT COALESCE(max(seq), 0) FROM change_log WHERE seq < %s", (watermark,))
+    return max(after, cur.fetchone()[0])
+
+
+def compact_change_log(conn, retention=CHANGE_LOG_RETENTION, compact_after=CHANGE_LOG_COMPACT_AFTER,
+                       batch=CHANGE_LOG_BATCH):
+    # None - сжатие уже идет в другом процессе
+    cur = conn.cursor()
+    cur.execute("SELECT pg_try_advisory_lock(%s)", (CHANGE_LOG_COMPACT_LOCK_KEY,))
+    if not cur.fetchone()[0]:
+        conn.rollback()
+        return None
+    result = {"purged": 0, "compacted": 0, "merged": 0}
+    try:
+        cur.execute("SELECT purged_through, compacted_through FROM change_log_state")
+        purged_through, compacted_through = cur.fetchone()
+        watermark = change_log_watermark(cur)
+
+        bound = _boundary(cur, purged_through, retention, watermark)
+        while purged_through < bound:
+            upto = min(purged_through + batch, bound)
+            cur.execute("DELETE FROM change_log WHERE seq > %s AND seq <= %s", (purged_through, upto))
+            result["purged"] += cur.rowcount
+            cur.execute("UPDATE change_log_state SET purged_through = %s", (upto,))
+            conn.commit()
+            purged_through = upto
+
+        compacted_through = max(compacted_through, purged_through)
+        bound = _boundary(cur, compacted_through, compact_after, watermark)
+        while compacted_through < bound:
+            upto = min(compacted_through + batch, bound)
+            cur.execute(COMPACT_SQL, {"after": compacted_through, "upto": upto})
+            compacted, merged = cur.fetchone()
+            result["compacted"] += compacted
+            result["merged"] += merged
+            cur.execute("UPDATE change_log_state SET compacted_through = %s", (upto,))
+            conn.commit()
+            compacted_through = upto
+    finally:
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_unlock(%s)", (CHANGE_LOG_COMPACT_LOCK_KEY,))
+        conn.commit()
+        cur.close()
+    return result
+
+
+class ChangeLogCompactor:
+    # Фоновый поток в каждом рабочем процессе; сжимает тот, кто первым взял блокировку
+    def __init__(self, interval=3600.0):
+        self.interval = interval
+        self.runs = 0
+        self.purged = 0
+        self.compacted = 0
+        self.last_run_at = None
+        self.last_error = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="change-log-compactor", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # Первый проход со случайной задержкой: процессы стартуют одновременно
+        delay = self.interval * random.uniform(0.1, 1.0)
+        while not self._stop.wait(delay):
+            delay = self.interval
+            if readiness.ready:
+                self.run_once()
+
+    def run_once(self):
+        try:
+            with db_connection() as conn:
+                result = compact_change_log(conn)
+        except Exception as e:
+            self.last_error = str(e).strip()
+            print(f"Change log compaction failed: {self.last_error}")
+            return None
+        self.last_error = None
+        if result is not None:
+            self.runs += 1
+            self.purged += result["purged"]
+            self.compacted += result["compacted"]
+            self.last_run_at = time.time()
+        return result
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "purged": self.purged,
+            "compacted": self.compacted,
+            "last_run_at": self.last_run_at,
+            "last_error": self.last_error,
+        }
+
+
+change_log_compactor = ChangeLogCompactor(CHANGE_LOG_COMPACT_INTERVAL)
@@ -0,0 +1,306 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import zlib
+
+from flask import request, send_from_directory
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# --- Сжатие ответов ---
+# Таблицы списков (сотни одинаковых строк разметки), CSV/NDJSON-выгрузки и
+# JSON сжимаются в разы. Кодировка выбирается по Accept-Encoding: zstd и br,
+# если установлены zstandard и brotli, иначе gzip. Не сжимаются ответы меньше
+# COMPRESS_MIN_SIZE, уже сжатые (XLSX - это zip, precompressed-статика),
+# частичные и с Cache-Control: no-transform. Потоковые ответы сжимаются по
+# кускам: каждый кусок сразу отдается клиенту (flush), выгрузка не копится
+# в памяти.
+
+COMPRESS_ENABLED = os.environ.get("COMPRESS", "1") != "0"
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+# Ответ известной длины до этого размера сжимается целиком и получает
+# Content-Length; больший (файл фоновой выгрузки) - потоком
+COMPRESS_BUFFER_MAX = int(os.environ.get("COMPRESS_BUFFER_MAX", 1024 * 1024))
+# Уровни для сжатия на лету: дешевле по CPU, чем максимальные
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 4))
+ZSTD_LEVEL = int(os.environ.get("COMPRESS_ZSTD_LEVEL", 3))
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/javascript",
+                      "image/svg+xml")
+# В порядке предпочтения сервера при равном q у клиента
+ENCODINGS = tuple(encoding for encoding, available in (("zstd", zstandard is not None),
+                                                       ("br", brotli is not None),
+                                                       ("gzip", True)) if available)
+SUFFIXES = {"zstd": ".zst", "br": ".br", "gzip": ".gz"}
+SKIP_STATUSES = (204, 206, 304)
+
+
+class Compressor:
+    # Единый интерфейс над zlib, brotli и zstandard: compress() на кусок,
+    # flush() - отдать все накопленное, finish() - конец потока
+    def __init__(self, encoding, level=None):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._obj = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._obj = brotli.Compressor(quality=BROTLI_QUALITY if level is None else level)
+        else:
+            self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL if level is None else level).compressobj()
+
+    def compress(self, data):
+        if self.encoding == "br":
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def flush(self):
+        if self.encoding == "gzip":
+            return self._obj.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._obj.flush()
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        if self.encoding == "br":
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def negotiate(accept_encoding, available=ENCODINGS):
+    # Кодировка с наибольшим q у клиента; None - отдавать как есть
+    if not accept_encoding:
+        return None
+    accept = parse_accept_header(accept_encoding)
+    best, best_quality = None, 0
+    for encoding in available:
+        quality = accept.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compressible(status, headers):
+    # headers - список пар (имя, значение) как в WSGI/ASGI
+    values = {name.lower(): value for name, value in headers}
+    if status in SKIP_STATUSES or "content-encoding" in values or "content-range" in values:
+        return False
+    if "no-transform" in values.get("cache-control", ""):
+        return False
+    if not values.get("content-type", "").startswith(COMPRESSIBLE_TYPES):
+        return False
+    length = values.get("content-length")
+    return length is None or int(length) >= COMPRESS_MIN_SIZE
+
+
+def compressed_headers(headers, encoding, length=None):
+    # Длина меняется, а сильный ETag описывает именно несжатые байты
+    result = []
+    for name, value in headers:
+        lowered = name.lower()
+        if lowered == "content-length" or lowered == "vary" and value.lower() == "accept-encoding":
+            continue
+        if lowered == "etag" and not value.startswith("W/"):
+            value = "W/" + value
+        result.append((name, value))
+    result += [("content-encoding", encoding), ("vary", "Accept-Encoding")]
+    if length is not None:
+        result.append(("content-length", str(length)))
+    return result
+
+
+def compress_chunks(chunks, encoding):
+    compressor = Compressor(encoding)
+    try:
+        for chunk in chunks:
+            if chunk:
+                data = compressor.compress(chunk) + compressor.flush()
+                if data:
+                    yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+async def compress_async_chunks(chunks, encoding):
+    # То же для асинхронного пути (asgi.py)
+    compressor = Compressor(encoding)
+    try:
+        async for chunk in chunks:
+            if chunk:
+                data = compressor.compress(chunk) + compressor.flush()
+                if data:
+                    yield data
+        yield compressor.finish()
+    finally:
+        await chunks.aclose()
+
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        encoding = None
+        if environ["REQUEST_METHOD"] != "HEAD":
+            encoding = negotiate(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return self.app(environ, start_response)
+
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            if exc_info is not None and captured:
+                raise exc_info[1].with_traceback(exc_info[2])
+            captured[:] = [status, headers]
+            return self._write_unsupported
+
+        body = self.app(environ, capture)
+        status, headers = captured
+        if not compressible(int(status.split(" ", 1)[0]), headers):
+            start_response(status, headers)
+            return body
+
+        length = next((int(value) for name, value in headers if name.lower() == "content-length"), None)
+        if length is not None and length <= COMPRESS_BUFFER_MAX:
+            try:
+                data = b"".join(body)
+            finally:
+                close = getattr(body, "close", None)
+                if close is not None:
+                    close()
+            compressor = Compressor(encoding)
+            data = compressor.compress(data) + compressor.finish()
+            start_response(status, compressed_headers(headers, encoding, len(data)))
+            return [data]
+
+        start_response(status, compressed_headers(headers, encoding))
+        return compress_chunks(body, encoding)
+
+    @staticmethod
+    def _write_unsupported(data):
+        raise RuntimeError("write() is not supported by CompressionMiddleware")
+
+
+# --- Предварительно сжатая статика ---
+# `flask --app app compress-static` (при сборке, bin/post_compile) кладет
+# рядом с файлами static/ их .gz, .br и .zst с максимальным сжатием. Статика
+# отдается в подходящей клиенту кодировке (без копий - как есть), а ссылки
+# url_for("static", ...) получают ?v=<хеш содержимого>: такой адрес
+# меняется вместе с файлом и кэшируется браузером на год.
+
+STATIC_SUFFIXES = (".css", ".js", ".svg", ".html", ".txt", ".json", ".map")
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+
+def precompress(path):
+    # Возвращает список записанных файлов; свежие и бесполезные пропускаются
+    with open(path, "rb") as f:
+        data = f.read()
+    mtime = os.path.getmtime(path)
+    written = []
+    for encoding in ENCODINGS:
+        target = path + SUFFIXES[encoding]
+        if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+            continue
+        if encoding == "gzip":
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        elif encoding == "br":
+            compressed = brotli.compress(data, quality=11)
+        else:
+            compressed = zstandard.ZstdCompressor(level=19).compress(data)
+        if len(compressed) >= len(data):
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        with open(target + ".tmp", "wb") as f:
+            f.write(compressed)
+        os.replace(target + ".tmp", target)
+        written.append(target)
+    return written
+
+
+def precompressed(path):
+    # Кодировки, для которых есть сжатая копия не старше исходного файла
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return ()
+    available = []
+    for encoding in ENCODINGS:
+        try:
+            if os.path.getmtime(path + SUFFIXES[encoding]) >= mtime:
+                available.append(encoding)
+        except OSError:
+            pass
+    return tuple(available)
+
+
+def compress_static(folder):
+    written = []
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if name.endswith(STATIC_SUFFIXES):
+                written += precompress(os.path.join(root, name))
+    return written
+
+
+_static_versions = {}   # (путь, mtime) -> хеш содержимого
+
+
+def static_version(folder, filename):
+    path = os.path.join(folder, filename)
+    try:
+        key = (path, os.path.getmtime(path))
+    except OSError:
+        return None
+    version = _static_versions.get(key)
+    if version is None:
+        with open(path, "rb") as f:
+            version = hashlib.sha1(f.read()).hexdigest()[:12]
+        _static_versions[key] = version
+    return version
+
+
+def install(app):
+    if COMPRESS_ENABLED:
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app)
+
+    @app.url_defaults
+    def version_static_urls(endpoint, values):
+        if endpoint == "static" and "v" not in values:
+            version = static_version(app.static_folder, values.get("filename", ""))
+            if version is not None:
+                values["v"] = version
+
+    def send_static(filename):
+        folder = app.static_folder
+        available = precompressed(os.path.join(folder, filename)) if COMPRESS_ENABLED else ()
+        encoding = negotiate(request.headers.get("Accept-Encoding", ""), available)
+        if encoding is None:
+            response = send_from_directory(folder, filename)
+        else:
+            response = send_from_directory(folder, filename + SUFFIXES[encoding],
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.headers["Content-Encoding"] = encoding
+        if COMPRESS_ENABLED:
+            response.vary.add("Accept-Encoding")
+        if request.args.get("v"):
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
+
+    app.view_functions["static"] = send_static
@@ -0,0 +1,996 @@
+import contextvars
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extensions import make_dsn, parse_dsn
+
+from metrics import METRICS_ENABLED, TimedCursor, label_prepared
+
+
+# --- Конфигурация подключения ---
+# Строка подключения определяется один раз при старте (или явно через
+# reload_database_config() при ротации пароля), а не на каждое соединение.
+# DATABASE_ENV_FILE - необязательный файл с теми же переменными (KEY=VALUE по
+# строке), его значения важнее окружения процесса. Окружение работающего
+# процесса снаружи не поменять, а файл с секретами при ротации - можно: его
+# перечитывает reload_database_config() (см. DatabaseConfigWatcher ниже).
+DATABASE_ENV_FILE = os.environ.get('DATABASE_ENV_FILE', '')
+
+
+def database_environ():
+    environ = dict(os.environ)
+    if DATABASE_ENV_FILE:
+        with open(DATABASE_ENV_FILE, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                key, value = line.split("=", 1)
+                environ[key.strip()] = value.strip().strip("'\"")
+    return environ
+
+
+class DatabaseConfig:
+    __slots__ = ("params", "source", "dsn")
+
+    def __init__(self, params, source):
+        object.__setattr__(self, "params", tuple(sorted(params.items())))
+        object.__setattr__(self, "source", source)
+        object.__setattr__(self, "dsn", make_dsn(**params))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("DatabaseConfig is immutable")
+
+    @property
+    def safe_url(self):
+        # Для логов и /debug: без пароля
+        params = dict(self.params)
+        host = params.get("host", "")
+        if params.get("port"):
+            host += f":{params['port']}"
+        return f"postgresql://{params.get('user', '')}:***@{host}/{params.get('dbname', '')}"
+
+
+def _env_database_url(environ):
+    # Если нет отдельных переменных, пробуем DATABASE_PUBLIC_URL,
+    # потом обычный DATABASE_URL, потом другие возможные имена
+    for key in ('DATABASE_PUBLIC_URL', 'DATABASE_URL', 'POSTGRESQL_URL', 'POSTGRES_URL'):
+        if environ.get(key):
+            return key, environ[key]
+    return None, None
+
+
+def load_database_config(environ=None):
+    if environ is None:
+        environ = database_environ()
+    # Сначала пробуем собрать параметры из отдельных переменных (самый надежный способ)
+    pg_user = environ.get('PGUSER') or environ.get('POSTGRES_USER')
+    pg_password = environ.get('PGPASSWORD') or environ.get('POSTGRES_PASSWORD')
+    pg_host = environ.get('PGHOST')
+    pg_port = environ.get('PGPORT')
+    pg_database = environ.get('PGDATABASE') or environ.get('POSTGRES_DB')
+
+    if all([pg_user, pg_password, pg_host, pg_port, pg_database]):
+        return DatabaseConfig({
+            'user': pg_user,
+            'password': pg_password,
+            'host': pg_host,
+            'port': pg_port,
+            'dbname': pg_database,
+        }, source="PG* variables")
+
+    source, database_url = _env_database_url(environ)
+    if not database_url:
+        # Для отладки выведем все переменные среды связанные с БД
+        db_vars = {}
+        for key in environ.keys():
+            if any(db_word in key.upper() for db_word in ['DATABASE', 'POSTGRES', 'PG']):
+                value = environ[key]
+                if 'PASSWORD' in key.upper():
+                    value = '***HIDDEN***'
+                db_vars[key] = value
+        print("Available database environment variables:", db_vars)
+        raise Exception("No database connection string found in environment variables")
+
+    # Исправляем URL для psycopg2
+    if database_url.startswith("postgres://"):
+        database_url = database_url.replace("postgres://", "postgresql://", 1)
+
+    try:
+        params = parse_dsn(database_url)
+    except psycopg2.ProgrammingError as e:
+        raise Exception(f"Invalid database connection string in {source}: {e}")
+    if not params.get('dbname'):
+        raise Exception(f"Database name is missing in {source}")
+    return DatabaseConfig(params, source=source)
+
+
+_config = None
+_config_lock = threading.Lock()
+
+
+def get_database_config():
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                _config = load_database_config()
+                print(f"Using database URL from {_config.source}: {_config.safe_url}")
+    return _config
+
+
+_reload_callbacks = []
+
+
+def on_database_reload(callback):
+    # Для пулов вне этого модуля (AsyncConnectionPool в asgi.py)
+    _reload_callbacks.append(callback)
+
+
+def reload_database_config():
+    # Перечитываем окружение и DATABASE_ENV_FILE (ротация учетных данных).
+    # Новые соединения всех пулов - основной базы, реплик и асинхронных -
+    # пойдут с новыми параметрами; свободные старые закрываются сразу,
+    # занятые - при возврате в пул.
+    global _config
+    environ = database_environ()
+    config = load_database_config(environ)
+    replica_configs = load_replica_configs(environ)
+    with _config_lock:
+        _config = config
+    print(f"Reloaded database URL from {config.source}: {config.safe_url}")
+    if _pool is not None:
+        _pool.drain()
+    replicas.reload(replica_configs)
+    for callback in _reload_callbacks:
+        try:
+            callback()
+        except Exception as e:
+            print(f"Database reload callback failed: {e}")
+    return config
+
+
+def get_database_url():
+    return get_database_config().dsn
+
+
+# Без таймаута подключение к недоступному хосту может висеть минутами
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 5))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# --- Пул соединений ---
+# Соединения открываются лениво и переиспользуются между запросами,
+# чтобы не платить за TCP/TLS/аутентификацию на каждом обращении к БД.
+class ConnectionPool:
+    def __init__(self, dsn_factory, minconn=1, maxconn=10, timeout=10.0, check_idle=30.0, connect_kwargs=None):
+        self.dsn_factory = dsn_factory
+        self.connect_kwargs = connect_kwargs or {}
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        # Соединения, простоявшие дольше check_idle секунд, проверяются SELECT 1
+        self.check_idle = check_idle
+
+        self._idle = []          # [(conn, время возврата в пул)]
+        self._in_use = set()
+        self._stale = set()      # выданы до drain(): закрываются при возврате
+        self._size = 0           # всего открытых соединений (свободных и занятых)
+        self._closed = False
+        self._cond = threading.Condition()
+
+        # Счетчики для /debug
+        self.checkouts = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _connect(self):
+        return psycopg2.connect(self.dsn_factory(), connect_timeout=DB_CONNECT_TIMEOUT, **self.connect_kwargs)
+
+    def fill(self):
+        # Заранее открываем minconn соединений
+        while True:
+            with self._cond:
+                if self._size >= self.minconn:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_idle:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("Пул соединений закрыт")
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            f"Нет свободных соединений с БД за {self.timeout} с (max={self.maxconn})")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    conn, idle_since = None, None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, idle_since):
+                self._discard(conn)
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._in_use.add(conn)
+                self.checkouts += 1
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+            return conn
+
+    def putconn(self, conn):
+        # Незавершенная транзакция откатывается, сломанное соединение выбрасывается
+        with self._cond:
+            self._in_use.discard(conn)
+            stale = conn in self._stale
+            self._stale.discard(conn)
+        broken = conn.closed
+        if not broken and not stale and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken or stale or self._closed:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self.discarded += 1
+            self._cond.notify()
+
+    def drain(self):
+        # Закрываем свободные соединения, занятые - когда их вернут. Новые
+        # открываются как обычно, через dsn_factory
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._stale |= self._in_use
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            in_use = self._size - len(self._idle)
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "utilisation": round(in_use / self.maxconn, 3) if self.maxconn else 0.0,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "discarded": self.discarded,
+                "wait_time_avg_ms": round(self.wait_time_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_time_max_ms": round(self.wait_time_max * 1000, 3),
+            }
+
+
+# --- Подготовленные запросы и записи ---
+# Частые запросы готовятся на сервере (PREPARE) один раз на соединение и
+# дальше выполняются через EXECUTE: Postgres не разбирает и не планирует их
+# заново. Имя оператора - хэш текста, поэтому одинаковый SQL из разных
+# обработчиков (и разные сочетания фильтров) готовится по одному разу.
+# DB_PREPARED_STATEMENTS=0 выключает подготовку (например, за pgbouncer
+# в режиме transaction, где оператор может оказаться на чужом соединении).
+DB_PREPARED_STATEMENTS = int(os.environ.get('DB_PREPARED_STATEMENTS', 64))
+
+_PLACEHOLDER_RE = re.compile(r"%[s%]")
+_statements = {}
+
+
+def _prepared_statement(sql):
+    # (имя, PREPARE ..., EXECUTE ...) для текста с плейсхолдерами %s
+    statement = _statements.get(sql)
+    if statement is not None:
+        return statement
+    count = 0
+
+    def number(match):
+        nonlocal count
+        if match.group() == "%%":
+            return "%"
+        count += 1
+        return f"${count}"
+
+    body = _PLACEHOLDER_RE.sub(number, sql)
+    name = "q_" + hashlib.sha1(sql.encode("utf-8")).hexdigest()[:16]
+    execute = f"EXECUTE {name}" + (f" ({', '.join(['%s'] * count)})" if count else "")
+    statement = (name, f"PREPARE {name} AS {body}", execute)
+    if METRICS_ENABLED:
+        label_prepared(name, sql)
+    if len(_statements) < 1000:
+        _statements[sql] = statement
+    return statement
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    # Помнит, какие операторы уже подготовлены в этой сессии
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = OrderedDict()
+
+
+class RecordCursor(TimedCursor if METRICS_ENABLED else psycopg2.extensions.cursor):
+    # cur.run(sql, params, record=Room) - строки отдаются готовыми записями
+    # (namedtuple из queries.py), без промежуточных словарей
+    record = None
+
+    def execute(self, sql, params=None):
+        self.record = None
+        return super().execute(sql, params)
+
+    def run(self, sql, params=(), record=None, prepare=True):
+        prepared = getattr(self.connection, "prepared", None)
+        # Серверный курсор (DECLARE ... CURSOR) нельзя объявить над EXECUTE
+        if not prepare or prepared is None or not DB_PREPARED_STATEMENTS or self.name is not None:
+            self.execute(sql, params)
+        else:
+            name, prepare_sql, execute_sql = _prepared_statement(sql)
+            if name in prepared:
+                prepared.move_to_end(name)
+            else:
+                self.execute(prepare_sql)
+                prepared[name] = True
+                if len(prepared) > DB_PREPARED_STATEMENTS:
+                    oldest, _ = prepared.popitem(last=False)
+                    self.execute(f"DEALLOCATE {oldest}")
+            self.execute(execute_sql, params)
+        self.record = record
+        return self
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is None or self.record is None:
+            return row
+        return self.record._make(row)
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self.record is None:
+            return rows
+        return list(map(self.record._make, rows))
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self.record is None:
+            return rows
+        return list(map(self.record._make, rows))
+
+    def __iter__(self):
+        # Серверный курсор TimedCursor читает пачками через fetchmany выше -
+        # записи там уже готовы
+        if self.record is None or (self.name is not None and METRICS_ENABLED):
+            return super().__iter__()
+        return map(self.record._make, super().__iter__())
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    get_database_url,
+                    minconn=int(os.environ.get('DB_POOL_MIN', 1)),
+                    maxconn=int(os.environ.get('DB_POOL_MAX', 10)),
+                    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                    check_idle=float(os.environ.get('DB_POOL_CHECK_IDLE', 30)),
+                    # Подготовленные запросы, записи вместо кортежей и (при
+                    # METRICS=1) учет времени и строк каждого запроса
+                    connect_kwargs={"connection_factory": PreparingConnection, "cursor_factory": RecordCursor},
+                )
+                try:
+                    _pool.fill()
+                except Exception as e:
+                    print(f"Connection pool prefill failed: {e}")
+    return _pool
+
+
+def close_pool():
+    # При остановке рабочего процесса
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.closeall()
+    replicas.close_pools()
+
+
+def _forget_pool_after_fork():
+    # Дочерний процесс не должен пользоваться сокетами родителя: закрытие или
+    # запрос через такое соединение сломают его и у родителя. Пул просто
+    # забывается, новый будет создан в этом процессе при первом обращении.
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pool_after_fork)
+
+
+# --- Реплики для чтения ---
+# DATABASE_REPLICA_URLS - строки подключения к репликам через запятую или
+# пробел. Страницы списков, поиска и экспорт читают с них по кругу. Реплика,
+# которая не отвечает или отстала больше чем на REPLICA_MAX_LAG секунд,
+# пропускается; если подходящих нет, чтение идет с основной базы. Отставание
+# проверяется на самом выданном соединении, не чаще раза в
+# REPLICA_CHECK_INTERVAL секунд на реплику. Запись и чтение сразу после нее
+# (cookie из app.py) всегда идут на основную базу.
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 1))
+REPLICA_RETRY_AFTER = float(os.environ.get('REPLICA_RETRY_AFTER', 10))
+
+# Отставание в секундах. Если поток репликации идет и все полученное уже
+# применено, отставания нет, даже когда основная база давно ничего не писала
+# (время последней транзакции тогда старое); без потока репликации -
+# время с последней примененной транзакции. Сервер не в recovery (после
+# promote) отставания не имеет.
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN EXISTS (SELECT 1 FROM pg_stat_wal_receiver
+                     WHERE status = 'streaming' AND flushed_lsn <= pg_last_wal_replay_lsn()) THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::float8"""
+
+
+def load_replica_configs(environ=None):
+    if environ is None:
+        environ = database_environ()
+    configs = []
+    for n, url in enumerate(re.split(r"[\s,]+", environ.get('DATABASE_REPLICA_URLS', '').strip())):
+        if not url:
+            continue
+        if url.startswith("postgres://"):
+            url = url.replace("postgres://", "postgresql://", 1)
+        try:
+            params = parse_dsn(url)
+        except psycopg2.ProgrammingError as e:
+            raise Exception(f"Invalid replica connection string #{n + 1} in DATABASE_REPLICA_URLS: {e}")
+        configs.append(DatabaseConfig(params, source=f"DATABASE_REPLICA_URLS #{n + 1}"))
+    return configs
+
+
+class Replica:
+    def __init__(self, config):
+        self.config = config
+        self.pool = None
+        self.lag = None            # последнее измеренное отставание, с (None - неизвестно)
+        self.checked_at = 0.0      # когда отставание измерено или взято на проверку
+        self.down_until = 0.0
+        self.last_error = None
+        self.reads = 0
+        self.lagging = 0
+
+    def dsn(self):
+        # Для пулов: параметры меняет ReplicaRouter.reload()
+        return self.config.dsn
+
+
+class ReplicaRouter:
+    def __init__(self, configs, max_lag=5.0, check_interval=1.0, retry_after=10.0):
+        self.replicas = [Replica(config) for config in configs]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self.primary_reads = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def candidates(self):
+        # Реплики по кругу, начиная со следующей. Недоступные пропускаются до
+        # истечения retry_after, отставшие - до следующей проверки
+        if not self.replicas:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            start = self._next
+            self._next = (start + 1) % len(self.replicas)
+        ordered = self.replicas[start:] + self.replicas[:start]
+        return [replica for replica in ordered if replica.down_until <= now
+                and (replica.lag is None or replica.lag <= self.max_lag
+                     or now - replica.checked_at >= self.check_interval)]
+
+    def claim_check(self, replica):
+        # Проверку выполняет один поток; остальные пользуются прежним значением
+        now = time.monotonic()
+        with self._lock:
+            if now - replica.checked_at < self.check_interval:
+                return False
+            replica.checked_at = now
+            return True
+
+    def record_lag(self, replica, lag):
+        if (lag > self.max_lag) != (replica.lag is not None and replica.lag > self.max_lag):
+            state = "lagging" if lag > self.max_lag else "caught up"
+            print(f"Replica {replica.config.safe_url} {state}: {lag:.1f}s behind")
+        replica.lag = lag
+
+    def acceptable(self, replica):
+        # Отставание еще не измерено (проверку делает другой поток) - не рискуем
+        if replica.lag is not None and replica.lag <= self.max_lag:
+            replica.reads += 1
+            return True
+        replica.lagging += 1
+        return False
+
+    def mark_down(self, replica, error):
+        replica.down_until = time.monotonic() + self.retry_after
+        replica.last_error = str(error).strip()
+        replica.lag = None
+        replica.checked_at = 0.0
+        print(f"Replica {replica.config.safe_url} unavailable for {self.retry_after:.0f}s: {replica.last_error}")
+
+    def replica_pool(self, replica):
+        if replica.pool is None:
+            with self._lock:
+                if replica.pool is None:
+                    replica.pool = ConnectionPool(
+                        replica.dsn,
+                        minconn=0,
+                        maxconn=int(os.environ.get('DB_POOL_MAX', 10)),
+                        timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                        # Реплику перезапускают чаще основной базы: мертвое
+                        # соединение должно отсеяться до выдачи, а не на запросе
+                        check_idle=self.check_interval,
+                        connect_kwargs={"connection_factory": PreparingConnection, "cursor_factory": RecordCursor},
+                    )
+        return replica.pool
+
+    def reload(self, configs):
+        # Список реплик задает пулы (и здесь, и в asgi.py), поэтому при
+        # перечитывании меняются только параметры подключения; изменить
+        # число реплик можно только перезапуском
+        if len(configs) != len(self.replicas):
+            print(f"DATABASE_REPLICA_URLS lists {len(configs)} replicas instead of {len(self.replicas)}: "
+                  f"restart to apply, replica settings left unchanged")
+            return False
+        for replica, config in zip(self.replicas, configs):
+            replica.config = config
+            # Реплику, отключенную из-за старого пароля, пробуем сразу
+            replica.down_until = 0.0
+            if replica.pool is not None:
+                replica.pool.drain()
+        return True
+
+    def forget_pools(self):
+        self._lock = threading.Lock()
+        for replica in self.replicas:
+            replica.pool = None
+
+    def close_pools(self):
+        for replica in self.replicas:
+            pool, replica.pool = replica.pool, None
+            if pool is not None:
+                pool.closeall()
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "max_lag_seconds": self.max_lag,
+            "primary_reads": self.primary_reads,
+            "replicas": [{
+                "url": replica.config.safe_url,
+                "available": replica.down_until <= now,
+                "lag_seconds": None if replica.lag is None else round(replica.lag, 3),
+                "reads": replica.reads,
+                "skipped_lagging": replica.lagging,
+                "last_error": replica.last_error,
+                "connection_pool": replica.pool.stats() if replica.pool is not None else None,
+            } for replica in self.replicas],
+        }
+
+
+replicas = ReplicaRouter(load_replica_configs(), REPLICA_MAX_LAG, REPLICA_CHECK_INTERVAL, REPLICA_RETRY_AFTER)
+os.register_at_fork(after_in_child=replicas.forget_pools)
+
+# Запись в текущем запросе (ставит cache.commit_and_invalidate): по ней app.py
+# на время привязывает клиента к основной базе
+wrote_to_primary = contextvars.ContextVar("wrote_to_primary", default=False)
+
+
+def _lag(conn):
+    cur = conn.cursor()
+    cur.execute(REPLICA_LAG_SQL)
+    lag = cur.fetchone()[0]
+    cur.close()
+    conn.rollback()
+    return lag
+
+
+def _replica_connection():
+    # (реплика, пул, соединение) или None, если читать придется с основной базы
+    for replica in replicas.candidates():
+        pool = replicas.replica_pool(replica)
+        try:
+            conn = pool.getconn()
+        except PoolTimeout:
+            continue
+        except psycopg2.Error as e:
+            replicas.mark_down(replica, e)
+            continue
+        try:
+            if replicas.claim_check(replica):
+                replicas.record_lag(replica, _lag(conn))
+        except psycopg2.Error as e:
+            pool.putconn(conn)
+            replicas.mark_down(replica, e)
+            continue
+        if replicas.acceptable(replica):
+            return replica, pool, conn
+        pool.putconn(conn)
+    replicas.primary_reads += 1
+    return None
+
+
+def connect_for_read():
+    # Отдельное (не из пула) соединение для долгого чтения - фоновых выгрузок
+    for replica in replicas.candidates():
+        try:
+            conn = psycopg2.connect(replica.config.dsn, connect_timeout=DB_CONNECT_TIMEOUT)
+        except psycopg2.Error as e:
+            replicas.mark_down(replica, e)
+            continue
+        try:
+            lag = _lag(conn)
+        except psycopg2.Error as e:
+            conn.close()
+            replicas.mark_down(replica, e)
+            continue
+        if lag <= replicas.max_lag:
+            return conn
+        conn.close()
+    return psycopg2.connect(get_database_url(), connect_timeout=DB_CONNECT_TIMEOUT)
+
+
+# --- Автоматический выключатель ---
+# Пока база отвечает, выключатель замкнут (closed) и ничего не проверяет.
+# После failure_threshold подряд ошибок подключения он размыкается (open):
+# запросы сразу получают DatabaseUnavailable, не трогая базу. Через
+# reset_timeout секунд ровно один вызов выполняет пробный SELECT 1 на новом
+# соединении (half-open); остальные в это время тоже получают отказ.
+class DatabaseUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, probe, failure_threshold=3, reset_timeout=5.0, health_ttl=2.0, on_close=None):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.health_ttl = health_ttl
+        self.on_close = on_close
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+        # Последняя проверка здоровья: (ok, ошибка, время)
+        self._health = None
+
+        # Счетчики для /debug
+        self.transitions = {}
+        self.rejected = 0
+        self.probes = 0
+        self.last_error = None
+
+    @property
+    def state(self):
+        return self._state
+
+    def _transition(self, state):
+        if state != self._state:
+            key = f"{self._state}->{state}"
+            self.transitions[key] = self.transitions.get(key, 0) + 1
+            print(f"Database circuit breaker: {key}")
+            self._state = state
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+
+    def retry_after(self):
+        if self._state != self.OPEN:
+            return 0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def before_call(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._probing or (self._state == self.OPEN and self.retry_after() > 0):
+                self.rejected += 1
+                raise DatabaseUnavailable(f"База данных недоступна: {self.last_error}")
+            self._transition(self.HALF_OPEN)
+            self._probing = True
+        if not self._run_probe():
+            raise DatabaseUnavailable(f"База данных недоступна: {self.last_error}")
+
+    def _run_probe(self):
+        # Вызывается только одним потоком (флаг _probing)
+        self.probes += 1
+        try:
+            self.probe()
+        except Exception as e:
+            with self._lock:
+                self._probing = False
+                self._health = (False, str(e).strip(), time.monotonic())
+                self.last_error = str(e).strip()
+                self._failures += 1
+                if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                    self._transition(self.OPEN)
+            return False
+        with self._lock:
+            self._probing = False
+            self._health = (True, None, time.monotonic())
+            self._failures = 0
+            closed = self._state != self.CLOSED
+            self._transition(self.CLOSED)
+        if closed and self.on_close is not None:
+            self.on_close()
+        return True
+
+    def record_success(self):
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+
+    def record_failure(self, error):
+        with self._lock:
+            self._failures += 1
+            self.last_error = str(error).strip()
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._transition(self.OPEN)
+
+    def health(self):
+        # Результат проверки кэшируется на health_ttl секунд, чтобы частые
+        # запросы мониторинга не создавали по соединению каждый
+        with self._lock:
+            cached = self._health
+            fresh = cached is not None and time.monotonic() - cached[2] < self.health_ttl
+            if not fresh and not self._probing and self.retry_after() == 0:
+                if self._state == self.OPEN:
+                    self._transition(self.HALF_OPEN)
+                self._probing = True
+                probe = True
+            else:
+                probe = False
+        if probe:
+            self._run_probe()
+            cached = self._health
+        if cached is None:
+            return {"ok": self._state == self.CLOSED, "error": self.last_error, "age_seconds": None}
+        return {"ok": cached[0], "error": cached[1], "age_seconds": round(time.monotonic() - cached[2], 3)}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_seconds": self.reset_timeout,
+                "retry_after_seconds": round(self.retry_after(), 3),
+                "transitions": dict(self.transitions),
+                "rejected": self.rejected,
+                "probes": self.probes,
+                "last_error": self.last_error,
+            }
+
+
+def _probe_database():
+    # Отдельное соединение мимо пула: в пуле могут лежать уже мертвые
+    conn = psycopg2.connect(get_database_url(), connect_timeout=DB_CONNECT_TIMEOUT)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+    finally:
+        conn.close()
+
+
+def _drain_pool():
+    # После восстановления базы старые соединения пула, скорее всего, оборваны
+    if _pool is not None:
+        _pool.drain()
+
+
+breaker = CircuitBreaker(
+    _probe_database,
+    failure_threshold=int(os.environ.get('DB_BREAKER_FAILURES', 3)),
+    reset_timeout=float(os.environ.get('DB_BREAKER_RESET', 5)),
+    health_ttl=float(os.environ.get('DB_HEALTH_TTL', 2)),
+    on_close=_drain_pool,
+)
+
+
+# Соединение из пула; возвращается обратно в любом случае, в том числе при исключении.
+# Ошибки подключения и обрывы соединения считаются выключателем, ошибки самих
+# запросов (ограничения, синтаксис, таймауты) - нет.
+# replica=True - только чтение, которое может идти с реплики (если они заданы).
+@contextmanager
+def db_connection(replica=False):
+    acquired = _replica_connection() if replica and replicas.replicas else None
+    if acquired is not None:
+        source, pool, conn = acquired
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            if conn.closed:
+                replicas.mark_down(source, e)
+            raise
+        finally:
+            pool.putconn(conn)
+        return
+
+    breaker.before_call()
+    pool = get_pool()
+    try:
+        conn = pool.getconn()
+    except psycopg2.Error as e:
+        breaker.record_failure(e)
+        raise
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        if conn.closed:
+            breaker.record_failure(e)
+        raise
+    else:
+        breaker.record_success()
+    finally:
+        pool.putconn(conn)
+
+
+# --- Перечитывание конфигурации ---
+# Сигнал от мастера gunicorn до рабочих процессов доходит только свой (USR1 -
+# переоткрыть журналы), у uvicorn --workers - никакой, а маршрут попал бы в
+# один процесс. Поэтому каждый рабочий процесс сам раз в
+# DATABASE_ENV_CHECK_INTERVAL секунд смотрит на DATABASE_ENV_FILE и, если файл
+# изменился (или подменен, как секрет в Kubernetes), вызывает
+# reload_database_config(). Без DATABASE_ENV_FILE поток не запускается.
+DATABASE_ENV_CHECK_INTERVAL = float(os.environ.get('DATABASE_ENV_CHECK_INTERVAL', 10))
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class DatabaseConfigWatcher:
+    def __init__(self, path, interval=10.0):
+        self.path = path
+        self.interval = interval
+        self.reloads = 0
+        self.last_reload_at = None
+        self.last_error = None
+        self._signature = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not self.path or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                # Текущее содержимое файла уже прочитано при старте
+                self._signature = _file_signature(self.path)
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="database-config-watcher", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def check(self):
+        signature = _file_signature(self.path)
+        if signature is None or signature == self._signature:
+            return False
+        # Запоминаем и при ошибке: недописанный файл изменится еще раз
+        self._signature = signature
+        try:
+            reload_database_config()
+        except Exception as e:
+            self.last_error = str(e).strip()
+            print(f"Database config reload failed, keeping the previous settings: {self.last_error}")
+            return False
+        self.last_error = None
+        self.reloads += 1
+        self.last_reload_at = time.time()
+        return True
+
+    def stats(self):
+        return {
+            "env_file": self.path or None,
+            "check_interval_seconds": self.interval,
+            "reloads": self.reloads,
+            "last_reload_at": self.last_reload_at,
+            "last_error": self.last_error,
+        }
+
+
+config_watcher = DatabaseConfigWatcher(DATABASE_ENV_FILE, DATABASE_ENV_CHECK_INTERVAL)
@@ -0,0 +1,253 @@
+import csv
+import io
+import json
+import os
+import queue
+import tempfile
+import threading
+import uuid
+
+import openpyxl
+from flask import Response, send_file
+
+from db import db_connection
+from queries import build_item_filters, build_room_filters
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+ROOM_EXPORT_HEADERS = ['Название', 'Номер', 'Этаж', 'Преподаватель', 'Вместимость']
+ITEM_EXPORT_HEADERS = ['Инвентарный номер', 'Наименование', 'Статус', 'Кабинет', 'Номер кабинета']
+
+# Сколько строк за раз забирать с сервера
+EXPORT_BATCH_SIZE = 2000
+# До этого размера готовый файл держится в памяти, дальше уходит на диск
+EXPORT_SPOOL_SIZE = 4 * 1024 * 1024
+
+
+ROOMS_EXPORT_SELECT = "SELECT name, number, floor, teacher, capacity FROM rooms"
+ITEMS_EXPORT_SELECT = """
+    SELECT items.inventory_number, items.name, items.status,
+           rooms.name as room_name, rooms.number as room_number
+    FROM items
+    JOIN rooms ON items.room_id = rooms.id
+"""
+
+
+# Для CSV/NDJSON: машинные имена полей и порядок по первичному ключу,
+# чтобы первые строки уходили клиенту без сортировки всей таблицы
+ROOM_FEED_FIELDS = ['id', 'name', 'number', 'floor', 'teacher', 'capacity']
+ITEM_FEED_FIELDS = ['id', 'inventory_number', 'name', 'status', 'room_name', 'room_number']
+ROOMS_FEED_SELECT = "SELECT id, name, number, floor, teacher, capacity FROM rooms"
+ITEMS_FEED_SELECT = """
+    SELECT items.id, items.inventory_number, items.name, items.status,
+           rooms.name as room_name, rooms.number as room_number
+    FROM items
+    JOIN rooms ON items.room_id = rooms.id
+"""
+
+
+def _export_query(select_sql, filters, params, order_by):
+    query = select_sql
+    if filters:
+        query += " WHERE " + " AND ".join(filters)
+    query += " ORDER BY " + order_by
+    return query, params
+
+
+def rooms_export_query(values):
+    filters, params = build_room_filters(values)
+    return _export_query(ROOMS_EXPORT_SELECT, filters, params, "number")
+
+
+def items_export_query(values):
+    filters, params = build_item_filters(values)
+    return _export_query(ITEMS_EXPORT_SELECT, filters, params, "rooms.number, items.name")
+
+
+def rooms_feed_query(values):
+    filters, params = build_room_filters(values)
+    return _export_query(ROOMS_FEED_SELECT, filters, params, "id")
+
+
+def items_feed_query(values):
+    filters, params = build_item_filters(values)
+    return _export_query(ITEMS_FEED_SELECT, filters, params, "items.id")
+
+
+# --- Построчное чтение результата ---
+# Именованный (серверный) курсор отдает строки пачками по EXPORT_BATCH_SIZE,
+# поэтому в памяти процесса никогда не лежит весь результат целиком.
+def stream_rows(conn, query, params, batch_size=EXPORT_BATCH_SIZE):
+    cur = conn.cursor(name=f"export_{uuid.uuid4().hex}")
+    cur.itersize = batch_size
+    try:
+        cur.execute(query, params)
+        for row in cur:
+            yield row
+    finally:
+        cur.close()
+
+
+# --- Excel в режиме write_only ---
+# Строки пишутся сразу во временный XML листа, а не хранятся объектами ячеек.
+def write_xlsx(rows, headers, title, output=None):
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+
+    if output is None:
+        output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def send_xlsx(output, download_name):
+    size = output.seek(0, 2)
+    output.seek(0)
+    response = send_file(
+        output,
+        as_attachment=True,
+        download_name=download_name,
+        mimetype=XLSX_MIMETYPE
+    )
+    response.content_length = size
+    return response
+
+
+# --- Потоковые CSV и NDJSON ---
+STREAM_MIMETYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+# Без фильтров CSV отдается через COPY ... TO STDOUT (можно отключить EXPORT_COPY=0)
+EXPORT_COPY = os.environ.get("EXPORT_COPY", "1") != "0"
+# Размер куска, который отдается клиенту за один раз
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def csv_chunks(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def ndjson_chunks(rows, fields):
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(fields, row)), ensure_ascii=False, default=str)
+        lines.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+            size = 0
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class _QueueWriter:
+    # Файлоподобный приемник для copy_expert: копит байты и отдает куски в очередь
+    def __init__(self, chunks, stop):
+        self.chunks = chunks
+        self.stop = stop
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= STREAM_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        chunk, self.buffer = bytes(self.buffer), bytearray()
+        while True:
+            if self.stop.is_set():
+                raise ExportCancelled()
+            try:
+                self.chunks.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+def copy_csv_chunks(conn, query, params):
+    # copy_expert блокирует поток до конца выгрузки, поэтому он работает в
+    # отдельном потоке, а куски передаются через ограниченную очередь
+    cur = conn.cursor()
+    sql = cur.mogrify(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", params)
+    chunks = queue.Queue(maxsize=16)
+    stop = threading.Event()
+    done = object()
+    errors = []
+
+    def run():
+        writer = _QueueWriter(chunks, stop)
+        try:
+            cur.copy_expert(sql, writer)
+            writer.flush()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            while not stop.is_set():
+                try:
+                    chunks.put(done, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    thread = threading.Thread(target=run, name="export-copy", daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+        if errors and not isinstance(errors[0], ExportCancelled):
+            raise errors[0]
+    finally:
+        # Клиент мог отключиться: останавливаем поток и освобождаем очередь
+        stop.set()
+        while thread.is_alive():
+            try:
+                chunks.get_nowait()
+            except queue.Empty:
+                thread.join(0.1)
+        cur.close()
+
+
+def stream_export(query, params, fields, fmt, replica=False):
+    # Соединение держится ровно столько, сколько идет выгрузка.
+    # Каждый фильтр добавляет параметр, так что пустой params - выгрузка целиком.
+    with db_connection(replica=replica) as conn:
+        if fmt == "csv" and not params and EXPORT_COPY:
+            yield from copy_csv_chunks(conn, query, params)
+        elif fmt == "csv":
+            yield from csv_chunks(stream_rows(conn, query, params), fields)
+        else:
+            yield from ndjson_chunks(stream_rows(conn, query, params), fields)
+
+
+def stream_response(query, params, fields, fmt, download_name, replica=False):
+    response = Response(
+        stream_export(query, params, fields, fmt, replica),
+        mimetype=STREAM_MIMETYPES[fmt]
+    )
+    response.headers["Content-Disposition"] = f"attachment; filename={download_name}.{fmt}"
+    return response
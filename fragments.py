@@ -0,0 +1,101 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from itertools import groupby
+
+from markupsafe import Markup
+
+# --- Кэш отрисованных строк таблиц ---
+# Строки таблиц кабинетов, инвентаря и страницы кабинета одинаковы между
+# запросами, пока не изменились данные. Фрагмент - подряд идущие строки одного
+# кабинета; ключ - (шаблон, кабинет, счетчик изменений кабинета, id строк).
+# Счетчик увеличивают триггеры при любой записи в кабинет или его предметы
+# (schema.create_room_versions), поэтому изменение в одном кабинете заново
+# отрисовывает только его строки, а ключи со старым счетчиком вытесняются.
+# Размер кэша ограничен FRAGMENT_CACHE_BYTES, вытесняются давно не
+# использованные фрагменты.
+
+FRAGMENT_CACHE_ENABLED = os.environ.get("FRAGMENT_CACHE", "1") != "0"
+FRAGMENT_CACHE_BYTES = int(os.environ.get("FRAGMENT_CACHE_BYTES", 32 * 1024 * 1024))
+
+
+class FragmentCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024, enabled=True):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._entries = OrderedDict()   # key -> (размер, Markup)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_render(self, key, render):
+        if not self.enabled:
+            return render()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = render()
+        size = sys.getsizeof(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[0]
+            self._entries[key] = (size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+fragment_cache = FragmentCache(FRAGMENT_CACHE_BYTES, FRAGMENT_CACHE_ENABLED)
+
+
+def by_room(rows):
+    # Фильтр шаблона: подряд идущие строки одного кабинета -> (room_id, счетчик, строки)
+    for (room_id, version), group in groupby(rows, key=lambda row: (row.room_id, row.room_version)):
+        yield room_id, version, list(group)
+
+
+def install(app):
+    # В шаблонах: {{ cached_rows("_item_rows.html", rows, room_id, version) }}.
+    # Частичный шаблон получает только rows и room_id и не должен зависеть от
+    # запроса: он отрисовывается без контекста Flask и без сигналов шаблонов
+    def cached_rows(template, rows, room_id, version):
+        key = (template, room_id, version, tuple(row.id for row in rows))
+        return fragment_cache.get_or_render(
+            key, lambda: Markup(app.jinja_env.get_template(template).render(rows=rows, room_id=room_id)))
+
+    app.jinja_env.globals["cached_rows"] = cached_rows
+    app.jinja_env.filters["by_room"] = by_room
@@ -0,0 +1,49 @@
+import multiprocessing
+import os
+
+# --- Продакшен-сервер ---
+# gunicorn -c gunicorn.conf.py wsgi:app
+# Несколько рабочих процессов, в каждом - пул потоков (gthread). Приложение
+# загружается один раз в мастере (preload_app) и наследуется через fork;
+# соединения с БД и фоновые потоки создаются уже в каждом рабочем процессе.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+# Время на завершение текущих запросов при остановке и перезапуске (HUP)
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+# Периодический перезапуск рабочих процессов со сдвигом, чтобы не все сразу
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+errorlog = "-"
+
+# Каждому потоку нужно свое соединение: по умолчанию пул процесса равен числу потоков.
+# Всего соединений с базой не больше workers * DB_POOL_MAX.
+os.environ.setdefault("DB_POOL_MAX", str(threads))
+# Кэш запросов у каждого процесса свой; сброс в остальных - через LISTEN/NOTIFY
+# (cache.py). При одном процессе подписка не нужна
+if workers == 1:
+    os.environ.setdefault("QUERY_CACHE_NOTIFY", "0")
+
+
+def post_worker_init(worker):
+    # Вызывается в рабочем процессе после загрузки приложения (и с preload, и без)
+    from app import start_worker
+    start_worker()
+
+
+def worker_exit(server, worker):
+    from app import stop_worker
+    stop_worker()
+
+
+# Обновление кода без простоя: с preload_app HUP перезапускает рабочие процессы
+# со старым кодом, поэтому для деплоя нужен USR2 (новый мастер) и затем
+# WINCH/TERM старому мастеру, либо GUNICORN_PRELOAD=0 и HUP.
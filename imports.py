@@ -0,0 +1,221 @@
+import csv
+import io
+import zipfile
+from xml.etree.ElementTree import ParseError
+
+import openpyxl
+import psycopg2
+from openpyxl.utils.exceptions import InvalidFileException
+
+from exports import ITEM_EXPORT_HEADERS
+from queries import ITEM_STATUSES
+
+IMPORT_COLUMNS = ('inventory_number', 'name', 'status', 'room_name', 'room_number')
+# Принимаются и заголовки XLSX-экспорта, и машинные имена из CSV/NDJSON-экспорта
+HEADER_ALIASES = dict(zip(ITEM_EXPORT_HEADERS, IMPORT_COLUMNS))
+HEADER_ALIASES.update({column: column for column in IMPORT_COLUMNS})
+
+# Сколько ошибочных строк показывать в отчете
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+# --- Чтение файла ---
+# Файл читается построчно: XLSX в режиме read_only, CSV через csv.reader
+def read_table(fileobj, filename):
+    if filename.lower().endswith(".xlsx"):
+        # Поврежденный файл или не XLSX (в том числе zip без книги внутри):
+        # ошибка формата, а не 500. Строки листа читаются лениво, поэтому
+        # битый XML может всплыть и при обходе
+        try:
+            workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+        except (zipfile.BadZipFile, InvalidFileException, KeyError, ParseError) as e:
+            raise ImportFormatError("Файл не является книгой XLSX") from e
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        except (zipfile.BadZipFile, ParseError) as e:
+            raise ImportFormatError("Файл XLSX поврежден") from e
+        finally:
+            workbook.close()
+        return
+
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        header_line = text.readline()
+        # Excel с русской локалью сохраняет CSV через точку с запятой
+        delimiter = ";" if header_line.count(";") > header_line.count(",") else ","
+        yield next(csv.reader([header_line], delimiter=delimiter), [])
+        yield from csv.reader(text, delimiter=delimiter)
+    except UnicodeDecodeError as e:
+        # Обычный "CSV (разделители - запятые)" Excel сохраняет в cp1251
+        raise ImportFormatError("Файл CSV не в кодировке UTF-8 (возможно, Windows-1251): "
+                                "сохраните его в Excel как «CSV UTF-8»") from e
+
+
+def _cell(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def import_records(rows):
+    # Первая строка - заголовок; колонки ищутся по имени, лишние игнорируются
+    rows = iter(rows)
+    header = next(rows, None)
+    if not header:
+        raise ImportFormatError("Файл пуст")
+    positions = {}
+    for index, title in enumerate(header):
+        column = HEADER_ALIASES.get(_cell(title))
+        if column and column not in positions:
+            positions[column] = index
+    missing = [column for column in IMPORT_COLUMNS if column not in positions]
+    if missing:
+        raise ImportFormatError("В файле нет колонок: " + ", ".join(missing))
+    return _records(rows, [positions[column] for column in IMPORT_COLUMNS])
+
+
+def _records(rows, positions):
+    for line, row in enumerate(rows, 2):
+        if not row or all(_cell(value) is None for value in row):
+            continue
+        yield (line, *(_cell(row[index]) if index < len(row) else None for index in positions))
+
+
+class _CopySource:
+    # Файлоподобная обертка над генератором строк для copy_expert. Ошибку
+    # из read() psycopg2 заменяет на QueryCanceled, поэтому исходная
+    # сохраняется в error и поднимается заново после COPY
+    def __init__(self, records):
+        self.records = records
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator="\n")
+        self.pending = b""
+        self.count = 0
+        self.error = None
+
+    def read(self, size=-1):
+        try:
+            return self._read(size)
+        except Exception as e:
+            self.error = e
+            raise
+
+    def _read(self, size):
+        while len(self.pending) < max(size, 1):
+            record = next(self.records, None)
+            if record is None:
+                break
+            self.writer.writerow(record)
+            self.count += 1
+            if self.buffer.tell() >= 64 * 1024:
+                self.pending += self.buffer.getvalue().encode("utf-8")
+                self.buffer.seek(0)
+                self.buffer.truncate()
+        if self.buffer.tell():
+            self.pending += self.buffer.getvalue().encode("utf-8")
+            self.buffer.seek(0)
+            self.buffer.truncate()
+        if size < 0:
+            size = len(self.pending)
+        chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+
+# --- Загрузка ---
+# Все строки попадают во временную таблицу одним COPY, дальше кабинеты и
+# предметы обрабатываются несколькими запросами над всем набором сразу.
+def import_inventory(conn, rows):
+    source = _CopySource(import_records(rows))
+    cur = conn.cursor()
+
+    cur.execute("""CREATE TEMP TABLE import_staging
+                   (line INTEGER,
+                    inventory_number TEXT,
+                    name TEXT,
+                    status TEXT,
+                    room_name TEXT,
+                    room_number TEXT,
+                    error TEXT) ON COMMIT DROP""")
+    try:
+        cur.copy_expert("""COPY import_staging (line, inventory_number, name, status, room_name, room_number)
+                           FROM STDIN WITH (FORMAT csv)""", source)
+    except psycopg2.Error:
+        # Файл оказался поврежден после заголовка
+        if source.error is not None:
+            raise source.error
+        raise
+    cur.execute("ANALYZE import_staging")
+
+    cur.execute("""UPDATE import_staging SET error = CASE
+                       WHEN inventory_number IS NULL THEN 'Не указан инвентарный номер'
+                       WHEN name IS NULL THEN 'Не указано наименование'
+                       WHEN room_number IS NULL THEN 'Не указан номер кабинета'
+                       WHEN status IS NULL OR status <> ALL(%s) THEN 'Неизвестный статус: ' || COALESCE(status, '')
+                   END""", (list(ITEM_STATUSES),))
+    # Повторы инвентарного номера внутри файла: побеждает последняя строка
+    cur.execute("""UPDATE import_staging s
+                   SET error = 'Инвентарный номер повторяется в строке ' || d.line
+                   FROM (SELECT inventory_number, max(line) AS line
+                         FROM import_staging
+                         WHERE error IS NULL
+                         GROUP BY inventory_number
+                         HAVING count(*) > 1) d
+                   WHERE s.error IS NULL
+                     AND s.inventory_number = d.inventory_number
+                     AND s.line <> d.line""")
+
+    # Уникального ограничения на номер кабинета нет, поэтому параллельные
+    # импорты сериализуются блокировкой, чтобы не создать дубликаты
+    cur.execute("LOCK TABLE rooms IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute("""INSERT INTO rooms (name, number)
+                   SELECT DISTINCT ON (room_number) COALESCE(room_name, room_number), room_number
+                   FROM import_staging s
+                   WHERE error IS NULL
+                     AND NOT EXISTS (SELECT 1 FROM rooms r WHERE r.number = s.room_number)
+                   ORDER BY room_number, line""")
+    rooms_created = cur.rowcount
+
+    cur.execute("""CREATE TEMP TABLE import_rooms ON COMMIT DROP AS
+                   SELECT DISTINCT ON (number) number, id
+                   FROM rooms
+                   WHERE number IN (SELECT room_number FROM import_staging WHERE error IS NULL)
+                   ORDER BY number, id""")
+
+    cur.execute("""UPDATE items i
+                   SET name = s.name, status = s.status, room_id = r.id
+                   FROM import_staging s
+                   JOIN import_rooms r ON r.number = s.room_number
+                   WHERE s.error IS NULL AND i.inventory_number = s.inventory_number""")
+    items_updated = cur.rowcount
+
+    cur.execute("""INSERT INTO items (room_id, name, inventory_number, status)
+                   SELECT r.id, s.name, s.inventory_number, s.status
+                   FROM import_staging s
+                   JOIN import_rooms r ON r.number = s.room_number
+                   WHERE s.error IS NULL
+                     AND NOT EXISTS (SELECT 1 FROM items i WHERE i.inventory_number = s.inventory_number)
+                   ORDER BY s.line""")
+    items_created = cur.rowcount
+
+    cur.execute("SELECT count(*) FROM import_staging WHERE error IS NOT NULL")
+    error_count = cur.fetchone()[0]
+    cur.execute("SELECT line, error FROM import_staging WHERE error IS NOT NULL ORDER BY line LIMIT %s",
+                (MAX_REPORTED_ERRORS,))
+    errors = cur.fetchall()
+    cur.close()
+
+    return {
+        "rows": source.count,
+        "rooms_created": rooms_created,
+        "items_created": items_created,
+        "items_updated": items_updated,
+        "error_count": error_count,
+        "errors": errors,
+    }
@@ -0,0 +1,356 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from db import connect_for_read
+from exports import (EXPORT_BATCH_SIZE, ITEM_EXPORT_HEADERS, ITEM_FEED_FIELDS, ROOM_EXPORT_HEADERS,
+                     ROOM_FEED_FIELDS, STREAM_MIMETYPES, XLSX_MIMETYPE, items_export_query, items_feed_query,
+                     ndjson_chunks, rooms_export_query, rooms_feed_query, stream_rows, write_xlsx)
+from queries import item_filter_values, room_filter_values
+
+# --- Фоновые задачи экспорта ---
+# Большая выгрузка не занимает веб-поток: POST /export-jobs сразу отвечает id
+# задачи, файл собирает пул потоков в каталог EXPORT_JOB_DIR, клиент опрашивает
+# статус и скачивает готовый файл. Состояние задачи лежит рядом с файлом
+# (<id>.json), поэтому статус и скачивание доступны из любого рабочего процесса
+# gunicorn на этой машине, а не только из принявшего задачу.
+# Пока выгрузка с теми же видом, форматом и фильтрами не готова, повторные
+# запросы получают id уже идущей задачи (файл-метка active-<хэш>).
+
+EXPORT_JOB_DIR = os.environ.get("EXPORT_JOB_DIR") or os.path.join(tempfile.gettempdir(), "inventory_exports")
+EXPORT_JOB_WORKERS = int(os.environ.get("EXPORT_JOB_WORKERS", 2))
+# Готовые и неудачные задачи удаляются через столько секунд после завершения
+EXPORT_JOB_RETENTION = float(os.environ.get("EXPORT_JOB_RETENTION", 3600))
+# Больше задач в очереди одного процесса не принимается
+EXPORT_JOB_QUEUE_MAX = int(os.environ.get("EXPORT_JOB_QUEUE_MAX", 20))
+# Как часто (в строках) записывать прогресс в файл состояния
+EXPORT_JOB_PROGRESS_ROWS = EXPORT_BATCH_SIZE * 25
+
+JOB_FORMATS = ("xlsx", "csv", "ndjson")
+ACTIVE_STATUSES = ("queued", "running")
+_JOB_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+ExportKind = namedtuple("ExportKind", "filter_values export_query feed_query headers fields title download_name")
+
+EXPORT_KINDS = {
+    "rooms": ExportKind(room_filter_values, rooms_export_query, rooms_feed_query,
+                        ROOM_EXPORT_HEADERS, ROOM_FEED_FIELDS, "Кабинеты", "rooms_export"),
+    "items": ExportKind(item_filter_values, items_export_query, items_feed_query,
+                        ITEM_EXPORT_HEADERS, ITEM_FEED_FIELDS, "Инвентарь", "inventory_export"),
+}
+
+
+class ExportQueueFull(Exception):
+    pass
+
+
+def job_mimetype(fmt):
+    # charset для text/csv добавит send_file
+    return XLSX_MIMETYPE if fmt == "xlsx" else STREAM_MIMETYPES[fmt].split(";")[0]
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _counted(rows, job, report):
+    count = 0
+    for row in rows:
+        yield row
+        count += 1
+        if count % EXPORT_JOB_PROGRESS_ROWS == 0:
+            report(job, rows=count)
+    job["rows"] = count
+
+
+def write_export(conn, kind, fmt, filters, fileobj, job, report):
+    # XLSX - с заголовками как у обычного экспорта, CSV и NDJSON - поля как в потоковой выгрузке
+    spec = EXPORT_KINDS[kind]
+    values = spec.filter_values(filters)
+    if fmt == "xlsx":
+        query, params = spec.export_query(values)
+        write_xlsx(_counted(stream_rows(conn, query, params), job, report), spec.headers, spec.title, fileobj)
+    elif fmt == "csv":
+        # COPY пишет прямо в файл, без разбора строк в Python
+        query, params = spec.feed_query(values)
+        cur = conn.cursor()
+        cur.copy_expert(cur.mogrify(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", params), fileobj)
+        job["rows"] = cur.rowcount
+        cur.close()
+    else:
+        query, params = spec.feed_query(values)
+        for chunk in ndjson_chunks(_counted(stream_rows(conn, query, params), job, report), spec.fields):
+            fileobj.write(chunk)
+    return job["rows"]
+
+
+class ExportJobs:
+    def __init__(self, directory, workers=2, retention=3600.0, queue_max=20):
+        self.directory = directory
+        self.workers = workers
+        self.retention = retention
+        self.queue_max = queue_max
+        self._executor = None
+        self._active = {}          # id -> состояние задач этого процесса
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+
+        self.submitted = 0
+        self.deduplicated = 0
+        self.completed = 0
+        self.failed = 0
+        self.removed = 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write_state(self, job):
+        # Через временный файл и rename: читатель никогда не видит половину JSON
+        tmp = self._path(f"{job['id']}.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as fileobj:
+            json.dump(job, fileobj, ensure_ascii=False)
+        os.replace(tmp, self._path(f"{job['id']}.json"))
+
+    def _update(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+            snapshot = dict(job)
+        self._write_state(snapshot)
+
+    def _read_state(self, job_id):
+        try:
+            with open(self._path(f"{job_id}.json"), encoding="utf-8") as fileobj:
+                return json.load(fileobj)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get(self, job_id):
+        if not _JOB_ID_RE.fullmatch(job_id):
+            return None
+        with self._lock:
+            job = self._active.get(job_id)
+            if job is not None:
+                return dict(job)
+        job = self._read_state(job_id)
+        if job is not None and job["status"] in ACTIVE_STATUSES and not _process_alive(job["pid"]):
+            # Рабочий процесс перезапустили или он упал посреди выгрузки
+            job["status"] = "failed"
+            job["error"] = "Процесс, выполнявший выгрузку, завершился"
+        return job
+
+    def file_path(self, job):
+        return self._path(f"{job['id']}.{job['format']}")
+
+    # --- Постановка в очередь ---
+    def _claim(self, marker, job_id):
+        # os.link атомарен и не перезаписывает существующий файл: метку
+        # получает только один из одновременных запросов
+        tmp = f"{marker}.{job_id}"
+        with open(tmp, "w", encoding="utf-8") as fileobj:
+            fileobj.write(job_id)
+        try:
+            os.link(tmp, marker)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            _remove(tmp)
+
+    def _release(self, marker, job_id):
+        # Снимает метку, только если она все еще принадлежит job_id. Проверить
+        # и удалить нельзя: между ними другой процесс мог заменить метку своей.
+        # Метка сначала атомарно переименовывается в свое имя и проверяется
+        # уже там; чужая возвращается на место (если его не заняли снова)
+        private = f"{marker}.release-{uuid.uuid4().hex}"
+        try:
+            os.rename(marker, private)
+        except FileNotFoundError:
+            return False
+        try:
+            if self._claimed_by(private) == job_id:
+                return True
+            try:
+                os.link(private, marker)
+            except FileExistsError:
+                pass
+            return False
+        finally:
+            _remove(private)
+
+    def _claimed_by(self, marker):
+        try:
+            with open(marker, encoding="utf-8") as fileobj:
+                return fileobj.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def submit(self, kind, fmt, values):
+        # Возвращает (состояние задачи, True - если это уже идущая такая же выгрузка)
+        filters = {field: value for field, value in sorted(values.items()) if value}
+        key = hashlib.sha1(json.dumps([kind, fmt, filters], ensure_ascii=False).encode("utf-8")).hexdigest()
+        os.makedirs(self.directory, exist_ok=True)
+        self.cleanup_if_due()
+        marker = self._path(f"active-{key}")
+
+        while True:
+            claimed = self._claimed_by(marker)
+            if claimed is not None:
+                job = self.get(claimed)
+                if job is not None and job["status"] in ACTIVE_STATUSES:
+                    with self._lock:
+                        self.deduplicated += 1
+                    return job, True
+                # Метка осталась от завершенной или брошенной задачи
+                self._release(marker, claimed)
+                continue
+
+            with self._lock:
+                if sum(job["status"] == "queued" for job in self._active.values()) >= self.queue_max:
+                    raise ExportQueueFull(f"В очереди уже {self.queue_max} выгрузок")
+            job = {
+                "id": uuid.uuid4().hex,
+                "kind": kind,
+                "format": fmt,
+                "filters": filters,
+                "status": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "rows": 0,
+                "size": None,
+                "error": None,
+                "pid": os.getpid(),
+                "download_name": f"{EXPORT_KINDS[kind].download_name}.{fmt}",
+            }
+            # Состояние пишется до метки: кто увидит метку, найдет и задачу
+            self._write_state(job)
+            if self._claim(marker, job["id"]):
+                break
+            _remove(self._path(f"{job['id']}.json"))
+
+        with self._lock:
+            if self._executor is None:
+                # Потоки создаются при первой задаче, уже в рабочем процессе (после fork)
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="export-job")
+            self._active[job["id"]] = job
+            self.submitted += 1
+            self._executor.submit(self._run, job, marker)
+            return dict(job), False
+
+    def _run(self, job, marker):
+        path = self.file_path(job)
+        part = f"{path}.part"
+        self._update(job, status="running", started_at=time.time())
+        try:
+            # С реплики, если есть подходящая: выгрузка может идти минутами
+            conn = connect_for_read()
+            try:
+                conn.set_session(readonly=True)
+                with open(part, "wb") as fileobj:
+                    rows = write_export(conn, job["kind"], job["format"], job["filters"], fileobj, job,
+                                        self._update)
+            finally:
+                conn.close()
+            os.replace(part, path)
+            self._update(job, status="done", rows=rows, size=os.path.getsize(path), finished_at=time.time())
+            print(f"Export job {job['id']} done: {rows} rows, {job['size']} bytes "
+                  f"in {job['finished_at'] - job['started_at']:.1f}s")
+        except Exception as e:
+            _remove(part)
+            print(f"Export job {job['id']} failed: {e}")
+            self._update(job, status="failed", error=str(e).strip(), finished_at=time.time())
+        finally:
+            self._release(marker, job["id"])
+            with self._lock:
+                self._active.pop(job["id"], None)
+                if job["status"] == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    # --- Удаление старых выгрузок ---
+    def cleanup_if_due(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_cleanup < min(60.0, self.retention):
+                return
+            self._last_cleanup = now
+        self.cleanup()
+
+    def cleanup(self):
+        # Файл и состояние удаляются через retention секунд после завершения
+        # задачи; недописанные файлы брошенных задач - тогда же после создания
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+        deadline = time.time() - self.retention
+        removed = 0
+        for name in names:
+            job_id = name.split(".", 1)[0]
+            if not name.endswith(".json") or not _JOB_ID_RE.fullmatch(job_id):
+                continue
+            job = self.get(job_id)
+            if job is None or job["status"] in ACTIVE_STATUSES:
+                continue
+            if (job["finished_at"] or job["created_at"]) > deadline:
+                continue
+            _remove(self.file_path(job))
+            _remove(f"{self.file_path(job)}.part")
+            _remove(self._path(name))
+            removed += 1
+        with self._lock:
+            self.removed += removed
+        return removed
+
+    def shutdown(self):
+        # Задачи из очереди процесса отменяются; идущие дописываются, пока процесс жив
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            queued = [job for job in self._active.values() if job["status"] == "queued"]
+        for job in queued:
+            self._update(job, status="failed", error="Сервер перезапускается", finished_at=time.time())
+            with self._lock:
+                self._active.pop(job["id"], None)
+                self.failed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "workers": self.workers,
+                "queued": sum(job["status"] == "queued" for job in self._active.values()),
+                "running": sum(job["status"] == "running" for job in self._active.values()),
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "completed": self.completed,
+                "failed": self.failed,
+                "removed": self.removed,
+                "retention_seconds": self.retention,
+            }
+
+
+export_jobs = ExportJobs(EXPORT_JOB_DIR, EXPORT_JOB_WORKERS, EXPORT_JOB_RETENTION, EXPORT_JOB_QUEUE_MAX)
@@ -0,0 +1,323 @@
+import bisect
+import contextvars
+import os
+import re
+import threading
+import time
+
+import psycopg2.extensions
+from flask import before_render_template, g, request, template_rendered
+
+# --- Метрики в формате Prometheus ---
+# Все значения хранятся в памяти процесса; при нескольких рабочих процессах
+# gunicorn каждый отдает на /metrics свои числа.
+METRICS_ENABLED = os.environ.get("METRICS", "1") != "0"
+# Запросы дольше этого порога пишутся в лог
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}   # label_values -> [счетчики по корзинам, сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels, label_values, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, label_values, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {total:.6f}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Полное время обработки запроса",
+                             ("route", "method", "status"))
+REQUEST_PHASE = Histogram("http_request_phase_seconds",
+                          "Время запроса по частям: db, render, export, other", ("route", "phase"))
+QUERY_DURATION = Histogram("db_query_duration_seconds", "Время выполнения SQL-запроса", ("query",))
+QUERY_ROWS = Counter("db_query_rows_total", "Строк возвращено или изменено запросами", ("query",))
+SLOW_QUERIES = Counter("db_slow_queries_total", "Запросов дольше SLOW_QUERY_MS", ("query",))
+
+ALL_METRICS = [REQUEST_DURATION, REQUEST_PHASE, QUERY_DURATION, QUERY_ROWS, SLOW_QUERIES]
+
+
+# --- Время запроса по частям ---
+# Части могут быть вложены (запрос к БД внутри сборки экспорта): время
+# вложенной части вычитается из внешней, поэтому сумма частей не превышает
+# полного времени запроса.
+class RequestTimer:
+    __slots__ = ("route", "started", "phases", "_stack")
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.phases = {}
+        self._stack = []
+
+    def begin(self):
+        self._stack.append(0.0)
+        return time.perf_counter()
+
+    def end(self, phase, started):
+        elapsed = time.perf_counter() - started
+        nested = self._stack.pop()
+        self.phases[phase] = self.phases.get(phase, 0.0) + elapsed - nested
+        if self._stack:
+            self._stack[-1] += elapsed
+
+    def finish(self, method, status):
+        total = time.perf_counter() - self.started
+        REQUEST_DURATION.observe(total, self.route, method, status)
+        for phase, seconds in self.phases.items():
+            REQUEST_PHASE.observe(seconds, self.route, phase)
+        REQUEST_PHASE.observe(max(0.0, total - sum(self.phases.values())), self.route, "other")
+
+
+current_timer = contextvars.ContextVar("request_timer", default=None)
+
+
+class phase:
+    # with phase("export"): ... - время относится к части текущего запроса
+    __slots__ = ("name", "timer", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timer = current_timer.get()
+        if self.timer is not None:
+            self.started = self.timer.begin()
+        return self
+
+    def __exit__(self, *exc):
+        if self.timer is not None:
+            self.timer.end(self.name, self.started)
+
+
+_DONE = object()
+
+
+def timed_stream(chunks, timer, method, status):
+    # Тело потокового ответа формируется уже после выхода из обработчика:
+    # время каждого куска - часть export, итог записывается по окончании отдачи
+    iterator = iter(chunks)
+    try:
+        while True:
+            token = current_timer.set(timer)
+            started = timer.begin()
+            try:
+                chunk = next(iterator, _DONE)
+            finally:
+                timer.end("export", started)
+                current_timer.reset(token)
+            if chunk is _DONE:
+                break
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+        timer.finish(method, status)
+
+
+# --- Учет SQL-запросов ---
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_TABLE_AFTER = {"insert": "into", "delete": "from", "update": None}
+_labels = {}
+_prepared_labels = {}
+
+
+def label_prepared(name, sql):
+    # EXECUTE q_... учитывается под меткой исходного запроса
+    _prepared_labels[name] = query_label(sql)
+
+
+def query_label(sql):
+    # Метка с малым числом значений: операция и основная таблица ("select rooms")
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    sql = str(sql)
+    label = _labels.get(sql)
+    if label is not None:
+        return label
+
+    words = [word.lower() for word in _WORD_RE.findall(sql[:2000])]
+    if not words:
+        label = "other"
+    elif words[0] == "execute" and len(words) > 1:
+        label = _prepared_labels.get(words[1], "execute")
+    elif words[0] in ("prepare", "deallocate"):
+        label = words[0]
+    else:
+        operation = words[0]
+        keyword = _TABLE_AFTER.get(operation, "from")
+        if keyword is None:
+            table = words[1] if len(words) > 1 else None
+        elif keyword in words:
+            table = words[words.index(keyword) + 1] if words.index(keyword) + 1 < len(words) else None
+        else:
+            table = None
+        label = f"{operation} {table}" if table else operation
+    if len(_labels) < 1000:
+        _labels[sql] = label
+    return label
+
+
+def record_query(sql, elapsed, rows):
+    label = query_label(sql)
+    QUERY_DURATION.observe(elapsed, label)
+    if rows and rows > 0:
+        QUERY_ROWS.inc(label, amount=rows)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(label)
+        text = " ".join(str(sql).split())
+        print(f"Slow query {elapsed * 1000:.1f} ms, rows={rows}: {text[:500]}")
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    # Подключается к соединениям пула как cursor_factory, поэтому через него
+    # проходят все запросы всех обработчиков
+    def _timed(self, method, sql, *args):
+        timer = current_timer.get()
+        started = timer.begin() if timer is not None else time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            if timer is not None:
+                timer.end("db", started)
+            record_query(sql, time.perf_counter() - started, self.rowcount)
+
+    def execute(self, sql, params=None):
+        return self._timed(super().execute, sql, params)
+
+    def executemany(self, sql, params_seq):
+        return self._timed(super().executemany, sql, params_seq)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(super().copy_expert, sql, file, size)
+
+    def __iter__(self):
+        if self.name is None:
+            return super().__iter__()
+        return self._iter_named()
+
+    def _iter_named(self):
+        # Серверный курсор: каждая пачка - отдельный запрос к базе
+        while True:
+            timer = current_timer.get()
+            started = timer.begin() if timer is not None else None
+            rows = self.fetchmany(self.itersize)
+            if timer is not None:
+                timer.end("db", started)
+            if not rows:
+                return
+            yield from rows
+
+
+# --- Подключение к приложению ---
+def install(app):
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def start_request_timer():
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        current_timer.set(RequestTimer(route))
+
+    @app.after_request
+    def finish_request_timer(response):
+        timer = current_timer.get()
+        if timer is None:
+            return response
+        current_timer.set(None)
+        status = str(response.status_code)
+        if response.is_streamed and response.content_length is None:
+            response.response = timed_stream(response.response, timer, request.method, status)
+        else:
+            timer.finish(request.method, status)
+        return response
+
+    def template_started(sender, template, context, **extra):
+        timer = current_timer.get()
+        if timer is not None:
+            g.render_started = timer.begin()
+
+    def template_finished(sender, template, context, **extra):
+        timer = current_timer.get()
+        if timer is not None and "render_started" in g:
+            timer.end("render", g.pop("render_started"))
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+
+def render_metrics(extra_lines=()):
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+
+def gauge(name, help_text, value):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+def counter(name, help_text, value):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
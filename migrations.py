@@ -0,0 +1,169 @@
+import os
+import random
+import threading
+import time
+
+from db import db_connection
+from schema import (create_change_log, create_change_log_functions, create_change_tracking, create_indexes,
+                    create_inventory_number_index, create_inventory_summary, create_item_own_search_index,
+                    create_room_page_index, create_room_versions, create_search, create_tables,
+                    trigram_indexes_present)
+
+# --- Версионированные миграции ---
+# Каждая миграция выполняется один раз и записывается в schema_version.
+# Первые версии повторяют прежний init_db и написаны через IF NOT EXISTS,
+# поэтому на уже существующей базе проходят без изменений.
+MIGRATIONS = [
+    (1, "rooms and items tables", create_tables),
+    (2, "table versions for ETag/Last-Modified", create_change_tracking),
+    (3, "room/status summary for the dashboard", create_inventory_summary),
+    (4, "btree and trigram indexes", create_indexes),
+    (5, "full-text search vectors and indexes", create_search),
+    (6, "room page index on items (room_id, name, id)", create_room_page_index),
+    (7, "per-room change counters for the fragment cache", create_room_versions),
+    (8, "change log for the incremental sync feed", create_change_log),
+    (9, "btree index on items (inventory_number)", create_inventory_number_index),
+    (10, "change log ordering without a global lock", create_change_log_functions),
+    (11, "search index on item name and inventory number", create_item_own_search_index),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Один ключ advisory-блокировки на все процессы, выполняющие миграции
+MIGRATION_LOCK_KEY = 0x1D0_5C4E
+
+
+def ensure_schema_version_table(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                 (version INTEGER PRIMARY KEY,
+                  description TEXT NOT NULL,
+                  applied_at TIMESTAMPTZ NOT NULL DEFAULT now())''')
+
+
+def current_version(cur):
+    # Без DDL: таблицы может еще не быть
+    cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute("SELECT COALESCE(max(version), 0) FROM schema_version")
+    return cur.fetchone()[0]
+
+
+def migrate(conn, target=LATEST_VERSION):
+    # Каждая миграция - отдельная транзакция; параллельные запуски (несколько
+    # рабочих процессов, release-фаза) ждут друг друга на advisory-блокировке
+    applied = []
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        ensure_schema_version_table(cur)
+        conn.commit()
+        for version, description, apply in MIGRATIONS:
+            if version > target or version <= current_version(cur):
+                continue
+            print(f"Applying migration {version}: {description}")
+            apply(cur)
+            cur.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                        (version, description))
+            conn.commit()
+            applied.append(version)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+            conn.commit()
+        except Exception as e:
+            # Соединение могло оборваться - блокировка снимется вместе с сессией
+            print(f"Migration lock release failed: {e}")
+        cur.close()
+    return applied
+
+
+# --- Проверка готовности при старте ---
+# Веб-процесс не ждет базу при импорте: поток в фоне проверяет подключение и
+# версию схемы, повторяя попытки с экспоненциальной задержкой. Пока проверка
+# не прошла, маршруты с check_db отвечают 503.
+# Миграции применяет только `flask migrate` (release-фаза в procfile), а
+# процесс со старой схемой отвечает 503, пока их не применят: DDL при старте
+# каждого рабочего процесса не должен случаться сам собой.
+# AUTO_MIGRATE=1 - явное разрешение процессу применить недостающие миграции
+# (удобно для локального запуска `python app.py`).
+AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "0") == "1"
+READINESS_BACKOFF_INITIAL = float(os.environ.get("READINESS_BACKOFF_INITIAL", 0.5))
+READINESS_BACKOFF_MAX = float(os.environ.get("READINESS_BACKOFF_MAX", 30))
+
+
+class SchemaOutdated(Exception):
+    pass
+
+
+class ReadinessProbe:
+    def __init__(self, check, initial_delay=0.5, max_delay=30.0):
+        self.check = check
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.ready = False
+        self.attempts = 0
+        self.last_error = None
+        self.started_at = None
+        self.ready_at = None
+        self.result = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or (not self._thread.is_alive() and not self.ready):
+                self.started_at = time.monotonic()
+                self._thread = threading.Thread(target=self._run, name="readiness-probe", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        delay = self.initial_delay
+        while True:
+            self.attempts += 1
+            try:
+                self.result = self.check()
+            except Exception as e:
+                self.last_error = str(e).strip()
+                print(f"Database readiness check {self.attempts} failed: {self.last_error}; "
+                      f"retrying in {delay:.1f}s")
+                # Случайный разброс, чтобы рабочие процессы не стучались в базу одновременно
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self.max_delay)
+                continue
+            self.last_error = None
+            self.ready_at = time.monotonic()
+            self.ready = True
+            print(f"Database ready after {self.attempts} attempt(s), "
+                  f"{self.ready_at - self.started_at:.2f}s since start")
+            return
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "seconds_to_ready": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+        }
+
+
+def check_schema():
+    # На актуальной схеме это два SELECT без DDL и без блокировок
+    with db_connection() as conn:
+        cur = conn.cursor()
+        version = current_version(cur)
+        conn.rollback()
+        if version < LATEST_VERSION and AUTO_MIGRATE:
+            migrate(conn)
+            version = current_version(cur)
+        trigram = trigram_indexes_present(cur)
+        conn.rollback()
+        cur.close()
+    if version < LATEST_VERSION:
+        raise SchemaOutdated(f"schema version {version}, expected {LATEST_VERSION}: run `flask migrate`")
+    return {"schema_version": version, "trigram_indexes": trigram}
+
+
+readiness = ReadinessProbe(check_schema, READINESS_BACKOFF_INITIAL, READINESS_BACKOFF_MAX)
@@ -0,0 +1,478 @@
+import base64
+import json
+import re
+from collections import namedtuple
+
+from schema import ITEM_OWN_SEARCH_VECTOR
+
+ITEM_STATUSES = ('Работает', 'Не работает', 'Ремонт')
+
+ROOMS_SELECT = "SELECT rooms.id, rooms.name, rooms.number, rooms.floor, rooms.teacher, rooms.capacity FROM rooms"
+ITEMS_SELECT = """SELECT items.id, items.name, items.inventory_number, items.status,
+                         rooms.name, rooms.number, items.room_id
+                  FROM items
+                  JOIN rooms ON items.room_id = rooms.id"""
+ROOM_ITEMS_SELECT = "SELECT items.id, items.room_id, items.name, items.inventory_number, items.status FROM items"
+
+# Имена колонок в порядке SELECT выше
+ROOM_FIELDS = ('id', 'name', 'number', 'floor', 'teacher', 'capacity')
+ITEM_FIELDS = ('id', 'name', 'inventory_number', 'status', 'room_name', 'room_number', 'room_id')
+ROOM_ITEM_FIELDS = ('id', 'room_id', 'name', 'inventory_number', 'status')
+
+# Записи строк: компактнее словаря, поля доступны и по имени (room.number),
+# и по индексу. Курсор пула строит их сам: cur.run(sql, params, record=Room)
+Room = namedtuple("Room", ROOM_FIELDS)
+Item = namedtuple("Item", ITEM_FIELDS)
+RoomItem = namedtuple("RoomItem", ROOM_ITEM_FIELDS)
+
+# HTML-страницы списков читают вместе со строками счетчик изменений кабинета
+# (room_versions): по нему кэшируются отрисованные строки таблиц (fragments.py).
+# Счетчик берется тем же запросом, что и строки, - иначе он мог бы оказаться
+# новее данных. JSON API и поиск используют запросы без него.
+ROOMS_PAGE_SELECT = """SELECT rooms.id, rooms.name, rooms.number, rooms.floor, rooms.teacher, rooms.capacity,
+                              COALESCE(room_versions.version, 0)
+                       FROM rooms
+                       LEFT JOIN room_versions ON room_versions.room_id = rooms.id"""
+ITEMS_PAGE_SELECT = """SELECT items.id, items.name, items.inventory_number, items.status,
+                              rooms.name, rooms.number, items.room_id, COALESCE(room_versions.version, 0)
+                       FROM items
+                       JOIN rooms ON items.room_id = rooms.id
+                       LEFT JOIN room_versions ON room_versions.room_id = items.room_id"""
+RoomRow = namedtuple("RoomRow", ROOM_FIELDS + ("room_version",))
+ItemRow = namedtuple("ItemRow", ITEM_FIELDS + ("room_version",))
+
+# --- Фильтры списков ---
+# Общие для страниц, экспорта и прочих выборок, чтобы условия не расходились.
+
+ROOM_FILTER_FIELDS = ("name", "number", "floor", "teacher", "capacity_min", "capacity_max")
+ITEM_FILTER_FIELDS = ("name", "inventory_number", "status", "room_name", "room_number")
+
+
+def room_filter_values(args):
+    return {field: args.get(field, "") or "" for field in ROOM_FILTER_FIELDS}
+
+
+def item_filter_values(args):
+    return {field: args.get(field, "") or "" for field in ITEM_FILTER_FIELDS}
+
+
+def int_filter(values, field):
+    # Числовой фильтр из строки запроса; ValueError с понятным текстом для ответа 400
+    try:
+        return int(values[field])
+    except ValueError:
+        raise ValueError(f"{field} должен быть целым числом") from None
+
+
+def build_room_filters(values):
+    filters = []
+    params = []
+
+    if values.get("name"):
+        filters.append("rooms.name ILIKE %s")
+        params.append(f"%{values['name']}%")
+    if values.get("number"):
+        filters.append("rooms.number ILIKE %s")
+        params.append(f"%{values['number']}%")
+    if values.get("floor"):
+        filters.append("rooms.floor ILIKE %s")
+        params.append(f"%{values['floor']}%")
+    if values.get("teacher"):
+        filters.append("rooms.teacher ILIKE %s")
+        params.append(f"%{values['teacher']}%")
+    if values.get("capacity_min"):
+        filters.append("rooms.capacity >= %s")
+        params.append(int_filter(values, "capacity_min"))
+    if values.get("capacity_max"):
+        filters.append("rooms.capacity <= %s")
+        params.append(int_filter(values, "capacity_max"))
+
+    return filters, params
+
+
+def build_item_filters(values):
+    filters = []
+    params = []
+
+    if values.get("name"):
+        filters.append("items.name ILIKE %s")
+        params.append(f"%{values['name']}%")
+    if values.get("inventory_number"):
+        filters.append("items.inventory_number ILIKE %s")
+        params.append(f"%{values['inventory_number']}%")
+    if values.get("status"):
+        filters.append("items.status = %s")
+        params.append(values["status"])
+    if values.get("room_name"):
+        filters.append("rooms.name ILIKE %s")
+        params.append(f"%{values['room_name']}%")
+    if values.get("room_number"):
+        filters.append("rooms.number ILIKE %s")
+        params.append(f"%{values['room_number']}%")
+
+    return filters, params
+
+
+# --- Keyset-пагинация ---
+# Страница определяется последним показанным ключом (sort_key, id), а не OFFSET,
+# поэтому стоимость любой страницы одинакова независимо от ее номера.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def page_size(args):
+    try:
+        size = int(args.get("per_page", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        size = DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(key):
+    raw = json.dumps(list(key), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw.decode("utf-8"))
+        return str(sort_value), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+class Page:
+    def __init__(self, rows, next_cursor, prev_cursor, per_page):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+
+def keyset_page_query(select_sql, filters, params, sort_sql, id_sql, per_page, after=None, before=None):
+    # Запрос страницы: (sql, параметры, листаем ли вперед от курсора, листаем ли назад)
+    after = decode_cursor(after)
+    before = decode_cursor(before) if after is None else None
+
+    filters = list(filters)
+    params = list(params)
+    backwards = before is not None
+    if after is not None:
+        filters.append(f"({sort_sql}, {id_sql}) > (%s, %s)")
+        params.extend(after)
+    elif backwards:
+        filters.append(f"({sort_sql}, {id_sql}) < (%s, %s)")
+        params.extend(before)
+
+    direction = "DESC" if backwards else "ASC"
+    query = select_sql
+    if filters:
+        query += " WHERE " + " AND ".join(filters)
+    query += f" ORDER BY {sort_sql} {direction}, {id_sql} {direction} LIMIT %s"
+    params.append(per_page + 1)
+    return query, params, after is not None, backwards
+
+
+def keyset_page(rows, per_page, row_key, forward, backwards):
+    # Строки запроса keyset_page_query (их на одну больше страницы) -> Page
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    has_next = has_more if not backwards else True
+    has_prev = has_more if backwards else forward
+    next_cursor = encode_cursor(row_key(rows[-1])) if rows and has_next else None
+    prev_cursor = encode_cursor(row_key(rows[0])) if rows and has_prev else None
+    return Page(rows, next_cursor, prev_cursor, per_page)
+
+
+def fetch_page(cur, select_sql, filters, params, sort_sql, id_sql, row_key,
+               per_page, after=None, before=None, record=None):
+    # select_sql - запрос без WHERE/ORDER BY; row_key(row) -> (sort_value, id)
+    query, params, forward, backwards = keyset_page_query(select_sql, filters, params, sort_sql, id_sql,
+                                                          per_page, after, before)
+    rows = cur.run(query, params, record=record).fetchall()
+    return keyset_page(rows, per_page, row_key, forward, backwards)
+
+
+def approximate_count_query(select_sql, filters):
+    query = select_sql
+    if filters:
+        query += " WHERE " + " AND ".join(filters)
+    return "EXPLAIN (FORMAT JSON) " + query
+
+
+def plan_rows(plan):
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def approximate_count(cur, select_sql, filters, params):
+    # Оценка планировщика вместо COUNT(*): не читает таблицу целиком
+    cur.execute(approximate_count_query(select_sql, filters), params)
+    return plan_rows(cur.fetchone()[0])
+
+
+# --- Страница кабинета ---
+# Кабинет, страница его предметов (по названию, keyset) и количество по
+# статусам - одним запросом. Подзапросы в списке выборки выполняются только
+# для найденной строки кабинета: для несуществующего id предметы не читаются.
+# Количество берется из сводки room_status_counts, а не пересчетом предметов.
+def room_detail_query(room_id, per_page, after=None, before=None):
+    after = decode_cursor(after)
+    before = decode_cursor(before) if after is None else None
+    backwards = before is not None
+    direction = "DESC" if backwards else "ASC"
+
+    keyset = ""
+    params = [room_id]
+    if after is not None or backwards:
+        keyset = f"AND (COALESCE(items.name, ''), items.id) {'<' if backwards else '>'} (%s, %s)"
+        params.extend(before if backwards else after)
+    params += [per_page + 1, room_id]
+
+    query = f"""WITH page AS (
+                    SELECT items.id, items.room_id, items.name, items.inventory_number, items.status
+                    FROM items
+                    WHERE items.room_id = %s {keyset}
+                    ORDER BY COALESCE(items.name, '') {direction}, items.id {direction}
+                    LIMIT %s)
+                SELECT rooms.id, rooms.name, rooms.number, rooms.floor, rooms.teacher, rooms.capacity,
+                       (SELECT json_agg(json_build_array(page.id, page.room_id, page.name,
+                                                         page.inventory_number, page.status)
+                                        ORDER BY COALESCE(page.name, '') {direction}, page.id {direction})
+                        FROM page),
+                       (SELECT json_object_agg(c.status, c.item_count)
+                        FROM room_status_counts c WHERE c.room_id = rooms.id),
+                       (SELECT v.version FROM room_versions v WHERE v.room_id = rooms.id)
+                FROM rooms
+                WHERE rooms.id = %s"""
+    return query, params, after is not None, backwards
+
+
+def room_detail_result(row, per_page, forward, backwards):
+    if row is None:
+        return None
+
+    room = Room._make(row[:6])
+    items = [RoomItem._make(item) for item in row[6] or ()]
+    page = keyset_page(items, per_page, lambda item: (item.name or "", item.id), forward, backwards)
+
+    counts = row[7] or {}
+    status_counts = [(status, counts.pop(status, 0)) for status in ITEM_STATUSES]
+    # Прочие статусы (пустые, старые) - одной строкой, как на главной
+    status_counts.append(("Другое", sum(counts.values())))
+    return room, page, status_counts, row[8] or 0
+
+
+def fetch_room_detail(cur, room_id, per_page, after=None, before=None):
+    query, params, forward, backwards = room_detail_query(room_id, per_page, after, before)
+    return room_detail_result(cur.run(query, params).fetchone(), per_page, forward, backwards)
+
+# --- Массовые операции ---
+# Набор предметов задается списком id, текущими фильтрами списка или кабинетом;
+# каждая операция выполняется одним запросом над всем набором.
+def bulk_item_scope(ids=None, values=None, room_id=None):
+    if ids is not None:
+        return "items.id = ANY(%s)", [list(ids)]
+    if room_id is not None:
+        return "items.room_id = %s", [room_id]
+    filters, params = build_item_filters(values or {})
+    if not filters:
+        raise ValueError("Не заданы фильтры для массовой операции")
+    # Фильтры ссылаются на rooms, поэтому отбор идет через подзапрос с JOIN
+    return ("items.id IN (SELECT items.id FROM items JOIN rooms ON items.room_id = rooms.id WHERE "
+            + " AND ".join(filters) + ")"), params
+
+
+def bulk_item_statement(action, scope_sql, scope_params, status=None, room_id=None):
+    if action == "status":
+        if status not in ITEM_STATUSES:
+            raise ValueError(f"Неизвестный статус: {status}")
+        return f"UPDATE items SET status = %s WHERE {scope_sql}", [status] + scope_params
+    if action == "move":
+        # Если целевого кабинета нет, JOIN с rooms просто ничего не обновит
+        return (f"UPDATE items SET room_id = target.id FROM rooms target WHERE target.id = %s AND {scope_sql}",
+                [room_id] + scope_params)
+    if action == "delete":
+        return f"DELETE FROM items WHERE {scope_sql}", scope_params
+    raise ValueError(f"Неизвестная операция: {action}")
+
+
+# --- Версии таблиц для условных ответов ---
+def fetch_table_versions(cur, tables):
+    cur.run("SELECT table_name, version, updated_at FROM table_versions WHERE table_name = ANY(%s)",
+            (list(tables),))
+    return {table: (version, updated_at) for table, version, updated_at in cur.fetchall()}
+
+
+# --- Сводка для главной страницы ---
+# Читается из room_status_counts, поэтому стоимость зависит от числа
+# кабинетов, а не предметов.
+DASHBOARD_TOP_BROKEN = 5
+
+
+def fetch_dashboard(cur):
+    cur.run("SELECT status, sum(item_count) FROM room_status_counts GROUP BY status")
+    totals = {status: int(count) for status, count in cur.fetchall()}
+    status_totals = [(status, totals.pop(status, 0)) for status in ITEM_STATUSES]
+    # Статусы вне справочника (старые данные, пустые) показываются одной строкой
+    other = sum(totals.values())
+
+    cur.run("""SELECT rooms.id, rooms.name, rooms.number, rooms.floor,
+                      COALESCE(sum(c.item_count), 0),
+                      COALESCE(sum(c.item_count) FILTER (WHERE c.status = %s), 0),
+                      COALESCE(sum(c.item_count) FILTER (WHERE c.status = %s), 0),
+                      COALESCE(sum(c.item_count) FILTER (WHERE c.status = %s), 0)
+               FROM rooms
+               LEFT JOIN room_status_counts c ON c.room_id = rooms.id
+               GROUP BY rooms.id
+               ORDER BY COALESCE(rooms.number, ''), rooms.id""", ITEM_STATUSES)
+    rooms = [{
+        'id': row[0],
+        'name': row[1],
+        'number': row[2],
+        'floor': row[3],
+        'total': int(row[4]),
+        'statuses': dict(zip(ITEM_STATUSES, (int(count) for count in row[5:]))),
+    } for row in cur.fetchall()]
+
+    floors = {}
+    for room in rooms:
+        floor = floors.setdefault(room['floor'] or "", {'floor': room['floor'], 'rooms': 0, 'total': 0,
+                                                        'statuses': dict.fromkeys(ITEM_STATUSES, 0)})
+        floor['rooms'] += 1
+        floor['total'] += room['total']
+        for status, count in room['statuses'].items():
+            floor['statuses'][status] += count
+
+    broken = [room for room in rooms if room['statuses']['Не работает']]
+    broken.sort(key=lambda room: (-room['statuses']['Не работает'], -room['statuses']['Ремонт'], room['id']))
+
+    return {
+        'total': sum(count for _, count in status_totals) + other,
+        'status_totals': status_totals,
+        'other_status': other,
+        'rooms': rooms,
+        'floors': [floors[key] for key in sorted(floors)],
+        'top_broken': broken[:DASHBOARD_TOP_BROKEN],
+    }
+
+
+# --- Глобальный поиск ---
+# Все слова запроса должны найтись в векторе кабинета или предмета. Слова из букв
+# проходят через словарь russian ("проекторы" -> 'проектор'), слова с цифрами
+# и знаками (инвентарные и номера кабинетов) сравниваются как есть.
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+MAX_SEARCH_WORDS = 8
+# Широкий запрос ("стул") совпадает с сотнями тысяч предметов; ранжируются
+# только SEARCH_CANDIDATES первых найденных, чтобы время не росло вместе с
+# числом совпадений. Чтобы среди них точно были лучшие, кандидаты берутся
+# двумя списками: совпадения в названии и номере самого предмета (их ts_rank
+# выше всего, см. schema.ITEM_OWN_SEARCH_VECTOR) и любые совпадения
+SEARCH_CANDIDATES = 300
+SEARCH_PREFIX_MIN = 2
+AUTOCOMPLETE_LIMIT = 10
+
+_SEARCH_WORD_RE = re.compile(r"[^\s'\\:&|!()<>*]+")
+
+
+def search_limit(args, default=SEARCH_LIMIT):
+    try:
+        value = int(args.get("limit", default))
+    except (TypeError, ValueError):
+        value = default
+    return max(1, min(value, MAX_SEARCH_LIMIT))
+
+
+def build_search_query(text, prefix=True):
+    # SQL-выражение tsquery и его параметры; None, если искать нечего
+    words = [word.strip('.,;-/"') for word in _SEARCH_WORD_RE.findall((text or "").lower())]
+    words = [word for word in words if word][:MAX_SEARCH_WORDS]
+    # По началу ищется только последнее слово - его еще набирают, и только от
+    # двух символов
+    terms = [(word, ":*" if prefix and i == len(words) - 1 and len(word) >= SEARCH_PREFIX_MIN else "")
+             for i, word in enumerate(words)]
+    stemmed = [f"'{word}'{suffix}" for word, suffix in terms if word.isalpha()]
+    exact = [f"'{word}'{suffix}" for word, suffix in terms if not word.isalpha()]
+    parts, params = [], []
+    if stemmed:
+        parts.append("to_tsquery('russian', %s)")
+        params.append(" & ".join(stemmed))
+    if exact:
+        parts.append("%s::tsquery")
+        params.append(" & ".join(exact))
+    if not parts:
+        return None
+    return "(" + " && ".join(parts) + ")", params
+
+
+def _search_items(cur, query, limit):
+    # Последняя колонка - сколько найдено любых совпадений (не больше
+    # SEARCH_CANDIDATES): если столько, ранжировались не все
+    tsquery, params = query
+    cur.execute(f"""WITH own AS (SELECT items.id FROM items
+                                 WHERE {ITEM_OWN_SEARCH_VECTOR} @@ {tsquery}
+                                 LIMIT %s),
+                         found AS (SELECT items.id FROM items
+                                   WHERE items.search_vector @@ {tsquery}
+                                   LIMIT %s)
+                    SELECT items.id, items.name, items.inventory_number, items.status, rooms.name, rooms.number,
+                           items.room_id, (SELECT count(*) FROM found)
+                    FROM (SELECT id FROM own UNION SELECT id FROM found) AS c
+                    JOIN items ON items.id = c.id
+                    LEFT JOIN rooms ON rooms.id = items.room_id
+                    ORDER BY ts_rank(items.search_vector, {tsquery}) DESC, items.id
+                    LIMIT %s""", params + [SEARCH_CANDIDATES] + params + [SEARCH_CANDIDATES] + params + [limit])
+    return cur.fetchall()
+
+
+def search_inventory(cur, text, limit=SEARCH_LIMIT):
+    query = build_search_query(text)
+    if query is None:
+        return {'rooms': [], 'items': [], 'truncated': False}
+    tsquery, params = query
+
+    # Кабинетов немного - по ним сразу ищется и префикс. Поиск не готовится
+    # заранее: план зависит от того, насколько часто встречаются слова
+    cur.run(f"""SELECT rooms.id, rooms.name, rooms.number, rooms.floor, rooms.teacher, rooms.capacity
+                FROM rooms
+                WHERE rooms.search_vector @@ {tsquery}
+                ORDER BY ts_rank(rooms.search_vector, {tsquery}) DESC, COALESCE(rooms.number, ''), rooms.id
+                LIMIT %s""", params + params + [limit], record=Room, prepare=False)
+    rooms = cur.fetchall()
+
+    # По предметам сначала ищутся целые слова: префикс последнего слова
+    # отключает быстрое пересечение списков в GIN и на сотнях тысяч строк
+    # обходится в разы дороже. Префиксный запрос выполняется, только если
+    # целых слов не хватило на страницу (слово еще не дописано)
+    whole_words = build_search_query(text, prefix=False)
+    rows = _search_items(cur, whole_words, limit)
+    if len(rows) < limit and whole_words != query:
+        rows = _search_items(cur, query, limit)
+    return {
+        'rooms': rooms,
+        'items': [Item._make(row[:7]) for row in rows],
+        # Совпадений больше, чем ранжировалось: стоит уточнить запрос
+        'truncated': bool(rows) and rows[0][7] >= SEARCH_CANDIDATES,
+    }
+
+
+def autocomplete_inventory_numbers(cur, prefix, limit=AUTOCOMPLETE_LIMIT):
+    prefix = (prefix or "").strip().lower()
+    if not prefix:
+        return []
+    pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    cur.execute("""SELECT items.inventory_number, items.name, items.id, items.room_id
+                   FROM items
+                   WHERE lower(items.inventory_number) COLLATE "C" LIKE %s
+                   ORDER BY lower(items.inventory_number) COLLATE "C"
+                   LIMIT %s""", (pattern, limit))
+    return [dict(zip(('inventory_number', 'name', 'id', 'room_id'), row)) for row in cur.fetchall()]
@@ -0,0 +1,465 @@
+import psycopg2
+
+# --- Таблицы ---
+def create_tables(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS rooms
+                 (id SERIAL PRIMARY KEY,
+                  name TEXT,
+                  number TEXT,
+                  floor TEXT,
+                  teacher TEXT,
+                  capacity INTEGER)''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS items
+                 (id SERIAL PRIMARY KEY,
+                  room_id INTEGER REFERENCES rooms(id),
+                  name TEXT,
+                  inventory_number TEXT,
+                  status TEXT)''')
+
+
+# --- Версии таблиц ---
+# Любое изменение rooms/items увеличивает версию таблицы (триггер уровня
+# оператора). По версиям строятся ETag/Last-Modified для JSON API.
+def create_change_tracking(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS table_versions
+                 (table_name TEXT PRIMARY KEY,
+                  version BIGINT NOT NULL DEFAULT 1,
+                  updated_at TIMESTAMPTZ NOT NULL DEFAULT now())''')
+    cur.execute('''INSERT INTO table_versions (table_name) VALUES ('rooms'), ('items')
+                 ON CONFLICT (table_name) DO NOTHING''')
+
+    cur.execute('''CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+                 BEGIN
+                     UPDATE table_versions
+                     SET version = version + 1, updated_at = now()
+                     WHERE table_name = TG_TABLE_NAME;
+                     RETURN NULL;
+                 END;
+                 $$ LANGUAGE plpgsql''')
+
+    for table in ("rooms", "items"):
+        cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = %s AND tgrelid = %s::regclass",
+                    (f"{table}_version_trg", table))
+        if not cur.fetchone():
+            cur.execute(f'''CREATE TRIGGER {table}_version_trg
+                          AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                          FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()''')
+
+
+# --- Сводка для главной страницы ---
+# Количество предметов по (кабинет, статус) поддерживается триггерами уровня
+# оператора с таблицами переходов: массовая операция над тысячами строк
+# обновляет сводку одним запросом на каждую затронутую пару. Предметы без
+# кабинета учитываются под room_id = 0, без статуса - под пустым статусом.
+SUMMARY_TRIGGERS = {
+    "items_summary_ins_trg": "AFTER INSERT ON items REFERENCING NEW TABLE AS new_items",
+    "items_summary_upd_trg": "AFTER UPDATE ON items REFERENCING OLD TABLE AS old_items NEW TABLE AS new_items",
+    "items_summary_del_trg": "AFTER DELETE ON items REFERENCING OLD TABLE AS old_items",
+}
+
+
+def create_inventory_summary(cur):
+    cur.execute("SELECT to_regclass('room_status_counts') IS NOT NULL")
+    exists = cur.fetchone()[0]
+    cur.execute('''CREATE TABLE IF NOT EXISTS room_status_counts
+                 (room_id INTEGER NOT NULL,
+                  status TEXT NOT NULL,
+                  item_count BIGINT NOT NULL,
+                  PRIMARY KEY (room_id, status))''')
+
+    cur.execute('''CREATE OR REPLACE FUNCTION apply_items_summary() RETURNS trigger AS $$
+                 BEGIN
+                     -- Пары сортируются, чтобы параллельные операции блокировали строки в одном порядке
+                     IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                         INSERT INTO room_status_counts (room_id, status, item_count)
+                         SELECT COALESCE(room_id, 0), COALESCE(status, ''), -count(*)
+                         FROM old_items GROUP BY 1, 2 ORDER BY 1, 2
+                         ON CONFLICT (room_id, status)
+                         DO UPDATE SET item_count = room_status_counts.item_count + EXCLUDED.item_count;
+                     END IF;
+                     IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                         INSERT INTO room_status_counts (room_id, status, item_count)
+                         SELECT COALESCE(room_id, 0), COALESCE(status, ''), count(*)
+                         FROM new_items GROUP BY 1, 2 ORDER BY 1, 2
+                         ON CONFLICT (room_id, status)
+                         DO UPDATE SET item_count = room_status_counts.item_count + EXCLUDED.item_count;
+                     END IF;
+                     DELETE FROM room_status_counts WHERE item_count = 0;
+                     RETURN NULL;
+                 END;
+                 $$ LANGUAGE plpgsql''')
+
+    if not exists:
+        # Первичное заполнение: запись в items блокируется до конца транзакции,
+        # чтобы между подсчетом и созданием триггеров ничего не потерялось
+        cur.execute("LOCK TABLE items IN SHARE MODE")
+        cur.execute('''INSERT INTO room_status_counts (room_id, status, item_count)
+                     SELECT COALESCE(room_id, 0), COALESCE(status, ''), count(*)
+                     FROM items GROUP BY 1, 2''')
+
+    for name, event in SUMMARY_TRIGGERS.items():
+        cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = %s AND tgrelid = 'items'::regclass", (name,))
+        if not cur.fetchone():
+            cur.execute(f'''CREATE TRIGGER {name} {event}
+                          FOR EACH STATEMENT EXECUTE FUNCTION apply_items_summary()''')
+
+
+def rebuild_inventory_summary(cur):
+    # Пересчет с нуля (например, после TRUNCATE items, который триггеры не видят)
+    cur.execute("LOCK TABLE items IN SHARE MODE")
+    cur.execute("DELETE FROM room_status_counts")
+    cur.execute('''INSERT INTO room_status_counts (room_id, status, item_count)
+                 SELECT COALESCE(room_id, 0), COALESCE(status, ''), count(*)
+                 FROM items GROUP BY 1, 2''')
+
+
+# --- Индексы ---
+# B-tree: ключ соединения items -> rooms, точный фильтр по статусу и
+# функциональный индекс под порядок страниц списка кабинетов.
+BTREE_INDEXES = {
+    "items_room_id_idx": "CREATE INDEX IF NOT EXISTS items_room_id_idx ON items (room_id)",
+    "items_status_idx": "CREATE INDEX IF NOT EXISTS items_status_idx ON items (status)",
+    "rooms_number_id_idx": "CREATE INDEX IF NOT EXISTS rooms_number_id_idx ON rooms ((COALESCE(number, '')), id)",
+}
+
+# GIN-индексы pg_trgm: позволяют выполнять ILIKE '%...%' без полного сканирования
+TRIGRAM_INDEXES = {
+    "rooms_name_trgm_idx": "CREATE INDEX IF NOT EXISTS rooms_name_trgm_idx ON rooms USING gin (name gin_trgm_ops)",
+    "rooms_number_trgm_idx": "CREATE INDEX IF NOT EXISTS rooms_number_trgm_idx ON rooms USING gin (number gin_trgm_ops)",
+    "rooms_floor_trgm_idx": "CREATE INDEX IF NOT EXISTS rooms_floor_trgm_idx ON rooms USING gin (floor gin_trgm_ops)",
+    "rooms_teacher_trgm_idx": "CREATE INDEX IF NOT EXISTS rooms_teacher_trgm_idx ON rooms USING gin (teacher gin_trgm_ops)",
+    "items_name_trgm_idx": "CREATE INDEX IF NOT EXISTS items_name_trgm_idx ON items USING gin (name gin_trgm_ops)",
+    "items_inventory_number_trgm_idx": "CREATE INDEX IF NOT EXISTS items_inventory_number_trgm_idx ON items USING gin (inventory_number gin_trgm_ops)",
+}
+
+
+def enable_trigram(cur):
+    # Расширение может быть недоступно (нет пакета contrib или прав) -
+    # тогда работаем без триграммных индексов
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    if cur.fetchone():
+        return True
+    cur.execute("SAVEPOINT enable_trgm")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT enable_trgm")
+        print(f"pg_trgm is not available, ILIKE filters will use sequential scans: {str(e).splitlines()[0]}")
+        return False
+    cur.execute("RELEASE SAVEPOINT enable_trgm")
+    return True
+
+
+def create_indexes(cur):
+    for ddl in BTREE_INDEXES.values():
+        cur.execute(ddl)
+    trigram = enable_trigram(cur)
+    if trigram:
+        for ddl in TRIGRAM_INDEXES.values():
+            cur.execute(ddl)
+    return trigram
+
+
+def trigram_indexes_present(cur):
+    cur.execute("SELECT count(*) FROM pg_indexes WHERE indexname = ANY(%s)", (list(TRIGRAM_INDEXES),))
+    return cur.fetchone()[0] == len(TRIGRAM_INDEXES)
+
+
+# Страница кабинета: предметы кабинета в порядке названия читаются по индексу
+# до LIMIT, без сортировки всех предметов склада
+ROOM_PAGE_INDEX = '''CREATE INDEX IF NOT EXISTS items_room_name_id_idx
+                     ON items (room_id, (COALESCE(name, '')), id)'''
+
+
+def create_room_page_index(cur):
+    cur.execute(ROOM_PAGE_INDEX)
+
+
+# Точный поиск по инвентарному номеру: импорт сопоставляет строки файла с
+# предметами по номеру. Индекс подсказок построен по lower(...) COLLATE "C"
+# и для равенства по самой колонке не подходит
+INVENTORY_NUMBER_INDEX = "CREATE INDEX IF NOT EXISTS items_inventory_number_idx ON items (inventory_number)"
+
+
+def create_inventory_number_index(cur):
+    cur.execute(INVENTORY_NUMBER_INDEX)
+
+
+# --- Счетчики изменений кабинетов ---
+# Увеличиваются при любой записи в кабинет или его предметы (в том числе
+# массовых операциях и импорте) триггерами уровня оператора. Страницы читают
+# счетчик вместе со строками, и по нему кэшируются отрисованные строки таблиц
+# (fragments.py): пока счетчик кабинета не изменился, его строки те же.
+# Кабинет без строки в room_versions имеет счетчик 0.
+ROOM_VERSION_TRIGGERS = {
+    "items_room_version_ins_trg": ("items", "AFTER INSERT ON items REFERENCING NEW TABLE AS new_rows"),
+    "items_room_version_upd_trg": ("items", "AFTER UPDATE ON items REFERENCING OLD TABLE AS old_rows "
+                                            "NEW TABLE AS new_rows"),
+    "items_room_version_del_trg": ("items", "AFTER DELETE ON items REFERENCING OLD TABLE AS old_rows"),
+    "rooms_room_version_ins_trg": ("rooms", "AFTER INSERT ON rooms REFERENCING NEW TABLE AS new_rows"),
+    "rooms_room_version_upd_trg": ("rooms", "AFTER UPDATE ON rooms REFERENCING OLD TABLE AS old_rows "
+                                            "NEW TABLE AS new_rows"),
+    "rooms_room_version_del_trg": ("rooms", "AFTER DELETE ON rooms REFERENCING OLD TABLE AS old_rows"),
+}
+
+
+def create_room_versions(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS room_versions
+                 (room_id INTEGER PRIMARY KEY,
+                  version BIGINT NOT NULL DEFAULT 1)''')
+
+    # Ключ кабинета: room_id у предмета, id у кабинета. Кабинеты сортируются,
+    # чтобы параллельные операции блокировали строки в одном порядке
+    cur.execute('''CREATE OR REPLACE FUNCTION bump_room_versions() RETURNS trigger AS $$
+                 DECLARE
+                     key TEXT := CASE TG_TABLE_NAME WHEN 'items' THEN 'room_id' ELSE 'id' END;
+                     changed TEXT;
+                 BEGIN
+                     changed := CASE TG_OP
+                         WHEN 'INSERT' THEN format('SELECT %1$I FROM new_rows', key)
+                         WHEN 'DELETE' THEN format('SELECT %1$I FROM old_rows', key)
+                         ELSE format('SELECT %1$I FROM old_rows UNION SELECT %1$I FROM new_rows', key)
+                     END;
+                     EXECUTE format('INSERT INTO room_versions (room_id)
+                                     SELECT DISTINCT room_id FROM (%s) AS changed (room_id)
+                                     WHERE room_id IS NOT NULL ORDER BY room_id
+                                     ON CONFLICT (room_id) DO UPDATE SET version = room_versions.version + 1',
+                                    changed);
+                     RETURN NULL;
+                 END;
+                 $$ LANGUAGE plpgsql''')
+
+    for name, (table, event) in ROOM_VERSION_TRIGGERS.items():
+        cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = %s AND tgrelid = %s::regclass", (name, table))
+        if not cur.fetchone():
+            cur.execute(f'''CREATE TRIGGER {name} {event}
+                          FOR EACH STATEMENT EXECUTE FUNCTION bump_room_versions()''')
+
+
+# --- Журнал изменений для инкрементальной синхронизации ---
+# Каждая изменившаяся строка rooms/items - запись в change_log: операция, id
+# строки, изменившиеся колонки и номер seq (триггеры уровня оператора с
+# таблицами переходов, одна вставка на оператор). UPDATE без изменений
+# отслеживаемых колонок (пересчет search_vector) не записывается; TRUNCATE -
+# одна запись без id: потребителю нужна полная выгрузка.
+# Номер seq выдается при вставке, а фиксируются транзакции в другом порядке:
+# пока транзакция с меньшим seq не зафиксирована, ее записи не видны, и
+# читатель не должен уходить курсором дальше них. Поэтому каждая пишущая
+# транзакция первым делом резервирует номер последовательности и держит до
+# конца advisory-блокировку с этим номером (ключ уникален - никто ее не ждет),
+# а все ее записи получают seq больше резерва. Читатель возвращает только
+# записи ниже change_log_watermark(): последнего выданного номера и
+# наименьшего резерва незавершенных транзакций. Общей блокировки нет:
+# из-за журнала пишущие транзакции друг друга не ждут. Последовательность без
+# кэша (CACHE 1): с кэшем номера разных сессий шли бы не по порядку выдачи.
+CHANGE_LOG_LOCK_CLASS = 0x1D0_C4A6
+CHANGE_LOG_COLUMNS = {
+    "rooms": ("name", "number", "floor", "teacher", "capacity"),
+    "items": ("room_id", "name", "inventory_number", "status"),
+}
+CHANGE_LOG_TRIGGERS = {
+    "items_change_log_ins_trg": ("items", "AFTER INSERT ON items REFERENCING NEW TABLE AS new_rows"),
+    "items_change_log_upd_trg": ("items", "AFTER UPDATE ON items REFERENCING OLD TABLE AS old_rows "
+                                          "NEW TABLE AS new_rows"),
+    "items_change_log_del_trg": ("items", "AFTER DELETE ON items REFERENCING OLD TABLE AS old_rows"),
+    "items_change_log_truncate_trg": ("items", "AFTER TRUNCATE ON items"),
+    "rooms_change_log_ins_trg": ("rooms", "AFTER INSERT ON rooms REFERENCING NEW TABLE AS new_rows"),
+    "rooms_change_log_upd_trg": ("rooms", "AFTER UPDATE ON rooms REFERENCING OLD TABLE AS old_rows "
+                                          "NEW TABLE AS new_rows"),
+    "rooms_change_log_del_trg": ("rooms", "AFTER DELETE ON rooms REFERENCING OLD TABLE AS old_rows"),
+    "rooms_change_log_truncate_trg": ("rooms", "AFTER TRUNCATE ON rooms"),
+}
+
+
+def create_change_log(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS change_log
+                 (seq BIGINT GENERATED ALWAYS AS IDENTITY (CACHE 1) PRIMARY KEY,
+                  table_name TEXT NOT NULL,
+                  op TEXT NOT NULL,
+                  row_id INTEGER,
+                  changed_columns TEXT[],
+                  changed_at TIMESTAMPTZ NOT NULL DEFAULT now())''')
+    # Поиск прежних записей той же строки при сжатии журнала
+    cur.execute('''CREATE INDEX IF NOT EXISTS change_log_row_idx
+                 ON change_log (table_name, row_id, seq)''')
+    # purged_through - до какого seq журнал удален по сроку хранения,
+    # compacted_through - до какого seq уже сжат (changelog.compact_change_log)
+    cur.execute('''CREATE TABLE IF NOT EXISTS change_log_state
+                 (id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+                  purged_through BIGINT NOT NULL DEFAULT 0,
+                  compacted_through BIGINT NOT NULL DEFAULT 0)''')
+    cur.execute("INSERT INTO change_log_state DEFAULT VALUES ON CONFLICT (id) DO NOTHING")
+
+    create_change_log_functions(cur)
+
+    for name, (table, event) in CHANGE_LOG_TRIGGERS.items():
+        cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = %s AND tgrelid = %s::regclass", (name, table))
+        if not cur.fetchone():
+            args = ", ".join(f"'{column}'" for column in CHANGE_LOG_COLUMNS[table])
+            cur.execute(f'''CREATE TRIGGER {name} {event}
+                          FOR EACH STATEMENT EXECUTE FUNCTION log_row_changes({args})''')
+
+
+def create_change_log_functions(cur):
+    # Отслеживаемые колонки передаются аргументами триггера. Резерв - один на
+    # транзакцию (отметка в локальной настройке сбрасывается вместе с ней)
+    cur.execute(f'''CREATE OR REPLACE FUNCTION log_row_changes() RETURNS trigger AS $$
+                  DECLARE
+                      columns TEXT[] := TG_ARGV;
+                      changed TEXT;
+                      reserved BIGINT;
+                  BEGIN
+                      IF current_setting('inventory.change_log_xact', true)
+                         IS DISTINCT FROM pg_current_xact_id()::text THEN
+                          reserved := nextval('change_log_seq_seq');
+                          PERFORM pg_advisory_xact_lock({CHANGE_LOG_LOCK_CLASS},
+                                                        ((reserved + 2147483648) % 4294967296 - 2147483648)::int);
+                          PERFORM set_config('inventory.change_log_xact', pg_current_xact_id()::text, true);
+                      END IF;
+                      IF TG_OP = 'TRUNCATE' THEN
+                          INSERT INTO change_log (table_name, op) VALUES (TG_TABLE_NAME, 'truncate');
+                      ELSIF TG_OP = 'INSERT' THEN
+                          INSERT INTO change_log (table_name, op, row_id, changed_columns)
+                          SELECT TG_TABLE_NAME, 'insert', id, columns FROM new_rows ORDER BY id;
+                      ELSIF TG_OP = 'DELETE' THEN
+                          INSERT INTO change_log (table_name, op, row_id)
+                          SELECT TG_TABLE_NAME, 'delete', id FROM old_rows ORDER BY id;
+                      ELSE
+                          SELECT string_agg(format('CASE WHEN n.%1$I IS DISTINCT FROM o.%1$I THEN %1$L END',
+                                                   col), ', ')
+                          INTO changed FROM unnest(columns) AS col;
+                          EXECUTE format('INSERT INTO change_log (table_name, op, row_id, changed_columns)
+                                          SELECT %L, ''update'', id, changed
+                                          FROM (SELECT n.id, array_remove(ARRAY[%s]::text[], NULL) AS changed
+                                                FROM new_rows n JOIN old_rows o ON o.id = n.id) AS diff
+                                          WHERE changed <> ''{{}}'' ORDER BY id',
+                                         TG_TABLE_NAME, changed);
+                      END IF;
+                      RETURN NULL;
+                  END;
+                  $$ LANGUAGE plpgsql''')
+
+    # Первый seq, который читатель еще не может отдать. Порядок важен: сначала
+    # последний выданный номер, потом блокировки. Транзакция, взявшая резерв
+    # после чтения последовательности, получит только большие номера; взявшая
+    # раньше - либо еще держит блокировку, либо уже зафиксирована и будет
+    # видна следующему оператору читателя. Из ключа блокировки (младшие 32
+    # бита) резерв восстанавливается относительно последнего номера
+    cur.execute(f'''CREATE OR REPLACE FUNCTION change_log_watermark() RETURNS BIGINT AS $$
+                  DECLARE
+                      issued BIGINT;
+                      pending BIGINT;
+                  BEGIN
+                      SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END
+                      INTO issued FROM change_log_seq_seq;
+                      SELECT min(issued - ((issued - objid::bigint) % 4294967296 + 4294967296) % 4294967296)
+                      INTO pending
+                      FROM pg_locks
+                      WHERE locktype = 'advisory' AND objsubid = 2 AND classid = {CHANGE_LOG_LOCK_CLASS}
+                        AND database = (SELECT oid FROM pg_database WHERE datname = current_database());
+                      RETURN LEAST(issued + 1, pending);
+                  END;
+                  $$ LANGUAGE plpgsql VOLATILE''')
+
+
+def drop_indexes(cur):
+    for name in list(BTREE_INDEXES) + list(TRIGRAM_INDEXES):
+        cur.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+# --- Полнотекстовый поиск ---
+# У кабинета tsvector - генерируемая колонка. У предмета в вектор входят и
+# поля его кабинета, поэтому колонку заполняют триггеры: при записи предмета
+# и при изменении названия, номера или ответственного кабинета.
+# Инвентарный номер хранится одной лексемой ('inv-0000123'), а не разбирается
+# парсером на части: иначе общий префикс 'inv' совпадал бы у всех предметов.
+SEARCH_INDEXES = {
+    "items_search_idx": "CREATE INDEX IF NOT EXISTS items_search_idx ON items USING gin (search_vector)",
+    "rooms_search_idx": "CREATE INDEX IF NOT EXISTS rooms_search_idx ON rooms USING gin (search_vector)",
+    # Подсказки по началу инвентарного номера: в порядке "C" индекс годится
+    # и для LIKE 'префикс%', и для ORDER BY без сортировки совпадений
+    "items_inventory_number_prefix_idx": '''CREATE INDEX IF NOT EXISTS items_inventory_number_prefix_idx
+                                          ON items ((lower(inventory_number) COLLATE "C"))''',
+}
+
+
+def create_search(cur):
+    cur.execute("""CREATE OR REPLACE FUNCTION items_search_vector(item_name TEXT, inventory_number TEXT,
+                                                                room_name TEXT, room_number TEXT, teacher TEXT)
+                 RETURNS tsvector AS $$
+                     SELECT setweight(CASE WHEN COALESCE(inventory_number, '') = '' THEN ''::tsvector
+                                           ELSE ('''' || replace(replace(lower(inventory_number), '\\', ''),
+                                                                 '''', '''''') || ''':1')::tsvector END, 'A')
+                         || setweight(to_tsvector('russian', COALESCE(item_name, '')), 'A')
+                         || setweight(to_tsvector('russian', COALESCE(room_number, '') || ' ' || COALESCE(room_name, '')), 'B')
+                         || setweight(to_tsvector('russian', COALESCE(teacher, '')), 'C')
+                 $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE""")
+
+    cur.execute('''ALTER TABLE rooms ADD COLUMN IF NOT EXISTS search_vector tsvector
+                 GENERATED ALWAYS AS (
+                     setweight(to_tsvector('russian', COALESCE(number, '') || ' ' || COALESCE(name, '')), 'A')
+                     || setweight(to_tsvector('russian', COALESCE(teacher, '')), 'B')
+                 ) STORED''')
+    cur.execute("ALTER TABLE items ADD COLUMN IF NOT EXISTS search_vector tsvector")
+
+    cur.execute('''CREATE OR REPLACE FUNCTION items_search_vector_update() RETURNS trigger AS $$
+                 BEGIN
+                     SELECT items_search_vector(NEW.name, NEW.inventory_number, r.name, r.number, r.teacher)
+                     INTO NEW.search_vector
+                     FROM (SELECT 1) AS one LEFT JOIN rooms r ON r.id = NEW.room_id;
+                     RETURN NEW;
+                 END;
+                 $$ LANGUAGE plpgsql''')
+    cur.execute('''CREATE OR REPLACE FUNCTION rooms_search_vector_propagate() RETURNS trigger AS $$
+                 BEGIN
+                     UPDATE items
+                     SET search_vector = items_search_vector(items.name, items.inventory_number,
+                                                             NEW.name, NEW.number, NEW.teacher)
+                     WHERE items.room_id = NEW.id;
+                     RETURN NULL;
+                 END;
+                 $$ LANGUAGE plpgsql''')
+
+    cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'items_search_trg' AND tgrelid = 'items'::regclass")
+    if not cur.fetchone():
+        # Создание триггера блокирует запись в items до конца транзакции,
+        # поэтому заполнение ниже не пропустит параллельных изменений
+        cur.execute('''CREATE TRIGGER items_search_trg
+                     BEFORE INSERT OR UPDATE OF name, inventory_number, room_id ON items
+                     FOR EACH ROW EXECUTE FUNCTION items_search_vector_update()''')
+        # Заполнение не меняет кабинет и статус - сводку пересчитывать незачем
+        cur.execute("ALTER TABLE items DISABLE TRIGGER items_summary_upd_trg")
+        cur.execute('''UPDATE items
+                     SET search_vector = items_search_vector(items.name, items.inventory_number,
+                                                             rooms.name, rooms.number, rooms.teacher)
+                     FROM rooms WHERE rooms.id = items.room_id''')
+        cur.execute('''UPDATE items
+                     SET search_vector = items_search_vector(name, inventory_number, NULL, NULL, NULL)
+                     WHERE room_id IS NULL''')
+        cur.execute("ALTER TABLE items ENABLE TRIGGER items_summary_upd_trg")
+
+    cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'rooms_search_trg' AND tgrelid = 'rooms'::regclass")
+    if not cur.fetchone():
+        cur.execute('''CREATE TRIGGER rooms_search_trg
+                     AFTER UPDATE OF name, number, teacher ON rooms
+                     FOR EACH ROW
+                     WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.number IS DISTINCT FROM NEW.number
+                           OR OLD.teacher IS DISTINCT FROM NEW.teacher)
+                     EXECUTE FUNCTION rooms_search_vector_propagate()''')
+
+    for ddl in SEARCH_INDEXES.values():
+        cur.execute(ddl)
+
+
+# Совпадение в собственных полях предмета (название, инвентарный номер - вес A)
+# ранжируется выше совпадения по кабинету или ответственному (B, C). Индекс по
+# этой части вектора дает поиску такие совпадения первыми, без ts_rank по всем
+# найденным строкам (queries._search_items)
+ITEM_OWN_SEARCH_VECTOR = "items_search_vector(name, inventory_number, NULL, NULL, NULL)"
+ITEM_OWN_SEARCH_INDEX = f"CREATE INDEX IF NOT EXISTS items_own_search_idx ON items USING gin (({ITEM_OWN_SEARCH_VECTOR}))"
+
+
+def create_item_own_search_index(cur):
+    cur.execute(ITEM_OWN_SEARCH_INDEX)
+
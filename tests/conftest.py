@@ -0,0 +1,66 @@
+"""Тесты с настоящим Postgres: сервер берется из TEST_DATABASE_URL (или
+DATABASE_URL), на нем создается временная база с актуальной схемой. Без
+сервера такие тесты пропускаются.
+
+Настройки приложения читаются из окружения при импорте модулей, поэтому
+приложение с нужными настройками запускается в отдельном процессе
+(run_python).
+"""
+import os
+import subprocess
+import sys
+
+import psycopg2
+import pytest
+
+from bench.suite import URL_VARIABLES
+from bench.throwaway import throwaway_database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def server_url():
+    url = os.environ.get("TEST_DATABASE_URL") or os.environ.get("DATABASE_URL")
+    if not url:
+        pytest.skip("нужен TEST_DATABASE_URL или DATABASE_URL")
+    try:
+        psycopg2.connect(url, connect_timeout=3).close()
+    except psycopg2.Error as e:
+        pytest.skip(f"база недоступна: {e}")
+    return url
+
+
+@pytest.fixture
+def database_url(server_url):
+    from migrations import migrate
+
+    with throwaway_database(server_url) as dsn:
+        conn = psycopg2.connect(dsn)
+        migrate(conn)
+        conn.close()
+        yield dsn
+
+
+def app_env(database_url=None, **settings):
+    env = {key: value for key, value in os.environ.items()
+           if key not in URL_VARIABLES and key not in ("DATABASE_URL", "TEST_DATABASE_URL")}
+    if database_url is not None:
+        env["DATABASE_URL"] = database_url
+    env.update(AUTO_MIGRATE="0", PYTHONPATH=ROOT, **settings)
+    return env
+
+
+def run_python(source, env, *args, **kwargs):
+    # Процесс с приложением; source выполняется как скрипт с аргументами args
+    return subprocess.Popen([sys.executable, "-c", source, *map(str, args)], cwd=ROOT, env=env, text=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+
+
+def read_marker(process, markers):
+    # Первая строка вывода из markers; строки журнала приложения пропускаются.
+    # None - процесс завершился, не выведя ни одной
+    for line in process.stdout:
+        if line.strip() in markers:
+            return line.strip()
+    return None
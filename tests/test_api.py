@@ -0,0 +1,64 @@
+import json
+
+import psycopg2
+
+from tests.conftest import app_env, run_python
+
+REQUESTS = """
+import json, sys, time
+import app
+
+app.start_worker()
+while not app.readiness.ready:
+    time.sleep(0.05)
+client = app.app.test_client()
+for url in sys.argv[1:]:
+    response = client.get(url)
+    print("result", json.dumps([response.status_code, response.content_type, response.get_json(silent=True)]),
+          flush=True)
+"""
+
+
+def get_json(database_url, *urls):
+    out, err = run_python(REQUESTS, app_env(database_url), *urls).communicate(timeout=60)
+    results = [json.loads(line[len("result "):]) for line in out.splitlines() if line.startswith("result ")]
+    assert len(results) == len(urls), out + err
+    return results
+
+
+def test_bad_number_filter_answers_400_json(database_url):
+    results = get_json(database_url, "/api/rooms?capacity_min=abc", "/api/rooms?capacity_max=1.5",
+                       "/api/rooms?capacity_min=10")
+    for status, content_type, payload in results[:2]:
+        assert status == 400
+        assert content_type == "application/json"
+        assert "должен быть целым числом" in payload["error"]
+    assert results[2][0] == 200
+
+
+def test_room_detail_items_are_paged(database_url):
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor()
+    cur.execute("INSERT INTO rooms (name, number) VALUES ('Кабинет', '101') RETURNING id")
+    room_id = cur.fetchone()[0]
+    cur.execute("INSERT INTO items (room_id, name, inventory_number, status) "
+                "SELECT %s, 'Стул ' || lpad(n::text, 2, '0'), 'INV-' || n, 'Исправен' FROM generate_series(1, 5) n",
+                (room_id,))
+    conn.commit()
+    conn.close()
+
+    first, missing = get_json(database_url, f"/api/rooms/{room_id}?per_page=2", "/api/rooms/999999")
+    status, _, payload = first
+    assert status == 200
+    assert [item["name"] for item in payload["items"]] == ["Стул 01", "Стул 02"]
+    assert payload["prev_cursor"] is None
+    assert missing[0] == 404
+
+    names = [item["name"] for item in payload["items"]]
+    cursor = payload["next_cursor"]
+    while cursor:
+        (status, _, payload), = get_json(database_url, f"/api/rooms/{room_id}?per_page=2&after={cursor}")
+        assert status == 200
+        names += [item["name"] for item in payload["items"]]
+        cursor = payload["next_cursor"]
+    assert names == [f"Стул {n:02d}" for n in range(1, 6)]
@@ -0,0 +1,69 @@
+import json
+import socket
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from tests.conftest import app_env, run_python
+
+pytest.importorskip("uvicorn")
+pytest.importorskip("psycopg_pool")
+
+# База "упала" после старта: схема считается проверенной, а DSN никуда не ведет
+SERVER = """
+import sys
+import uvicorn
+from migrations import readiness
+
+readiness.ready = True
+uvicorn.run("asgi:app", port=int(sys.argv[1]), log_level="warning")
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get(url):
+    started = time.monotonic()
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            status, headers, body = response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        status, headers, body = e.code, e.headers, e.read()
+    return status, headers, body, time.monotonic() - started
+
+
+def test_unreachable_database_opens_breaker_on_async_routes():
+    port = free_port()
+    env = app_env("postgresql://postgres@127.0.0.1:1/postgres", DB_CONNECT_TIMEOUT="1", DB_POOL_TIMEOUT="10",
+                  DB_BREAKER_FAILURES="3", DB_BREAKER_RESET="60", QUERY_CACHE="0")
+    server = run_python(SERVER, env, port)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                assert server.poll() is None and time.monotonic() < deadline, server.stderr.read()
+                time.sleep(0.1)
+
+        results = [get(url + path) for path in ("/rooms", "/items", "/rooms/1", "/rooms", "/items")]
+        # Ни одного 500 и ни одного ожидания полного таймаута пула
+        assert [status for status, *_ in results] == [503] * 5
+        assert all(elapsed < 5 for *_, elapsed in results)
+        # После порога выключатель разомкнут: ответ сразу, с Retry-After
+        status, headers, _, elapsed = results[-1]
+        assert elapsed < 0.5 and int(headers["Retry-After"]) > 0
+
+        _, _, body, _ = get(url + "/debug")
+        assert json.loads(body)["circuit_breaker"]["state"] == "open"
+    finally:
+        server.terminate()
+        server.wait(30)
@@ -0,0 +1,93 @@
+import subprocess
+
+import psycopg2
+
+from cache import QueryCache, fresh_reads
+from tests.conftest import app_env, read_marker, run_python
+
+# Читатель: прогревает кэш списка кабинетов после подписки на NOTIFY, затем
+# по команде ждет, пока в списке появится новое название
+READER = """
+import sys, time
+import psycopg2
+import app
+from cache import NOTIFY_CHANNEL
+from db import get_database_url
+
+app.start_worker()
+while not app.readiness.ready:
+    time.sleep(0.05)
+conn = psycopg2.connect(get_database_url())
+conn.autocommit = True
+cur = conn.cursor()
+deadline = time.monotonic() + 10
+while time.monotonic() < deadline:
+    cur.execute("SELECT 1 FROM pg_stat_activity WHERE query = %s AND pid <> pg_backend_pid()",
+                (f"LISTEN {NOTIFY_CHANNEL}",))
+    if cur.fetchone():
+        break
+    time.sleep(0.05)
+client = app.app.test_client()
+assert "Старое название" in client.get("/rooms").get_data(as_text=True)
+assert app.query_cache.stats()["entries"] == 1
+print("ready", flush=True)
+sys.stdin.readline()
+deadline = time.monotonic() + 5
+while time.monotonic() < deadline:
+    if "Новое название" in client.get("/rooms").get_data(as_text=True):
+        print("fresh", flush=True)
+        break
+    time.sleep(0.05)
+else:
+    print("stale", flush=True)
+"""
+
+WRITER = """
+import sys, time
+import app
+
+app.start_worker()
+while not app.readiness.ready:
+    time.sleep(0.05)
+response = app.app.test_client().post(f"/rooms/{sys.argv[1]}/edit", data={
+    "name": "Новое название", "number": "101", "floor": "1", "teacher": "Иванова", "capacity": "30"})
+assert response.status_code == 302, response.get_data(as_text=True)
+print("written", flush=True)
+"""
+
+
+def test_write_in_one_process_is_seen_by_another(database_url):
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor()
+    cur.execute("""INSERT INTO rooms (name, number, floor, teacher, capacity)
+                   VALUES ('Старое название', '101', '1', 'Иванова', 30) RETURNING id""")
+    room_id = cur.fetchone()[0]
+    conn.commit()
+    conn.close()
+
+    # Без явной QUERY_CACHE_NOTIFY - как у gunicorn с несколькими процессами
+    env = app_env(database_url, QUERY_CACHE="1", QUERY_CACHE_TTL="600")
+    env.pop("QUERY_CACHE_NOTIFY", None)
+    reader = run_python(READER, env, stdin=subprocess.PIPE)
+    try:
+        assert read_marker(reader, ("ready",)) == "ready"
+        writer = run_python(WRITER, env, room_id)
+        out, err = writer.communicate(timeout=60)
+        assert "written" in out, err
+        reader.stdin.write("go\n")
+        reader.stdin.flush()
+        assert read_marker(reader, ("fresh", "stale")) == "fresh"
+    finally:
+        reader.kill()
+        reader.wait()
+
+
+def test_fresh_reads_bypass_cached_value():
+    cache = QueryCache()
+    cache.get_or_load("key", ("rooms",), lambda: "old")
+    token = fresh_reads.set(True)
+    try:
+        assert cache.get_or_load("key", ("rooms",), lambda: "new") == "new"
+    finally:
+        fresh_reads.reset(token)
+    assert cache.get_or_load("key", ("rooms",), lambda: "other") == "new"
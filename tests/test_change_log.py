@@ -0,0 +1,49 @@
+import psycopg2
+
+from changelog import change_log_head, compact_change_log, fetch_changes
+from db import RecordCursor
+
+
+def connect(database_url):
+    conn = psycopg2.connect(database_url, cursor_factory=RecordCursor)
+    conn.cursor().execute("SET lock_timeout = '2s'")
+    conn.commit()
+    return conn
+
+
+def test_feed_waits_for_transaction_with_lower_seq(database_url):
+    reader, first, second = (connect(database_url) for _ in range(3))
+    try:
+        cur = reader.cursor()
+        cur.execute("INSERT INTO rooms (name, number) VALUES ('Кабинет', '101'), ('Склад', '102') RETURNING id")
+        room_id, other_room_id = (row[0] for row in cur.fetchall())
+        cur.execute("INSERT INTO items (room_id, name, inventory_number, status) "
+                    "VALUES (%s, 'Стол', 'INV-1', 'Исправен') RETURNING id", (other_room_id,))
+        item_id = cur.fetchone()[0]
+        reader.commit()
+        head = change_log_head(cur)
+        reader.commit()
+
+        # Первая транзакция получает меньший seq, но фиксируется второй
+        first.cursor().execute("UPDATE rooms SET capacity = 30 WHERE id = %s", (room_id,))
+        second.cursor().execute("UPDATE items SET status = 'Ремонт' WHERE id = %s", (item_id,))
+        second.commit()
+
+        feed = fetch_changes(cur, head)
+        reader.commit()
+        assert feed["changes"] == [] and feed["next_since"] == head and feed["head"] == head
+        # Удаление по сроку хранения тоже не заходит за незавершенную транзакцию
+        compact_change_log(reader, retention=0, compact_after=0)
+        cur.execute("SELECT purged_through FROM change_log_state")
+        assert cur.fetchone()[0] <= head
+        reader.commit()
+
+        first.commit()
+        feed = fetch_changes(cur, head)
+        reader.commit()
+        assert [(change["table"], change["id"]) for change in feed["changes"]] == [
+            ("rooms", room_id), ("items", item_id)]
+        assert feed["head"] == feed["next_since"]
+    finally:
+        for conn in (reader, first, second):
+            conn.close()
@@ -0,0 +1,86 @@
+import json
+from urllib.parse import urlencode
+
+from psycopg2.extensions import parse_dsn
+
+from tests.conftest import app_env, run_python
+
+# Новые параметры подключения видны по application_name: пароль при
+# локальной (trust) аутентификации не проверяется
+RELOAD = """
+import asyncio, json, os, sys, time
+import asgi, db
+
+env_file = os.environ["DATABASE_ENV_FILE"]
+
+
+def sync_name(replica):
+    with db.db_connection(replica=replica) as conn:
+        cur = conn.cursor()
+        cur.execute("SHOW application_name")
+        name = cur.fetchone()[0]
+        cur.close()
+    return name
+
+
+async def async_name(replica):
+    async with asgi.async_db_connection(replica=replica) as conn:
+        cur = await conn.execute("SHOW application_name")
+        return (await cur.fetchone())[0]
+
+
+async def names():
+    return [await asyncio.to_thread(sync_name, False), await asyncio.to_thread(sync_name, True),
+            await async_name(False), await async_name(True)]
+
+
+async def main():
+    messages, sent = asyncio.Queue(), asyncio.Queue()
+    await messages.put({"type": "lifespan.startup"})
+    lifespan = asyncio.create_task(asgi.lifespan(messages.get, sent.put))
+    await sent.get()
+
+    before = await names()
+    held = db.get_pool().getconn()
+    # Файл подменяется целиком, как секрет в Kubernetes
+    with open(env_file + ".tmp", "w") as f:
+        f.write(sys.argv[1])
+    os.replace(env_file + ".tmp", env_file)
+    deadline = time.monotonic() + 10
+    while db.config_watcher.reloads == 0 and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.2)
+    after = await names()
+    db.get_pool().putconn(held)
+
+    await messages.put({"type": "lifespan.shutdown"})
+    await lifespan
+    print("result", json.dumps({"before": before, "after": after, "held_closed": bool(held.closed),
+                                "reloads": db.config_watcher.reloads}), flush=True)
+
+
+asyncio.run(main())
+"""
+
+
+def env_file_text(base, generation):
+    return f"DATABASE_URL={base}primary-{generation}\nDATABASE_REPLICA_URLS='{base}replica-{generation}'\n"
+
+
+def test_env_file_change_reloads_every_pool(database_url, tmp_path):
+    params = parse_dsn(database_url)
+    base = "postgresql:///?" + urlencode(params) + "&application_name="
+    env_file = tmp_path / "database.env"
+    env_file.write_text(env_file_text(base, 1))
+    env = app_env(DATABASE_ENV_FILE=str(env_file), DATABASE_ENV_CHECK_INTERVAL="0.1",
+                  QUERY_CACHE_NOTIFY="0", CHANGE_LOG_COMPACT_INTERVAL="0")
+    out, err = run_python(RELOAD, env, env_file_text(base, 2)).communicate(timeout=60)
+    results = [json.loads(line[len("result "):]) for line in out.splitlines() if line.startswith("result ")]
+    assert results, out + err
+    result, = results
+
+    assert result["before"] == ["primary-1", "replica-1", "primary-1", "replica-1"]
+    assert result["reloads"] == 1
+    assert result["after"] == ["primary-2", "replica-2", "primary-2", "replica-2"]
+    # Соединение, выданное до перечитывания, не возвращается в пул
+    assert result["held_closed"]
@@ -0,0 +1,60 @@
+import json
+import os
+
+import psycopg2
+
+from jobs import ExportJobs
+from tests.conftest import app_env, run_python
+
+
+def test_release_keeps_marker_claimed_by_another_job(tmp_path):
+    jobs = ExportJobs(str(tmp_path))
+    marker = str(tmp_path / "active-key")
+    assert jobs._claim(marker, "stale")
+    # Пока метку считали устаревшей, другой процесс снял ее и поставил свою
+    os.remove(marker)
+    assert jobs._claim(marker, "fresh")
+
+    assert not jobs._release(marker, "stale")
+    assert jobs._claimed_by(marker) == "fresh"
+    assert jobs._release(marker, "fresh")
+    assert not os.path.exists(marker)
+    assert os.listdir(tmp_path) == []
+
+
+# Задачи выполняются до конца без DATABASE_REPLICA_URLS: чтение идет с основной базы
+RUN_JOBS = """
+import json, sys, time
+from jobs import ExportJobs
+
+jobs = ExportJobs(sys.argv[1])
+submitted = [jobs.submit("items", fmt, {})[0] for fmt in ("xlsx", "csv", "ndjson")]
+deadline = time.monotonic() + 60
+while any(jobs.get(job["id"])["status"] in ("queued", "running") for job in submitted):
+    assert time.monotonic() < deadline
+    time.sleep(0.05)
+jobs.shutdown()
+print("result", json.dumps([jobs.get(job["id"]) for job in submitted]), flush=True)
+"""
+
+
+def test_jobs_run_to_completion_without_replicas(database_url, tmp_path):
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor()
+    cur.execute("INSERT INTO rooms (name, number) VALUES ('Кабинет', '101') RETURNING id")
+    cur.execute("INSERT INTO items (room_id, name, inventory_number, status) "
+                "SELECT %s, 'Стол ' || g, 'INV-' || g, 'Исправен' FROM generate_series(1, 5) g",
+                (cur.fetchone()[0],))
+    conn.commit()
+    conn.close()
+
+    env = app_env(database_url)
+    env.pop("DATABASE_REPLICA_URLS", None)
+    out, err = run_python(RUN_JOBS, env, tmp_path).communicate(timeout=120)
+    results = [line.split(" ", 1)[1] for line in out.splitlines() if line.startswith("result ")]
+    assert results, out + err
+    for job in json.loads(results[0]):
+        assert job["status"] == "done", job["error"]
+        assert job["rows"] == 5
+        assert os.path.getsize(tmp_path / f"{job['id']}.{job['format']}") == job["size"]
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("active-")]
@@ -0,0 +1,80 @@
+import json
+
+import openpyxl
+import psycopg2
+import pytest
+
+from bench.datagen import load
+from tests.conftest import app_env, run_python
+
+ITEMS = 100000
+# Потоковый экспорт 100 тысяч строк растет на ~6 МБ (в памяти остается пачка
+# серверного курсора); если прочитать все строки в список, рост уже ~56 МБ,
+# а прежняя сборка книги в памяти - в разы больше
+MAX_RSS_GROWTH_MB = 20
+
+# Экспорт через маршрут; тело ответа пишется в файл по частям, без get_data().
+# Сначала маленький экспорт: импорты и пул соединений не входят в прирост.
+# Пик RSS процесса (VmHWM) сбрасывается перед замером (clear_refs, Linux),
+# иначе пик старта приложения скрыл бы прирост экспорта. ru_maxrss не
+# подходит: clear_refs его не сбрасывает, и в нем остается RSS процесса до exec
+EXPORT = """
+import json, sys, time
+import app
+
+app.start_worker()
+while not app.readiness.ready:
+    time.sleep(0.05)
+client = app.app.test_client()
+
+
+def export(query, path):
+    response = client.get("/export-items" + query)
+    assert response.status_code == 200, response.status_code
+    with open(path, "wb") as f:
+        for chunk in response.response:
+            f.write(chunk)
+    response.close()
+
+
+def status_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+
+
+export("?inventory_number=INV-0000001", sys.argv[1])
+try:
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+except OSError:
+    print("unsupported", flush=True)
+    sys.exit()
+baseline = status_kb("VmRSS")
+export("", sys.argv[1])
+peak = status_kb("VmHWM")
+print("result", json.dumps({"rss_growth_mb": (peak - baseline) / 1024}), flush=True)
+"""
+
+
+def test_xlsx_export_memory_is_bounded(database_url, tmp_path):
+    conn = psycopg2.connect(database_url)
+    load(conn, rooms=300, items=ITEMS)
+    conn.close()
+
+    path = tmp_path / "inventory_export.xlsx"
+    env = app_env(database_url, QUERY_CACHE="0", COMPRESS="0", SLOW_QUERY_MS="100000")
+    out, err = run_python(EXPORT, env, path).communicate(timeout=300)
+    if "unsupported" in out.splitlines():
+        pytest.skip("нельзя сбросить пик RSS процесса (/proc/self/clear_refs)")
+    results = [line.split(" ", 1)[1] for line in out.splitlines() if line.startswith("result ")]
+    assert results, out + err
+    growth = json.loads(results[0])["rss_growth_mb"]
+    assert growth < MAX_RSS_GROWTH_MB, f"RSS grew by {growth:.1f} MB"
+
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        assert sum(1 for _ in workbook.active.iter_rows(values_only=True)) == ITEMS + 1
+    finally:
+        workbook.close()
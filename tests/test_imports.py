@@ -0,0 +1,118 @@
+import io
+import zipfile
+
+import openpyxl
+import psycopg2
+import pytest
+
+from imports import ImportFormatError, import_inventory, read_table
+from tests.conftest import app_env, run_python
+
+
+def xlsx_bytes():
+    workbook = openpyxl.Workbook()
+    workbook.active.append(["Инвентарный номер", "Наименование"])
+    workbook.active.append(["INV-1", "Стол"])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def zip_bytes(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def broken_sheet():
+    with zipfile.ZipFile(io.BytesIO(xlsx_bytes())) as archive:
+        files = {name: archive.read(name) for name in archive.namelist()}
+    files["xl/worksheets/sheet1.xml"] = b"<worksheet><sheetData><row>"
+    return zip_bytes(files)
+
+
+@pytest.mark.parametrize("data", [
+    "inventory_number,name\nINV-1,Стол\n".encode(),
+    b"",
+    zip_bytes({"readme.txt": "не книга"}),
+    xlsx_bytes()[:200],
+    broken_sheet(),
+], ids=["text", "empty", "zip", "truncated", "sheet"])
+def test_corrupt_xlsx_is_format_error(data):
+    with pytest.raises(ImportFormatError):
+        list(read_table(io.BytesIO(data), "items.xlsx"))
+
+
+# Файлы, поврежденные после заголовка: ошибка всплывает уже внутри COPY
+HEADER = ("inventory_number", "name", "status", "room_name", "room_number")
+ROWS = [(f"INV-{i:05d}", f"Стол {i}", "Исправен", "Кабинет", "101") for i in range(3000)]
+
+
+def truncated_sheet():
+    workbook = openpyxl.Workbook()
+    workbook.active.append(HEADER)
+    for row in ROWS:
+        workbook.active.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    with zipfile.ZipFile(buffer) as archive:
+        files = {name: archive.read(name) for name in archive.namelist()}
+    sheet = files["xl/worksheets/sheet1.xml"]
+    files["xl/worksheets/sheet1.xml"] = sheet[:len(sheet) // 2]
+    return zip_bytes(files)
+
+
+def cp1251_after_header():
+    lines = [",".join(HEADER)] + [",".join(row) for row in ROWS]
+    return "\n".join(lines).encode("utf-8") + "\nINV-99999,Шкаф,Исправен,Кабинет,101\n".encode("cp1251")
+
+
+DAMAGED_AFTER_HEADER = [
+    (truncated_sheet(), "items.xlsx", "Файл XLSX поврежден"),
+    (cp1251_after_header(), "items.csv", "Windows-1251"),
+]
+
+
+@pytest.mark.parametrize("data, filename, message", DAMAGED_AFTER_HEADER, ids=["xlsx", "csv"])
+def test_damage_after_header_is_format_error(database_url, data, filename, message):
+    conn = psycopg2.connect(database_url)
+    try:
+        with pytest.raises(ImportFormatError, match=message):
+            import_inventory(conn, read_table(io.BytesIO(data), filename))
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def test_valid_xlsx_is_read():
+    rows = list(read_table(io.BytesIO(xlsx_bytes()), "items.XLSX"))
+    assert rows == [("Инвентарный номер", "Наименование"), ("INV-1", "Стол")]
+
+
+UPLOAD = """
+import sys, time
+import app
+
+app.start_worker()
+while not app.readiness.ready:
+    time.sleep(0.05)
+with open(sys.argv[1], "rb") as f:
+    response = app.app.test_client().post("/items/import", data={"file": (f, sys.argv[2])},
+                                          content_type="multipart/form-data")
+print("status", response.status_code, flush=True)
+print(response.get_data(as_text=True), flush=True)
+"""
+
+
+@pytest.mark.parametrize("data, filename, message", [
+    (b"not a workbook", "items.xlsx", "Файл не является книгой XLSX"),
+    *DAMAGED_AFTER_HEADER,
+], ids=["not-xlsx", "xlsx-after-header", "csv-after-header"])
+def test_corrupt_upload_answers_400(database_url, tmp_path, data, filename, message):
+    path = tmp_path / filename
+    path.write_bytes(data)
+    out, err = run_python(UPLOAD, app_env(database_url), path, filename).communicate(timeout=60)
+    assert "status 400" in out.splitlines(), out + err
+    assert message in out
@@ -0,0 +1,25 @@
+import psycopg2
+
+from db import RecordCursor
+from queries import SEARCH_CANDIDATES, search_inventory
+
+
+def test_items_matching_by_name_outrank_room_matches(database_url):
+    conn = psycopg2.connect(database_url, cursor_factory=RecordCursor)
+    try:
+        cur = conn.cursor()
+        cur.execute("INSERT INTO rooms (name, number) VALUES ('Кабинет физики', '201'), ('Склад', '001') RETURNING id")
+        physics, store = (row[0] for row in cur.fetchall())
+        # Совпадений по кабинету больше, чем ранжируется, и они записаны раньше
+        cur.execute("INSERT INTO items (room_id, name, inventory_number, status) "
+                    "SELECT %s, 'Стул', 'S-' || n, 'Исправен' FROM generate_series(1, %s) n",
+                    (physics, SEARCH_CANDIDATES * 2))
+        cur.execute("INSERT INTO items (room_id, name, inventory_number, status) "
+                    "SELECT %s, 'Модель по физике', 'M-' || n, 'Исправен' FROM generate_series(1, 3) n", (store,))
+        conn.commit()
+
+        results = search_inventory(cur, "физика", limit=5)
+        assert [item.name for item in results["items"]][:3] == ["Модель по физике"] * 3
+        assert results["truncated"]
+    finally:
+        conn.close()
@@ -0,0 +1,4 @@
+# Точка входа для WSGI-сервера: gunicorn -c gunicorn.conf.py wsgi:app
+from app import app, log_startup
+
+log_startup()